@@ -2,6 +2,8 @@
 ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Served in production by ``python manage.py serve`` (uvicorn), which runs the
+lifespan hooks in scanner.lifespan around it.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from scanner.lifespan import with_lifespan  # noqa: E402 (needs the app registry)
+
+application = with_lifespan(django_application)
@@ -74,15 +74,24 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+# Served in production by python manage.py serve (see the server settings below)
+ASGI_APPLICATION = 'backend.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# WAL lets the web process read while the worker writes; IMMEDIATE
+# transactions take the write lock up front instead of failing on upgrade.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -127,6 +136,13 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are hashed while they stream in, for the content-addressed
+# storage of job PDFs (scanner.storage).
+FILE_UPLOAD_HANDLERS = [
+    'scanner.storage.HashingMemoryFileUploadHandler',
+    'scanner.storage.HashingTemporaryFileUploadHandler',
+]
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -157,3 +173,149 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
+
+# OpenAI Settings
+# Requests in flight start at OPENAI_MAX_CONCURRENCY and adapt (AIMD): +1 per
+# round of successful requests up to OPENAI_MAX_CONCURRENCY_LIMIT, multiplied
+# by OPENAI_CONCURRENCY_BACKOFF on a rate limit, never below OPENAI_MIN_CONCURRENCY.
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', 8))
+OPENAI_MIN_CONCURRENCY = int(os.getenv('OPENAI_MIN_CONCURRENCY', 1))
+OPENAI_MAX_CONCURRENCY_LIMIT = int(os.getenv('OPENAI_MAX_CONCURRENCY_LIMIT', 64))
+OPENAI_CONCURRENCY_BACKOFF = float(os.getenv('OPENAI_CONCURRENCY_BACKOFF', 0.5))
+
+# Retries of 429s, 5xx and connection errors: jittered exponential backoff in
+# seconds unless the response says how long to wait.
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 6))
+OPENAI_RETRY_BASE_DELAY = float(os.getenv('OPENAI_RETRY_BASE_DELAY', 0.5))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv('OPENAI_RETRY_MAX_DELAY', 60))
+
+# Shared OpenAI HTTP client (scanner.services.clients): pool limits and timeouts in seconds
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 100))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', 20))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', 60))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 600))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', 5))
+OPENAI_HTTP2 = os.getenv('OPENAI_HTTP2', 'false').lower() == 'true'
+
+# Models per stage. Extractions are read by EXTRACTION_MODEL first and again by
+# EXTRACTION_FALLBACK_MODEL if the output fails validation (schema, question
+# numbering, empty questions); an empty EXTRACTION_FALLBACK_MODEL turns
+# escalation off. An empty EVALUATION_VERBOSITY means 'low' for
+# EVALUATION_FORMAT=json and 'medium' for text.
+EXTRACTION_MODEL = os.getenv('EXTRACTION_MODEL', 'gpt-5-mini')
+EXTRACTION_EFFORT = os.getenv('EXTRACTION_EFFORT', 'minimal')
+EXTRACTION_VERBOSITY = os.getenv('EXTRACTION_VERBOSITY', 'low')
+EXTRACTION_FALLBACK_MODEL = os.getenv('EXTRACTION_FALLBACK_MODEL', 'gpt-5')
+EXTRACTION_FALLBACK_EFFORT = os.getenv('EXTRACTION_FALLBACK_EFFORT', 'minimal')
+EXTRACTION_FALLBACK_VERBOSITY = os.getenv('EXTRACTION_FALLBACK_VERBOSITY', 'high')
+EVALUATION_MODEL = os.getenv('EVALUATION_MODEL', 'gpt-5')
+EVALUATION_EFFORT = os.getenv('EVALUATION_EFFORT', 'medium')
+EVALUATION_VERBOSITY = os.getenv('EVALUATION_VERBOSITY', '')
+CHAT_MODEL = os.getenv('CHAT_MODEL', 'gpt-5')
+CHAT_EFFORT = os.getenv('CHAT_EFFORT', 'medium')
+CHAT_VERBOSITY = os.getenv('CHAT_VERBOSITY', 'medium')
+
+# How exam PDFs are sent: 'inline' (base64 data URL, encoded in chunks of
+# PDF_ENCODE_CHUNK_SIZE bytes), 'file' (streamed to the Files API and sent by
+# id; bounded memory, but an upload and a delete per request) or 'auto'
+# (inline up to PDF_INLINE_MAX_BYTES, the Files API above it)
+PDF_UPLOAD_MODE = os.getenv('PDF_UPLOAD_MODE', 'auto')
+PDF_INLINE_MAX_BYTES = int(os.getenv('PDF_INLINE_MAX_BYTES', 2 * 1024 * 1024))
+PDF_ENCODE_CHUNK_SIZE = int(os.getenv('PDF_ENCODE_CHUNK_SIZE', 768 * 1024))
+
+# Text-layer fast path: pages with real text are sent as text instead of PDF.
+# Page estimates are used to report the tokens and time saved per document.
+TEXT_LAYER_ENABLED = os.getenv('TEXT_LAYER_ENABLED', 'true').lower() == 'true'
+TEXT_LAYER_MIN_CHARS = int(os.getenv('TEXT_LAYER_MIN_CHARS', 40))
+TEXT_LAYER_MIN_ALNUM_RATIO = float(os.getenv('TEXT_LAYER_MIN_ALNUM_RATIO', 0.6))
+PDF_PAGE_IMAGE_TOKENS = int(os.getenv('PDF_PAGE_IMAGE_TOKENS', 1105))
+PDF_PAGE_PROCESSING_MS = int(os.getenv('PDF_PAGE_PROCESSING_MS', 300))
+
+# 'single': each PDF is extracted in one request.
+# 'chunked': PDFs with at least CHUNKED_EXTRACTION_MIN_PAGES pages are split
+# into overlapping page windows that are extracted concurrently and merged.
+EXTRACTION_MODE = os.getenv('EXTRACTION_MODE', 'chunked')
+CHUNKED_EXTRACTION_MIN_PAGES = int(os.getenv('CHUNKED_EXTRACTION_MIN_PAGES', 8))
+EXTRACTION_CHUNK_PAGES = int(os.getenv('EXTRACTION_CHUNK_PAGES', 4))
+EXTRACTION_CHUNK_OVERLAP = int(os.getenv('EXTRACTION_CHUNK_OVERLAP', 1))
+
+# 'batch': one evaluation request for the whole class (supports chat follow-ups)
+# 'per_student': one streamed request per student, run concurrently
+EVALUATION_MODE = os.getenv('EVALUATION_MODE', 'batch')
+
+# 'text': the model writes the Turkish report, averages included.
+# 'json': the model returns per-question scores in a strict schema; averages,
+# class statistics and the Turkish report are produced by scanner.services.scores.
+EVALUATION_FORMAT = os.getenv('EVALUATION_FORMAT', 'text')
+
+# Grading jobs (python manage.py run_worker): intervals in seconds
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', 2))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+JOB_EVENT_POLL_INTERVAL = float(os.getenv('JOB_EVENT_POLL_INTERVAL', 0.25))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', 10))
+JOB_STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', 60))
+# Text deltas are joined for up to JOB_EVENT_COALESCE_WINDOW seconds or
+# JOB_EVENT_COALESCE_MAX_CHARS characters before they are stored as events
+JOB_EVENT_COALESCE_WINDOW = float(os.getenv('JOB_EVENT_COALESCE_WINDOW', 0.1))
+JOB_EVENT_COALESCE_MAX_CHARS = int(os.getenv('JOB_EVENT_COALESCE_MAX_CHARS', 4096))
+
+# Server-sent events (scanner.sse): text deltas are coalesced for up to
+# SSE_COALESCE_WINDOW seconds or SSE_COALESCE_MAX_BYTES characters; a keepalive
+# comment is sent after SSE_HEARTBEAT_INTERVAL seconds without events. 'debug'
+# events are only sent with SSE_DEBUG_EVENTS.
+SSE_COALESCE_WINDOW = float(os.getenv('SSE_COALESCE_WINDOW', 0.05))
+SSE_COALESCE_MAX_BYTES = int(os.getenv('SSE_COALESCE_MAX_BYTES', 4096))
+SSE_HEARTBEAT_INTERVAL = float(os.getenv('SSE_HEARTBEAT_INTERVAL', 15))
+SSE_DEBUG_EVENTS = os.getenv('SSE_DEBUG_EVENTS', 'false').lower() == 'true'
+
+# Extraction cache (Scan model): LRU size limit and TTL in seconds
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv('EXTRACTION_CACHE_MAX_ENTRIES', 5000))
+EXTRACTION_CACHE_TTL = int(os.getenv('EXTRACTION_CACHE_TTL', 30 * 24 * 60 * 60))
+
+# Answer-level score cache (AnswerScore model, EVALUATION_FORMAT=json only):
+# LRU size limit and TTL in seconds
+SCORE_CACHE_MAX_ENTRIES = int(os.getenv('SCORE_CACHE_MAX_ENTRIES', 50000))
+SCORE_CACHE_TTL = int(os.getenv('SCORE_CACHE_TTL', 30 * 24 * 60 * 60))
+
+# Local scoring before the model (EVALUATION_FORMAT=json only): blank answers
+# get 0 and answers at least this similar to the answer key get 10
+PRESCORE_LOCAL = os.getenv('PRESCORE_LOCAL', 'true').lower() == 'true'
+PRESCORE_EXACT_THRESHOLD = float(os.getenv('PRESCORE_EXACT_THRESHOLD', 0.9))
+
+# Offline bulk grading (python manage.py grade_batch): requests per submitted
+# batch, seconds between status checks and the Batch API completion window
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 500))
+BATCH_POLL_INTERVAL = float(os.getenv('BATCH_POLL_INTERVAL', 30))
+BATCH_COMPLETION_WINDOW = os.getenv('BATCH_COMPLETION_WINDOW', '24h')
+
+# Stored PDFs (python manage.py gc_blobs): files nothing refers to are removed
+# once they have been unused for BLOB_GC_GRACE seconds
+BLOB_GC_GRACE = int(os.getenv('BLOB_GC_GRACE', 60 * 60))
+
+# Production server (python manage.py serve): uvicorn with SERVER_WORKERS
+# processes. Each process holds at most SERVER_LIMIT_CONCURRENCY open
+# connections, SSE streams included, and answers 503 beyond that.
+# SERVER_KEEPALIVE_TIMEOUT should be longer than the proxy's idle timeout;
+# open SSE streams are cut SERVER_GRACEFUL_SHUTDOWN seconds into a shutdown
+# and clients reconnect with Last-Event-ID.
+SERVER_HOST = os.getenv('SERVER_HOST', '127.0.0.1')
+SERVER_PORT = int(os.getenv('SERVER_PORT', 8000))
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', os.cpu_count() or 1))
+SERVER_LIMIT_CONCURRENCY = int(os.getenv('SERVER_LIMIT_CONCURRENCY', 1000))
+SERVER_BACKLOG = int(os.getenv('SERVER_BACKLOG', 2048))
+SERVER_KEEPALIVE_TIMEOUT = int(os.getenv('SERVER_KEEPALIVE_TIMEOUT', 75))
+SERVER_GRACEFUL_SHUTDOWN = int(os.getenv('SERVER_GRACEFUL_SHUTDOWN', 10))
+SERVER_FORWARDED_ALLOW_IPS = os.getenv('SERVER_FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+# History API (scanner.results): default and largest page size
+RESULTS_PAGE_SIZE = int(os.getenv('RESULTS_PAGE_SIZE', 50))
+RESULTS_MAX_PAGE_SIZE = int(os.getenv('RESULTS_MAX_PAGE_SIZE', 200))
+
+# Follow-up chat (scanner.conversations): at most CHAT_MAX_STUDENTS full student
+# records per turn (more, or none named, sends the class scores only), the last
+# CHAT_RECENT_TURNS turns verbatim and older turns condensed into a summary of
+# at most CHAT_SUMMARY_MAX_CHARS characters.
+CHAT_MAX_STUDENTS = int(os.getenv('CHAT_MAX_STUDENTS', 5))
+CHAT_RECENT_TURNS = int(os.getenv('CHAT_RECENT_TURNS', 2))
+CHAT_SUMMARY_MAX_CHARS = int(os.getenv('CHAT_SUMMARY_MAX_CHARS', 2000))
+CHAT_TURN_SUMMARY_CHARS = int(os.getenv('CHAT_TURN_SUMMARY_CHARS', 300))
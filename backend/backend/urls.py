@@ -18,10 +18,12 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from scanner.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/scans/', include('scanner.urls')),
+    path('metrics', metrics, name='metrics'),
 ]
 
 
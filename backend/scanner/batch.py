@@ -0,0 +1,388 @@
+"""
+Offline bulk grading through Batch API style JSONL submissions (manage.py grade_batch).
+
+Every request gets a stable custom_id derived from the content it is about,
+so a resumed run can tell finished work from unfinished work. Progress lives
+in the output directory:
+
+- ``checkpoint.json``: submitted batches and PDFs uploaded for them
+- ``extractions.jsonl``: one line per extracted answer key or exam
+- ``results.jsonl``: one line per evaluated exam
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+
+from .services.cache import EXTRACTION_VERSIONS, ExtractionCache
+from .services.openai import (
+    ANSWER_KEY_SCHEMA,
+    STUDENT_EXAM_SCHEMA,
+    answer_key_request,
+    evaluation_request,
+    student_exam_request,
+)
+from .services.pdf import document_plan
+from .services.retries import call_with_retries
+from .services.scores import parse_evaluation, render_evaluation
+from .services.validation import conforms
+
+logger = logging.getLogger(__name__)
+
+FINISHED_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+EXTRACTION_SCHEMAS = {"answer_key": ANSWER_KEY_SCHEMA, "student_exam": STUDENT_EXAM_SCHEMA}
+
+
+def is_answer_key(path: Path) -> bool:
+    return "Cevap Anahtarı" in path.name or "answer" in path.name.lower()
+
+
+@dataclass
+class Document:
+    path: Path
+    kind: str
+    content_hash: str
+
+    @property
+    def custom_id(self) -> str:
+        return f"{self.kind}-{self.content_hash[:40]}"
+
+
+@dataclass
+class ExamGroup:
+    """One folder: an answer key and the student exams graded against it."""
+
+    folder: Path
+    answer_key: Document
+    exams: list[Document] = field(default_factory=list)
+
+
+def evaluation_id(answer_key: Document, exam: Document) -> str:
+    digest = hashlib.sha256(f"{answer_key.content_hash}:{exam.content_hash}".encode()).hexdigest()
+    return f"evaluation-{digest[:40]}"
+
+
+def hash_path(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def discover(root: Path) -> tuple[list[ExamGroup], list[Path]]:
+    """Find every folder under ``root`` with an answer key; also return folders with PDFs but no key."""
+    groups, skipped = [], []
+    folders = sorted({path.parent for path in root.rglob("*.pdf")})
+    for folder in folders:
+        pdfs = sorted(folder.glob("*.pdf"))
+        keys = [path for path in pdfs if is_answer_key(path)]
+        if len(keys) != 1:
+            skipped.append(folder)
+            continue
+        group = ExamGroup(folder, Document(keys[0], "answer_key", hash_path(keys[0])))
+        group.exams = [Document(path, "student_exam", hash_path(path)) for path in pdfs if path != keys[0]]
+        groups.append(group)
+    return groups, skipped
+
+
+def output_text(body: dict) -> str:
+    """The text of a Responses API body, which has no output_text field of its own."""
+    return "".join(
+        part.get("text", "")
+        for item in body.get("output", [])
+        if item.get("type") == "message"
+        for part in item.get("content", [])
+        if part.get("type") == "output_text"
+    )
+
+
+def batch_body(request: dict) -> dict:
+    # Batch requests cannot stream.
+    return {key: value for key, value in request.items() if key not in ("stream", "include")}
+
+
+def read_jsonl(path: Path) -> list[dict]:
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def append_jsonl(path: Path, rows: list[dict]):
+    with open(path, "a", encoding="utf-8") as file:
+        for row in rows:
+            file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+
+
+class Checkpoint:
+    def __init__(self, path: Path):
+        self.path = path
+        state = json.loads(path.read_text()) if path.exists() else {}
+        self.batches = state.get("batches", {})
+        self.uploads = state.get("uploads", {})
+
+    def save(self):
+        temporary = self.path.with_suffix(".tmp")
+        temporary.write_text(json.dumps({"batches": self.batches, "uploads": self.uploads}, indent=2))
+        os.replace(temporary, self.path)
+
+
+class OpenAIBatchBackend:
+    """Submits JSONL files to the OpenAI Batch API and waits for their output."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def submit(self, lines: list[dict]) -> str:
+        payload = "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode()
+        input_file = await call_with_retries(
+            lambda: self.client.files.create(file=("batch.jsonl", io.BytesIO(payload)), purpose="batch")
+        )
+        batch = await call_with_retries(
+            lambda: self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/responses",
+                completion_window=settings.BATCH_COMPLETION_WINDOW,
+            )
+        )
+        return batch.id
+
+    async def wait(self, batch_id: str) -> list[dict]:
+        while True:
+            batch = await call_with_retries(lambda: self.client.batches.retrieve(batch_id))
+            if batch.status in FINISHED_BATCH_STATUSES:
+                break
+            await asyncio.sleep(settings.BATCH_POLL_INTERVAL)
+
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = await call_with_retries(lambda: self.client.files.content(file_id))
+                lines += [json.loads(line) for line in content.text.splitlines() if line.strip()]
+        return lines
+
+
+class LocalBatchBackend:
+    """
+    Stand-in for the Batch API: runs the JSONL requests directly against the
+    Responses API and writes output lines in the Batch API format.
+
+    Output lines are appended as requests finish, so waiting on an
+    interrupted batch only sends the requests that have no output yet.
+    """
+
+    def __init__(self, client, directory: Path):
+        self.client = client
+        self.directory = directory / "batches"
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    async def submit(self, lines: list[dict]) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex}"
+        append_jsonl(self.directory / f"{batch_id}.input.jsonl", lines)
+        return batch_id
+
+    async def wait(self, batch_id: str) -> list[dict]:
+        output_path = self.directory / f"{batch_id}.output.jsonl"
+        finished = {line["custom_id"] for line in read_jsonl(output_path)}
+        pending = [
+            line for line in read_jsonl(self.directory / f"{batch_id}.input.jsonl")
+            if line["custom_id"] not in finished
+        ]
+        await asyncio.gather(*(self.run(line, output_path) for line in pending))
+        return read_jsonl(output_path)
+
+    async def run(self, line: dict, output_path: Path):
+        output = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": line["custom_id"], "response": None, "error": None}
+        try:
+            response = await call_with_retries(lambda: self.client.responses.create(**line["body"]))
+            output["response"] = {"status_code": 200, "body": response.model_dump(mode="json")}
+        except Exception as e:
+            output["error"] = {"code": type(e).__name__, "message": str(e)}
+        append_jsonl(output_path, [output])
+
+
+class BatchGrader:
+    def __init__(self, backend, client, output: Path, batch_size: int | None = None, log=logger.info):
+        self.backend = backend
+        self.client = client
+        self.output = output
+        self.batch_size = batch_size or settings.BATCH_MAX_REQUESTS
+        self.log = log
+        self.checkpoint = Checkpoint(output / "checkpoint.json")
+        self.extractions_path = output / "extractions.jsonl"
+        self.results_path = output / "results.jsonl"
+        self.extractions = {row["custom_id"]: row["result"] for row in read_jsonl(self.extractions_path)}
+        self.evaluated = {row["custom_id"] for row in read_jsonl(self.results_path)}
+        self.failures = {}
+        self.groups = []
+
+    async def run(self, groups: list[ExamGroup]):
+        self.groups = groups
+        # Batches submitted before an interruption are collected, not sent again.
+        await self.finish_batches()
+
+        documents = {}
+        for group in groups:
+            for document in [group.answer_key, *group.exams]:
+                documents.setdefault(document.custom_id, document)
+        await self.reuse_cached_extractions(documents.values())
+        pending = [document for custom_id, document in documents.items() if custom_id not in self.extractions]
+        self.log(f"Extraction: {len(documents) - len(pending)} done, {len(pending)} to submit")
+        await self.submit_all("extraction", [await self.extraction_line(document) for document in pending])
+
+        pending = [
+            (group, exam)
+            for group in groups
+            if group.answer_key.custom_id in self.extractions
+            for exam in group.exams
+            if exam.custom_id in self.extractions and evaluation_id(group.answer_key, exam) not in self.evaluated
+        ]
+        self.log(f"Evaluation: {len(self.evaluated)} done, {len(pending)} to submit")
+        await self.submit_all("evaluation", [self.evaluation_line(group, exam) for group, exam in pending])
+        return self.failures
+
+    async def reuse_cached_extractions(self, documents):
+        cache = ExtractionCache()
+        rows = []
+        for document in documents:
+            if document.custom_id in self.extractions:
+                continue
+            result = await cache.get(document.content_hash, document.kind, EXTRACTION_VERSIONS[document.kind])
+            if result is not None:
+                self.extractions[document.custom_id] = result
+                rows.append({"custom_id": document.custom_id, "path": str(document.path), "result": result})
+        append_jsonl(self.extractions_path, rows)
+
+    async def extraction_line(self, document: Document) -> dict:
+        with open(document.path, "rb") as file:
+            text_part, attachment, _ = await asyncio.to_thread(document_plan, file)
+            parts = [text_part] if text_part else []
+            if attachment is not None:
+                parts.append({"type": "input_file", "file_id": await self.upload(document, attachment)})
+        build = answer_key_request if document.kind == "answer_key" else student_exam_request
+        return {"custom_id": document.custom_id, "method": "POST", "url": "/v1/responses", "body": batch_body(build(parts))}
+
+    async def upload(self, document: Document, attachment) -> str:
+        """Upload the pages to attach once; the id is kept until the extraction is stored."""
+        if document.custom_id not in self.checkpoint.uploads:
+            attachment.seek(0)
+            uploaded = await call_with_retries(
+                lambda: self.client.files.create(
+                    file=(document.path.name, attachment, "application/pdf"), purpose="user_data"
+                )
+            )
+            self.checkpoint.uploads[document.custom_id] = uploaded.id
+            self.checkpoint.save()
+        return self.checkpoint.uploads[document.custom_id]
+
+    def evaluation_line(self, group: ExamGroup, exam: Document) -> dict:
+        request = evaluation_request([self.extractions[exam.custom_id]], self.extractions[group.answer_key.custom_id])
+        return {
+            "custom_id": evaluation_id(group.answer_key, exam),
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": batch_body(request),
+        }
+
+    async def submit_all(self, phase: str, lines: list[dict]):
+        for start in range(0, len(lines), self.batch_size):
+            chunk = lines[start:start + self.batch_size]
+            batch_id = await self.backend.submit(chunk)
+            self.checkpoint.batches[batch_id] = {"phase": phase, "requests": len(chunk), "done": False}
+            self.checkpoint.save()
+            self.log(f"Submitted {phase} batch {batch_id} ({len(chunk)} requests)")
+        await self.finish_batches()
+
+    async def finish_batches(self):
+        pending = [batch_id for batch_id, batch in self.checkpoint.batches.items() if not batch["done"]]
+        await asyncio.gather(*(self.finish_batch(batch_id) for batch_id in pending))
+
+    async def finish_batch(self, batch_id: str):
+        batch = self.checkpoint.batches[batch_id]
+        lines = await self.backend.wait(batch_id)
+        succeeded = {}
+        for line in lines:
+            response = line.get("response") or {}
+            if response.get("status_code") == 200:
+                succeeded[line["custom_id"]] = output_text(response["body"])
+            else:
+                self.failures[line["custom_id"]] = line.get("error") or response.get("body")
+
+        if batch["phase"] == "extraction":
+            await self.store_extractions(succeeded)
+        else:
+            self.store_evaluations(succeeded)
+        batch["done"] = True
+        self.checkpoint.save()
+        self.log(f"Finished {batch['phase']} batch {batch_id}: {len(succeeded)}/{batch['requests']} succeeded")
+
+    async def store_extractions(self, outputs: dict[str, str]):
+        documents = {
+            document.custom_id: document
+            for group in self.groups
+            for document in [group.answer_key, *group.exams]
+        }
+        cache = ExtractionCache()
+        rows = []
+        for custom_id, text in outputs.items():
+            if custom_id in self.extractions:
+                continue
+            kind = custom_id.split("-", 1)[0]
+            try:
+                result = json.loads(text)
+            except ValueError as e:
+                # Left out of the extractions, so the next run submits it again.
+                self.failures[custom_id] = f"Invalid output: {e}"
+                continue
+            if not conforms(result, EXTRACTION_SCHEMAS[kind]["schema"]):
+                self.failures[custom_id] = "Output does not match the schema"
+                continue
+            self.extractions[custom_id] = result
+            document = documents.get(custom_id)
+            rows.append({"custom_id": custom_id, "path": str(document.path if document else None), "result": result})
+            if document is not None:
+                await cache.put(
+                    document.content_hash, kind, EXTRACTION_VERSIONS[kind], filename=document.path.name, result=result
+                )
+        append_jsonl(self.extractions_path, rows)
+
+        for custom_id in outputs:
+            file_id = self.checkpoint.uploads.pop(custom_id, None)
+            if file_id:
+                await call_with_retries(lambda: self.client.files.delete(file_id))
+
+    def store_evaluations(self, outputs: dict[str, str]):
+        rows = []
+        for group in self.groups:
+            for exam in group.exams:
+                custom_id = evaluation_id(group.answer_key, exam)
+                if custom_id in outputs and custom_id not in self.evaluated:
+                    row = {
+                        "custom_id": custom_id,
+                        "folder": str(group.folder),
+                        "answer_key": group.answer_key.path.name,
+                        "exam": exam.path.name,
+                        "student_name": self.extractions[exam.custom_id].get("student_name"),
+                        "evaluation": outputs[custom_id],
+                    }
+                    if settings.EVALUATION_FORMAT == "json":
+                        try:
+                            row["scores"] = parse_evaluation(outputs[custom_id])[0]
+                        except (ValueError, KeyError, TypeError, IndexError) as e:
+                            self.failures[custom_id] = f"Invalid output: {e!r}"
+                            continue
+                        row["evaluation"] = render_evaluation([row["scores"]])
+                    self.evaluated.add(custom_id)
+                    rows.append(row)
+        append_jsonl(self.results_path, rows)
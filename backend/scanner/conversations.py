@@ -0,0 +1,189 @@
+"""
+Follow-up questions about a graded job with bounded context.
+
+Instead of chaining ``previous_response_id`` (which re-sends the whole
+class every turn), the graded results are stored as one compact record per
+student. Each turn sends the answer key, the records the question is about
+(by student name or question number), the last few turns and a rolling
+summary of the older ones.
+"""
+import re
+
+from django.conf import settings
+
+from .models import Conversation, Stage
+from .services.scores import render_student
+
+QUESTION_NUMBER = re.compile(r"(?:soru|question)\s*(\d+)|(\d+)\s*\.?\s*(?:soru|question)", re.IGNORECASE)
+QUESTION_SCORE = re.compile(r"^Soru (\d+): \d+ üzerinden (\d+(?:[.,]\d+)?)[^\n]*\n+([^\n]*)", re.MULTILINE)
+AVERAGE = re.compile(r"Genel Ortalama:\s*(\d+(?:[.,]\d+)?)")
+STUDENT_SPLIT = re.compile(r"\n\s*-{3,}\s*\n")
+CLASS_WORDS = ("sınıf", "herkes", "tüm", "bütün", "öğrenciler", "class", "everyone", "all students")
+
+
+def fold(text: str) -> str:
+    """Case-fold Turkish text: "İ" -> "i" and "I" -> "ı" before the usual folding."""
+    return text.replace("İ", "i").replace("I", "ı").casefold()
+
+
+def number(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+def parse_report(text: str) -> dict:
+    """Per-question scores, average and summary report from a rendered or model-written evaluation."""
+    questions = {
+        question: {"score": number(score), "rationale": rationale.strip()}
+        for question, score, rationale in QUESTION_SCORE.findall(text)
+    }
+    average = AVERAGE.search(text)
+    report = text[text.index("Özet Rapor:"):].strip() if "Özet Rapor:" in text else ""
+    return {"questions": questions, "average": number(average.group(1)) if average else None, "report": report}
+
+
+def split_class_evaluation(text: str, names: list[str]) -> list[str | None]:
+    """Split a whole-class evaluation into one part per student, matched by name or else by order."""
+    parts = [part.strip() for part in STUDENT_SPLIT.split(text) if part.strip()]
+    by_student = [None] * len(names)
+    for part in parts:
+        heading = fold(part.split("\n", 1)[0])
+        for index, name in enumerate(names):
+            if by_student[index] is None and name and fold(name) in heading:
+                by_student[index] = part
+                break
+    if all(part is None for part in by_student) and len(parts) == len(names):
+        return parts
+    return by_student
+
+
+def student_record(index: int, student_answer: dict, evaluation: str | None) -> dict:
+    report = parse_report(evaluation or "")
+    questions = {}
+    for question in student_answer.get("questions", []):
+        number_key = str(question["question_number"])
+        questions[number_key] = {"answer": question["student_answer"], **report["questions"].get(number_key, {})}
+    return {
+        "student": index,
+        "name": student_answer.get("student_name") or f"Öğrenci {index + 1}",
+        "questions": questions,
+        "average": report["average"],
+        "report": report["report"],
+    }
+
+
+def build_records(student_answers: list[dict], evaluations: list[str | None]) -> list[dict]:
+    return [
+        student_record(index, student_answer, evaluation)
+        for index, (student_answer, evaluation) in enumerate(zip(student_answers, evaluations))
+    ]
+
+
+async def save_conversation(job) -> Conversation:
+    """Store the compact results of a finished job for follow-up questions."""
+    stages = {(stage.name, stage.student): stage.result async for stage in job.stages.filter(status=Stage.COMPLETED)}
+    answer_key = stages[(Stage.ANSWER_KEY, None)]["data"]
+    students = sorted(student for name, student in stages if name == Stage.STUDENT_EXAM)
+    student_answers = [stages[(Stage.STUDENT_EXAM, student)]["data"] for student in students]
+
+    if (class_result := stages.get((Stage.EVALUATION, None))) and "full_text" in class_result:
+        if class_result.get("evaluations"):
+            evaluations = [render_student(student) for student in class_result["evaluations"]]
+        else:
+            evaluations = split_class_evaluation(
+                class_result["full_text"], [answer.get("student_name") or "" for answer in student_answers]
+            )
+    else:
+        evaluations = [(stages.get((Stage.EVALUATION, student)) or {}).get("full_text") for student in students]
+
+    conversation, _ = await Conversation.objects.aupdate_or_create(
+        job=job,
+        defaults={"answer_key": answer_key, "records": build_records(student_answers, evaluations)},
+    )
+    return conversation
+
+
+def mentioned_students(records: list[dict], message: str) -> list[int]:
+    text = fold(message)
+    full_names = [record["student"] for record in records if fold(record["name"]) in text]
+    if full_names:
+        return full_names
+    # First names or surnames, allowing Turkish suffixes ("Ayşe'nin", "Ayşenin").
+    return [
+        record["student"]
+        for record in records
+        if any(
+            len(part) >= 3 and re.search(r"(?<!\w)" + re.escape(part), text)
+            for part in fold(record["name"]).split()
+        )
+    ]
+
+
+def mentioned_questions(message: str) -> list[str]:
+    return sorted({first or second for first, second in QUESTION_NUMBER.findall(message)}, key=int)
+
+
+def overview(records: list[dict]) -> list[dict]:
+    """Scores only, for questions about the whole class."""
+    return [
+        {
+            "name": record["name"],
+            "average": record["average"],
+            "scores": {number: question.get("score") for number, question in record["questions"].items()},
+        }
+        for record in records
+    ]
+
+
+def select_context(conversation: Conversation, message: str) -> tuple[dict, dict]:
+    """The records ``message`` is about, and the focus to remember for the next turn."""
+    records = conversation.records
+    students = mentioned_students(records, message)
+    questions = mentioned_questions(message)
+    about_class = any(word in fold(message) for word in CLASS_WORDS)
+    if not students and not about_class:
+        # A follow-up like "peki 3. soru?" is about the students of the previous turn.
+        students = conversation.focus.get("students", [])
+
+    if not students or len(students) > settings.CHAT_MAX_STUDENTS:
+        context = {"class": overview(records)}
+        students = []
+    else:
+        selected = []
+        for record in records:
+            if record["student"] in students:
+                if questions:
+                    record = {
+                        **record,
+                        "questions": {number: record["questions"][number] for number in questions if number in record["questions"]},
+                    }
+                selected.append(record)
+        context = {"students": selected}
+    if questions:
+        context["answer_key"] = [
+            question for question in conversation.answer_key.get("questions", [])
+            if str(question["question_number"]) in questions
+        ]
+    return context, {"students": students, "questions": questions}
+
+
+def condense(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+async def record_turn(conversation: Conversation, message: str, answer: str, focus: dict):
+    """Keep the last CHAT_RECENT_TURNS turns verbatim and fold older ones into the summary."""
+    turns = conversation.turns + [{"question": message, "answer": answer}]
+    summary = conversation.summary.splitlines()
+    while len(turns) > settings.CHAT_RECENT_TURNS:
+        turn = turns.pop(0)
+        summary.append(
+            f"- Soru: {condense(turn['question'], 200)} → Cevap: {condense(turn['answer'], settings.CHAT_TURN_SUMMARY_CHARS)}"
+        )
+    while summary and len("\n".join(summary)) > settings.CHAT_SUMMARY_MAX_CHARS:
+        summary.pop(0)
+
+    conversation.turns = turns
+    conversation.summary = "\n".join(summary)
+    conversation.focus = focus
+    await conversation.asave(update_fields=["turns", "summary", "focus", "updated_at"])
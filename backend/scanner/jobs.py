@@ -0,0 +1,329 @@
+import asyncio
+import contextvars
+import logging
+import weakref
+from datetime import timedelta
+
+from asgiref.sync import SyncToAsync, sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .conversations import save_conversation
+from .metrics import JobMetrics
+from .models import Job, JobEvent, Stage
+from .pipeline import grade_exams
+from .results import save_results
+from .sse import DELTA_EVENTS
+
+logger = logging.getLogger(__name__)
+
+# Events that mark a stage as finished, and the stage they finish.
+STAGE_EVENTS = {
+    'answer_key_complete': Stage.ANSWER_KEY,
+    'student_reading_complete': Stage.STUDENT_EXAM,
+    'student_evaluation_complete': Stage.EVALUATION,
+    'evaluation_complete': Stage.EVALUATION,
+}
+
+TERMINAL_EVENTS = {'done', 'error'}
+
+# Partial output of a stage, stale once an attempt stops before the stage is finished.
+PROGRESS_EVENTS = ('evaluation_chunk', 'question_extracted')
+
+
+def event_stage(event_type: str, data: dict) -> tuple | None:
+    if event_type == 'evaluation_complete':
+        return (Stage.EVALUATION, None)
+    if event_type in STAGE_EVENTS:
+        return (STAGE_EVENTS[event_type], data.get('student'))
+    if event_type == 'evaluation_chunk':
+        return (Stage.EVALUATION, data.get('student'))
+    if event_type == 'question_extracted':
+        return (data['document'], data.get('student'))
+    return None
+
+
+def create_job(answer_key_file, student_exams: list) -> Job:
+    with transaction.atomic():
+        job = Job.objects.create()
+        Stage.objects.create(
+            job=job, name=Stage.ANSWER_KEY, filename=answer_key_file.name, file=answer_key_file
+        )
+        for index, exam in enumerate(student_exams):
+            Stage.objects.create(
+                job=job, name=Stage.STUDENT_EXAM, student=index, filename=exam.name, file=exam
+            )
+    return job
+
+
+def claim_job() -> Job | None:
+    """Take the oldest pending job, or a running one whose worker stopped sending heartbeats."""
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.JOB_STALE_AFTER)
+    candidates = Job.objects.filter(
+        Q(status=Job.PENDING) | Q(status=Job.RUNNING, heartbeat_at__lt=stale)
+    ).order_by('created_at')
+
+    for job in candidates[:10]:
+        claimed = Job.objects.filter(
+            pk=job.pk, status=job.status, heartbeat_at=job.heartbeat_at
+        ).update(status=Job.RUNNING, heartbeat_at=now, attempts=F('attempts') + 1)
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+async def record_event(job: Job, event_type: str, data: dict) -> JobEvent:
+    return await JobEvent.objects.acreate(job=job, event=event_type, data=data)
+
+
+async def reset_unfinished_stages(job: Job, completed: dict) -> list[tuple]:
+    """
+    Delete the partial output an earlier attempt stored for stages it did not
+    finish, since the new attempt streams them again from the start.
+    """
+    stale, stages = [], set()
+    async for event in JobEvent.objects.filter(job=job, event__in=PROGRESS_EVENTS).only('id', 'event', 'data'):
+        stage = event_stage(event.event, event.data)
+        if stage not in completed:
+            stale.append(event.pk)
+            stages.add(stage)
+    if stale:
+        await JobEvent.objects.filter(pk__in=stale).adelete()
+    return sorted(stages, key=lambda stage: (stage[0], -1 if stage[1] is None else stage[1]))
+
+
+async def coalesce_deltas(events, window: float | None = None, max_chars: int | None = None):
+    """
+    Join the text deltas of (event_type, data) pairs per event type and
+    student for up to ``window`` seconds or ``max_chars`` characters, so a
+    streamed evaluation is stored as a few hundred events, not one per token.
+    """
+    window = settings.JOB_EVENT_COALESCE_WINDOW if window is None else window
+    max_chars = settings.JOB_EVENT_COALESCE_MAX_CHARS if max_chars is None else max_chars
+    loop = asyncio.get_running_loop()
+    iterator = aiter(events)
+    next_event = None
+    deltas, size, deadline = {}, 0, None
+
+    def flush():
+        nonlocal deltas, size, deadline
+        flushed = [(event_type, {**data, 'delta': ''.join(parts)}) for (event_type, _), (data, parts) in deltas.items()]
+        deltas, size, deadline = {}, 0, None
+        return flushed
+
+    try:
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(anext(iterator))
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            done, _ = await asyncio.wait({next_event}, timeout=timeout)
+            if not done:
+                for event in flush():
+                    yield event
+                continue
+            event, next_event = next_event, None
+            try:
+                event_type, data = event.result()
+            except StopAsyncIteration:
+                break
+            if event_type not in DELTA_EVENTS:
+                for pending in flush():
+                    yield pending
+                yield event_type, data
+                continue
+            if deadline is None:
+                deadline = loop.time() + window
+            deltas.setdefault((event_type, data.get('student')), (data, []))[1].append(data.get('delta', ''))
+            size += len(data.get('delta', ''))
+            if size >= max_chars:
+                for pending in flush():
+                    yield pending
+        for pending in flush():
+            yield pending
+    finally:
+        if next_event is not None:
+            next_event.cancel()
+
+
+async def send_heartbeats(job: Job):
+    while True:
+        await asyncio.sleep(settings.JOB_HEARTBEAT_INTERVAL)
+        await Job.objects.filter(pk=job.pk).aupdate(heartbeat_at=timezone.now())
+
+
+async def run_job(job: Job):
+    stages = [stage async for stage in job.stages.all()]
+    completed = {
+        (stage.name, stage.student): stage.result
+        for stage in stages
+        if stage.status == Stage.COMPLETED
+    }
+    answer_key_stage = next(stage for stage in stages if stage.name == Stage.ANSWER_KEY)
+    exam_stages = sorted(
+        (stage for stage in stages if stage.name == Stage.STUDENT_EXAM),
+        key=lambda stage: stage.student,
+    )
+    files = [answer_key_stage.file] + [stage.file for stage in exam_stages]
+
+    metrics = JobMetrics()
+    heartbeat = asyncio.create_task(send_heartbeats(job))
+    try:
+        for file in files:
+            await sync_to_async(file.open)('rb')
+
+        if job.attempts > 1:
+            if reset := await reset_unfinished_stages(job, completed):
+                await record_event(job, 'stage_reset', {
+                    'message': 'Yarım kalan aşamalar baştan çalıştırılıyor',
+                    'stages': [{'stage': name, 'student': student} for name, student in reset],
+                })
+            await record_event(job, 'status', {'stage': 'resume', 'message': 'İş kaldığı yerden devam ediyor...'})
+
+        async for event_type, data in coalesce_deltas(grade_exams(
+            answer_key_stage.file, [stage.file for stage in exam_stages], completed, metrics
+        )):
+            stage = event_stage(event_type, data)
+            if stage in completed:
+                continue
+            await record_event(job, event_type, data)
+            if event_type in STAGE_EVENTS:
+                await Stage.objects.aupdate_or_create(
+                    job=job,
+                    name=stage[0],
+                    student=stage[1],
+                    defaults={'status': Stage.COMPLETED, 'result': data, 'completed_at': timezone.now()},
+                )
+
+        conversation = await save_conversation(job)
+        await save_results(job, conversation)
+        await record_event(job, 'conversation', {'conversation_id': conversation.pk})
+        await record_event(job, 'done', {'message': 'Tüm işlemler tamamlandı'})
+        job.status = Job.COMPLETED
+        job.error = ''
+    except Exception as e:
+        await record_event(job, 'error', {'message': f'Hata: {str(e)}'})
+        job.status = Job.FAILED
+        job.error = str(e)
+    finally:
+        heartbeat.cancel()
+        for file in files:
+            file.close()
+
+    await metrics.save(job)
+    job.heartbeat_at = timezone.now()
+    await job.asave(update_fields=['status', 'error', 'heartbeat_at', 'updated_at'])
+
+
+class JobEventHub:
+    """
+    Reads new job events once per JOB_EVENT_POLL_INTERVAL for every stream
+    open on an event loop, instead of one query per stream, and hands each
+    event to the streams following its job.
+    """
+
+    def __init__(self):
+        self.queues: dict[int, set[asyncio.Queue]] = {}
+        self.cursor: int | None = None
+        self.task: asyncio.Task | None = None
+
+    async def subscribe(self, job_id: int) -> asyncio.Queue:
+        if self.cursor is None:
+            latest = await JobEvent.objects.order_by('-id').values_list('id', flat=True).afirst()
+            # Events up to here are read by the subscriber itself, after it is registered.
+            if self.cursor is None:
+                self.cursor = latest or 0
+        queue = asyncio.Queue()
+        self.queues.setdefault(job_id, set()).add(queue)
+        if self.task is None:
+            # Outside the request's thread-sensitive context: the poll outlives
+            # the request that started it.
+            context = contextvars.copy_context()
+            context.run(SyncToAsync.thread_sensitive_context.set, None)
+            self.task = asyncio.get_running_loop().create_task(self.poll(), context=context)
+        return queue
+
+    def unsubscribe(self, job_id: int, queue: asyncio.Queue):
+        queues = self.queues.get(job_id, set())
+        queues.discard(queue)
+        if not queues:
+            self.queues.pop(job_id, None)
+        if not self.queues:
+            self.close()
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.task = None
+        self.cursor = None
+
+    async def poll(self):
+        while True:
+            await asyncio.sleep(settings.JOB_EVENT_POLL_INTERVAL)
+            try:
+                await self.deliver()
+            except Exception:
+                # Streams keep waiting for the next poll; only cancellation stops it.
+                logger.exception('Reading job events failed')
+
+    async def deliver(self):
+        # Only the followed jobs: events of other jobs are never read.
+        events = [
+            event async for event in
+            JobEvent.objects.filter(id__gt=self.cursor, job_id__in=list(self.queues)).order_by('id')
+        ]
+        by_job = {}
+        for event in events:
+            self.cursor = event.pk
+            by_job.setdefault(event.job_id, []).append(event)
+        for job_id, job_events in by_job.items():
+            # A stream may have closed while the events were read.
+            for queue in self.queues.get(job_id, ()):
+                queue.put_nowait(job_events)
+
+
+# One hub per event loop, like the shared OpenAI clients.
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_event_hub() -> JobEventHub:
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = JobEventHub()
+    return hub
+
+
+def close_event_hub():
+    hub = _hubs.pop(asyncio.get_running_loop(), None)
+    if hub is not None:
+        hub.close()
+
+
+async def follow_job_events(job_id: int, last_event_id: int = 0):
+    """Yield stored events after ``last_event_id``, then new ones as the worker records them."""
+    hub = get_event_hub()
+    queue = await hub.subscribe(job_id)
+    try:
+        # Reconnected after the job ended: there is nothing left to wait for.
+        if await JobEvent.objects.filter(job_id=job_id, id__lte=last_event_id, event__in=TERMINAL_EVENTS).aexists():
+            return
+        events = [
+            event
+            async for event in JobEvent.objects.filter(job_id=job_id, id__gt=last_event_id).order_by('id')
+        ]
+        while True:
+            for event in events:
+                # The hub may hand over events that were already read above.
+                if event.pk <= last_event_id:
+                    continue
+                last_event_id = event.pk
+                yield event
+                if event.event in TERMINAL_EVENTS:
+                    return
+            events = await queue.get()
+    finally:
+        hub.unsubscribe(job_id, queue)
@@ -0,0 +1,98 @@
+"""
+ASGI lifespan handling for the production server (python manage.py serve).
+
+Shared resources are created on the serving event loop before the first
+request is accepted and closed when the server shuts down. Django's ASGI
+handler only speaks HTTP, so the lifespan scope is answered here.
+"""
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+
+from .jobs import close_event_hub
+from .services.clients import close_async_client, get_async_client
+
+logger = logging.getLogger(__name__)
+
+
+def server_options(**overrides) -> dict:
+    """uvicorn.Config keyword arguments for the production server, from the SERVER_* settings."""
+    options = {
+        'host': settings.SERVER_HOST,
+        'port': settings.SERVER_PORT,
+        'workers': settings.SERVER_WORKERS,
+        'lifespan': 'on',
+        'limit_concurrency': settings.SERVER_LIMIT_CONCURRENCY,
+        'backlog': settings.SERVER_BACKLOG,
+        'timeout_keep_alive': settings.SERVER_KEEPALIVE_TIMEOUT,
+        'timeout_graceful_shutdown': settings.SERVER_GRACEFUL_SHUTDOWN,
+        'proxy_headers': True,
+        'forwarded_allow_ips': settings.SERVER_FORWARDED_ALLOW_IPS,
+    }
+    options.update(overrides)
+    return options
+
+
+def check_databases():
+    """Open every configured database once, so a bad configuration fails the startup instead of a request."""
+    for connection in connections.all():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    # Requests run in their own threads and open their own connections.
+    connections.close_all()
+
+
+async def startup():
+    await sync_to_async(check_databases)()
+    # Imports the views, and with them the pipeline, before the first request.
+    get_resolver().url_patterns
+    if os.getenv('OPENAI_API_KEY'):
+        get_async_client()
+    else:
+        logger.warning('OPENAI_API_KEY is not set; grading requests will fail')
+    logger.info('Scanner resources ready')
+
+
+async def shutdown():
+    close_event_hub()
+    await close_async_client()
+    await sync_to_async(connections.close_all)()
+    logger.info('Scanner resources closed')
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await startup()
+            except Exception as e:
+                logger.exception('Startup failed')
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            try:
+                await shutdown()
+            except Exception as e:
+                logger.exception('Shutdown failed')
+                await send({'type': 'lifespan.shutdown.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def with_lifespan(application):
+    """Wrap a Django ASGI application so it also answers the lifespan scope."""
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await lifespan(receive, send)
+        else:
+            await application(scope, receive, send)
+
+    return app
@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from openai import DefaultHttpxClient, OpenAI
+
+from scanner.services.clients import http_options
+from scanner.testing.mock_openai import MockOpenAIServer
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request OpenAI clients with the shared pooled client against a local mock server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per mode')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+
+        with MockOpenAIServer() as server:
+            def new_client():
+                return OpenAI(
+                    base_url=server.base_url,
+                    api_key='benchmark',
+                    http_client=DefaultHttpxClient(**http_options()),
+                )
+
+            def call(client):
+                client.responses.create(model='gpt-5', input='ping')
+
+            fresh = []
+            connections = server.connections
+            for _ in range(count):
+                started = time.perf_counter()
+                client = new_client()
+                call(client)
+                fresh.append(time.perf_counter() - started)
+                client.close()
+            fresh_connections = server.connections - connections
+
+            pooled = []
+            connections = server.connections
+            client = new_client()
+            for _ in range(count):
+                started = time.perf_counter()
+                call(client)
+                pooled.append(time.perf_counter() - started)
+            client.close()
+            pooled_connections = server.connections - connections
+
+        self.stdout.write(f'{count} requests per mode')
+        self.stdout.write('-' * 50)
+        for name, timings, connections in [
+            ('new client per request', fresh, fresh_connections),
+            ('shared pooled client', pooled, pooled_connections),
+        ]:
+            self.stdout.write(
+                f'{name:<24} mean {statistics.mean(timings) * 1000:7.2f} ms  '
+                f'p95 {statistics.quantiles(timings, n=20)[-1] * 1000:7.2f} ms  '
+                f'connections {connections}'
+            )
+        saved = (statistics.mean(fresh) - statistics.mean(pooled)) * 1000
+        self.stdout.write(self.style.SUCCESS(f'Per-request overhead saved: {saved:.2f} ms'))
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import os
+import tempfile
+from dataclasses import asdict
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from scanner.testing.benchmark import MOCK_OUTPUTS, benchmark_upload
+from scanner.testing.mock_openai import MockOpenAIServer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark upload_scan end to end against a local mock OpenAI server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, nargs='+', default=[1, 10, 50, 200], help='Class sizes to run')
+        parser.add_argument('--latency', type=float, default=0.2, help='Mock time to first byte in seconds')
+        parser.add_argument('--token-rate', type=float, default=200, help='Mock output tokens per second')
+        parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of requests answered with 429')
+        parser.add_argument('--server-error-rate', type=float, default=0.0, help='Share of requests answered with 500')
+        parser.add_argument('--mode', choices=['batch', 'per_student'], help='Override EVALUATION_MODE')
+        parser.add_argument('--format', choices=['text', 'json'], help='Override EVALUATION_FORMAT')
+        parser.add_argument('--sse-window', type=float, help='Override SSE_COALESCE_WINDOW (0 sends every delta)')
+        parser.add_argument('--json', dest='json_path', help='Write the results to this file')
+        parser.add_argument('--baseline', help='Fail if wall time regresses against this results file')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed slowdown against the baseline')
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database so the benchmark never touches real data.
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        server = MockOpenAIServer(
+            latency=options['latency'],
+            outputs=MOCK_OUTPUTS,
+            token_rate=options['token_rate'],
+            faults={429: options['rate_limit_rate'], 500: options['server_error_rate']},
+        )
+        overrides = {'MEDIA_ROOT': tempfile.mkdtemp()}
+        if options['mode']:
+            overrides['EVALUATION_MODE'] = options['mode']
+        if options['format']:
+            overrides['EVALUATION_FORMAT'] = options['format']
+        if options['sse_window'] is not None:
+            overrides['SSE_COALESCE_WINDOW'] = options['sse_window']
+        try:
+            with server, override_settings(**overrides), mock.patch.dict(
+                os.environ, {'OPENAI_BASE_URL': server.base_url, 'OPENAI_API_KEY': 'benchmark'}
+            ):
+                results = asyncio.run(self.run(options['students']))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(
+            f'{"students":>8} {"wall s":>8} {"1st byte s":>10} {"events":>7} {"errors":>6} {"SSE KB":>7} '
+            f'{"writes":>6} {"peak RSS MB":>11} {"lag p99 ms":>10} {"lag max ms":>10}'
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result.students:>8} {result.wall_s:>8.2f} {result.first_byte_s:>10.3f} {result.events:>7} '
+                f'{result.errors:>6} {result.sse_bytes / 1024:>7.1f} {result.sse_writes:>6} {result.peak_rss_mb:>11.1f} {result.loop_lag_p99_ms:>10.1f} '
+                f'{result.loop_lag_max_ms:>10.1f}'
+            )
+        self.stdout.write(f'Mock server: {server.requests} requests, {server.failures} injected failures')
+
+        rows = [asdict(result) for result in results]
+        if options['json_path']:
+            with open(options['json_path'], 'w') as file:
+                json.dump(rows, file, indent=2)
+        if options['baseline']:
+            self.compare(rows, options['baseline'], options['tolerance'])
+
+    async def run(self, class_sizes: list[int]):
+        results = []
+        for run, students in enumerate(class_sizes):
+            results.append(await benchmark_upload(students, run_id=str(run)))
+        return results
+
+    def compare(self, rows: list[dict], baseline_path: str, tolerance: float):
+        with open(baseline_path) as file:
+            baseline = {row['students']: row for row in json.load(file)}
+
+        regressions = []
+        for row in rows:
+            previous = baseline.get(row['students'])
+            if previous and row['wall_s'] > previous['wall_s'] * (1 + tolerance):
+                regressions.append(f'{row["students"]} students: {previous["wall_s"]:.2f}s -> {row["wall_s"]:.2f}s')
+        if regressions:
+            raise CommandError('Wall time regressed: ' + '; '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
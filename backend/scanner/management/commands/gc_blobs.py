@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from scanner.models import blob_storage
+from scanner.storage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = 'Delete stored PDFs that no job or scan refers to any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=settings.BLOB_GC_GRACE,
+            help='Seconds a file must have been unused before it is deleted',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        result = collect_garbage(blob_storage, options['grace'], options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result["removed"]} files ({result["bytes"] / 1024 / 1024:.1f} MB), '
+            f'recounted references of {result["recounted"]} blobs'
+        ))
@@ -0,0 +1,51 @@
+import asyncio
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from scanner.batch import BatchGrader, LocalBatchBackend, OpenAIBatchBackend, discover
+from scanner.services.clients import close_async_client, get_async_client
+
+
+class Command(BaseCommand):
+    help = 'Grade a directory tree of exams offline through batch submissions (one answer key per folder)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('root', help='Directory with one folder per exam: an answer key and student exams')
+        parser.add_argument('--output', required=True, help='Directory for results and the resume checkpoint')
+        parser.add_argument(
+            '--backend',
+            choices=['openai', 'local'],
+            default='openai',
+            help="'openai' submits to the Batch API; 'local' runs the same requests directly",
+        )
+        parser.add_argument('--batch-size', type=int, help='Requests per batch (default BATCH_MAX_REQUESTS)')
+
+    def handle(self, *args, **options):
+        root = Path(options['root'])
+        if not root.is_dir():
+            raise CommandError(f'{root} is not a directory')
+        output = Path(options['output'])
+        output.mkdir(parents=True, exist_ok=True)
+
+        groups, skipped = discover(root)
+        for folder in skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {folder}: expected exactly one answer key'))
+        exams = sum(len(group.exams) for group in groups)
+        self.stdout.write(f'{len(groups)} folders, {exams} student exams')
+
+        failures = asyncio.run(self.grade(groups, output, options['backend'], options['batch_size']))
+        for custom_id, error in failures.items():
+            self.stdout.write(self.style.ERROR(f'{custom_id} failed: {error}'))
+        if failures:
+            raise CommandError(f'{len(failures)} requests failed; run the command again to retry them')
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output / "results.jsonl"}'))
+
+    async def grade(self, groups, output: Path, backend_name: str, batch_size: int | None):
+        client = get_async_client()
+        try:
+            backend = LocalBatchBackend(client, output) if backend_name == 'local' else OpenAIBatchBackend(client)
+            grader = BatchGrader(backend, client, output, batch_size=batch_size, log=self.stdout.write)
+            return await grader.run(groups)
+        finally:
+            await close_async_client()
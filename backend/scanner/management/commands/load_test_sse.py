@@ -0,0 +1,74 @@
+import asyncio
+import json
+import os
+import resource
+import tempfile
+from dataclasses import asdict
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from scanner.testing.load import ServerThread, load_test_sse
+
+
+class Command(BaseCommand):
+    help = 'Measure how many concurrent SSE job streams one uvicorn worker can hold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', type=int, nargs='+', default=[50, 100, 200, 400, 800], help='Concurrent streams per step')
+        parser.add_argument('--events', type=int, default=20, help='Events written to every job')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds between events')
+        parser.add_argument('--max-delivery-ms', type=float, default=1000, help='Highest p99 event delay a held step may have')
+        parser.add_argument('--limit-concurrency', type=int, help='Override SERVER_LIMIT_CONCURRENCY')
+        parser.add_argument('--json', dest='json_path', help='Write the results to this file')
+
+    def handle(self, *args, **options):
+        # Every stream takes a socket on each side and a database connection.
+        _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+        # A throwaway file database: WAL as in production, and no shared-cache
+        # table locks between the server's threads.
+        database = os.path.join(tempfile.mkdtemp(), 'load_test.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        overrides = {}
+        if options['limit_concurrency']:
+            overrides['limit_concurrency'] = options['limit_concurrency']
+        try:
+            with ServerThread(**overrides) as server:
+                results = asyncio.run(self.run(server, options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(
+            f'{"streams":>7} {"held":>5} {"503":>5} {"dropped":>7} {"connect p50/p99 ms":>18} '
+            f'{"delivery p50/p99/max ms":>23} {"lag p99 ms":>10} {"threads":>7} {"peak RSS MB":>11}'
+        )
+        for result in results:
+            self.stdout.write(
+                f'{result.streams:>7} {result.held:>5} {result.rejected:>5} {result.dropped:>7} '
+                f'{f"{result.connect_p50_ms:.0f}/{result.connect_p99_ms:.0f}":>18} '
+                f'{f"{result.delivery_p50_ms:.0f}/{result.delivery_p99_ms:.0f}/{result.delivery_max_ms:.0f}":>23} '
+                f'{result.loop_lag_p99_ms:>10.1f} {result.threads:>7} {result.peak_rss_mb:>11.1f}'
+            )
+        held = [
+            result.streams for result in results
+            if result.held == result.streams and result.delivery_p99_ms <= options['max_delivery_ms']
+        ]
+        if held:
+            self.stdout.write(self.style.SUCCESS(
+                f'One worker held {max(held)} streams with p99 delivery under {options["max_delivery_ms"]:.0f} ms'
+            ))
+        else:
+            self.stdout.write(self.style.ERROR('No step was held completely'))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w') as file:
+                json.dump([asdict(result) for result in results], file, indent=2)
+
+    async def run(self, server, options):
+        results = []
+        for streams in options['streams']:
+            results.append(await load_test_sse(server.base_url, streams, options['events'], options['interval'], server))
+        return results
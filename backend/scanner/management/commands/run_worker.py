@@ -0,0 +1,61 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from scanner.jobs import claim_job, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued grading jobs from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.JOB_WORKER_CONCURRENCY,
+            help='Number of jobs to run at the same time',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when there are no more jobs to run',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS(f'Worker started (concurrency={options["concurrency"]})'))
+        try:
+            asyncio.run(self.work(options['concurrency'], options['once']))
+        except KeyboardInterrupt:
+            self.stdout.write('\nWorker stopped')
+
+    async def work(self, concurrency: int, once: bool):
+        running = set()
+        while True:
+            await sync_to_async(close_old_connections)()
+
+            while len(running) < concurrency:
+                job = await sync_to_async(claim_job)()
+                if job is None:
+                    break
+                self.stdout.write(f'Job {job.pk} started (attempt {job.attempts})')
+                running.add(asyncio.create_task(self.run(job)))
+
+            if not running:
+                if once:
+                    return
+                await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+                continue
+
+            _, running = await asyncio.wait(
+                running, timeout=settings.JOB_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED
+            )
+
+    async def run(self, job):
+        await run_job(job)
+        if job.status == job.COMPLETED:
+            self.stdout.write(self.style.SUCCESS(f'Job {job.pk} completed'))
+        else:
+            self.stdout.write(self.style.ERROR(f'Job {job.pk} failed: {job.error}'))
@@ -0,0 +1,19 @@
+import uvicorn
+from django.core.management.base import BaseCommand
+
+from scanner.lifespan import server_options
+
+
+class Command(BaseCommand):
+    help = 'Serve the ASGI application with uvicorn, using the SERVER_* settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', help='Override SERVER_HOST')
+        parser.add_argument('--port', type=int, help='Override SERVER_PORT')
+        parser.add_argument('--workers', type=int, help='Override SERVER_WORKERS')
+        parser.add_argument('--no-access-log', action='store_true', help='Do not log every request')
+
+    def handle(self, *args, **options):
+        overrides = {name: options[name] for name in ('host', 'port', 'workers') if options[name] is not None}
+        # An import string, so every worker process loads the application itself.
+        uvicorn.run('backend.asgi:application', access_log=not options['no_access_log'], **server_options(**overrides))
@@ -0,0 +1,158 @@
+from dataclasses import dataclass, field
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Job, JobMetric, MetricSeries
+from .services.usage import CallUsage, usage_summary
+
+HISTOGRAMS = {
+    'scanner_answer_key_read_seconds': 'Time to read the answer key.',
+    'scanner_student_read_seconds': 'Time to read one student exam.',
+    'scanner_first_question_seconds': 'Time from starting to read a document to its first transcribed question.',
+    'scanner_extraction_seconds': 'Time of one extraction attempt, by model tier and whether its output was accepted.',
+    'scanner_evaluation_first_token_seconds': 'Time from sending an evaluation request to its first token.',
+    'scanner_evaluation_seconds': 'Time from sending an evaluation request to its last token.',
+}
+
+COUNTERS = {
+    'scanner_input_tokens_total': 'Input tokens sent to the model.',
+    'scanner_cached_tokens_total': 'Input tokens served from the prompt cache.',
+    'scanner_output_tokens_total': 'Output tokens generated by the model.',
+    'scanner_reasoning_tokens_total': 'Reasoning tokens generated by the model.',
+    'scanner_errors_total': 'Failed model requests.',
+    'scanner_retries_total': 'Retried model requests.',
+    'scanner_extraction_escalations_total': 'Extractions rejected by validation and sent to the next model tier.',
+    'scanner_scored_answers_total': 'Evaluated answers by where the verdict came from (model, cache, duplicate, blank, exact).',
+}
+
+BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def escape(value) -> str:
+    if isinstance(value, bool):
+        value = str(value).lower()
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(**labels) -> str:
+    return ','.join(f'{name}="{escape(value)}"' for name, value in sorted(labels.items()))
+
+
+@dataclass
+class JobMetrics:
+    """Metrics of one job, kept in memory until the job ends and then saved."""
+
+    calls: list[CallUsage] = field(default_factory=list)
+    samples: list[tuple[str, str, float]] = field(default_factory=list)
+    # (kind, model, tier, seconds, accepted) of every extraction attempt.
+    extractions: list[tuple[str, str, int, float, bool]] = field(default_factory=list)
+
+    def observe(self, name: str, seconds: float, **labels):
+        self.samples.append((name, format_labels(**labels), seconds))
+
+    def count(self, name: str, value: float = 1, **labels):
+        self.samples.append((name, format_labels(**labels), value))
+
+    def record_call(self, call: CallUsage):
+        self.calls.append(call)
+        labels = {'model': call.model, 'kind': call.kind}
+        self.count('scanner_input_tokens_total', call.input_tokens, **labels)
+        self.count('scanner_cached_tokens_total', call.cached_tokens, **labels)
+        self.count('scanner_output_tokens_total', call.output_tokens, **labels)
+        self.count('scanner_reasoning_tokens_total', call.reasoning_tokens, **labels)
+
+    def record_error(self, model: str, error: Exception):
+        self.count('scanner_errors_total', model=model, error=type(error).__name__)
+
+    def usage_summary(self) -> dict:
+        return usage_summary(self.calls)
+
+    def record_extraction(self, kind: str, model: str, tier: int, seconds: float, accepted: bool):
+        self.extractions.append((kind, model, tier, seconds, accepted))
+        self.observe('scanner_extraction_seconds', seconds, kind=kind, model=model, tier=tier, accepted=accepted)
+
+    def routing_summary(self) -> dict:
+        """Escalation rate and mean attempt time per model, per kind of extraction."""
+        summary = {}
+        for kind, model, tier, seconds, accepted in self.extractions:
+            entry = summary.setdefault(kind, {'extractions': 0, 'escalations': 0, 'models': {}})
+            entry['extractions'] += tier == 0
+            entry['escalations'] += tier == 1
+            entry['models'].setdefault(model, []).append(seconds * 1000)
+        for entry in summary.values():
+            entry['escalation_rate'] = round(entry['escalations'] / entry['extractions'], 3) if entry['extractions'] else 0.0
+            entry['models'] = {
+                model: {'attempts': len(times), 'mean_ms': round(sum(times) / len(times), 1)}
+                for model, times in entry['models'].items()
+            }
+        return summary
+
+    async def save(self, job: Job):
+        await JobMetric.objects.abulk_create(
+            [JobMetric(job=job, name=name, labels=labels, value=value) for name, labels, value in self.samples]
+        )
+        await sync_to_async(add_to_series)(self.samples)
+        self.samples.clear()
+
+
+def series_increments(samples) -> dict[tuple, float]:
+    """(name, labels, kind, le) -> amount to add, for the samples of one job."""
+    increments = {}
+
+    def add(key, value):
+        increments[key] = increments.get(key, 0) + value
+
+    for name, labels, value in samples:
+        if name not in HISTOGRAMS:
+            add((name, labels, 'total', ''), value)
+            continue
+        add((name, labels, 'count', ''), 1)
+        add((name, labels, 'sum', ''), value)
+        for bound in BUCKETS:
+            add((name, labels, 'bucket', str(bound)), value <= bound)
+    return increments
+
+
+def add_to_series(samples):
+    with transaction.atomic():
+        for (name, labels, kind, le), value in series_increments(samples).items():
+            series = MetricSeries.objects.filter(name=name, labels=labels, kind=kind, le=le)
+            if series.update(value=F('value') + value):
+                continue
+            try:
+                with transaction.atomic():
+                    MetricSeries.objects.create(name=name, labels=labels, kind=kind, le=le, value=value)
+            except IntegrityError:
+                # Created by another worker in the meantime.
+                series.update(value=F('value') + value)
+
+
+def sample_line(name: str, labels: str, value: float, **extra) -> str:
+    labels = ','.join(filter(None, [labels, format_labels(**extra)]))
+    value = int(value) if float(value).is_integer() else value
+    return f'{name}{{{labels}}} {value}' if labels else f'{name} {value}'
+
+
+def render_metrics() -> str:
+    """Render the running metric totals in the Prometheus text exposition format."""
+    rows = {}
+    for series in MetricSeries.objects.order_by('name', 'labels'):
+        rows.setdefault(series.name, {}).setdefault(series.labels, {})[(series.kind, series.le)] = series.value
+
+    lines = []
+    for name, help_text in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for labels, values in rows.get(name, {}).items():
+            count = values.get(('count', ''), 0)
+            for bound in BUCKETS:
+                lines.append(sample_line(f'{name}_bucket', labels, values.get(('bucket', str(bound)), 0), le=bound))
+            lines.append(sample_line(f'{name}_bucket', labels, count, le='+Inf'))
+            lines.append(sample_line(f'{name}_sum', labels, values.get(('sum', ''), 0)))
+            lines.append(sample_line(f'{name}_count', labels, count))
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for labels, values in rows.get(name, {}).items():
+            lines.append(sample_line(name, labels, values.get(('total', ''), 0)))
+    return '\n'.join(lines) + '\n'
@@ -1,15 +1,283 @@
 from django.db import models
+from django.utils import timezone
+
+from .storage import BlobStorage
+
+blob_storage = BlobStorage()
 
 
 class Scan(models.Model):
 
     filename = models.CharField(max_length=255)
-    file = models.FileField(upload_to='pdfs/')
+    file = models.FileField(upload_to='pdfs/', storage=blob_storage, blank=True)
+    kind = models.CharField(max_length=32)
+    content_hash = models.CharField(max_length=64)
+    extraction_version = models.CharField(max_length=16)
+    result = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_hash', 'kind', 'extraction_version'],
+                name='unique_scan_extraction',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.filename}"
+
+
+class Blob(models.Model):
+    """One stored file, named by the SHA-256 of its content (scanner.storage)."""
+
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # File fields that refer to it; recounted by gc_blobs.
+    refs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Job(models.Model):
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Job {self.pk} ({self.status})"
+
+
+class Stage(models.Model):
+
+    ANSWER_KEY = 'answer_key'
+    STUDENT_EXAM = 'student_exam'
+    EVALUATION = 'evaluation'
+    NAME_CHOICES = [
+        (ANSWER_KEY, 'Answer key'),
+        (STUDENT_EXAM, 'Student exam'),
+        (EVALUATION, 'Evaluation'),
+    ]
+
+    PENDING = 'pending'
+    COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (COMPLETED, 'Completed'),
+    ]
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='stages')
+    name = models.CharField(max_length=32, choices=NAME_CHOICES)
+    student = models.PositiveIntegerField(null=True, blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+    file = models.FileField(upload_to='jobs/', storage=blob_storage, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    result = models.JSONField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['job', 'name', 'student']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'name', 'student'], name='unique_job_stage'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} {self.student if self.student is not None else ''}".strip()
+
+
+class JobEvent(models.Model):
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='events')
+    event = models.CharField(max_length=64)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['job', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.job_id}:{self.pk} {self.event}"
+
+
+class JobMetric(models.Model):
+    """One timing observation or counter increment recorded while running a job."""
+
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='metrics')
+    name = models.CharField(max_length=100)
+    # Prometheus label set, e.g. model="gpt-5",kind="student_exam"
+    labels = models.CharField(max_length=255, blank=True)
+    value = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'labels']),
+        ]
+
+    def __str__(self):
+        return f"{self.job_id} {self.name}{{{self.labels}}} {self.value}"
+
+
+class MetricSeries(models.Model):
+    """
+    Running total of one exposed sample (a counter, or a histogram's bucket,
+    sum or count), added to as each job saves its metrics, so /metrics
+    reads one row per series instead of every JobMetric ever recorded.
+    """
+
+    name = models.CharField(max_length=100)
+    labels = models.CharField(max_length=255, blank=True)
+    # 'total' for counters; 'bucket', 'sum' or 'count' for histograms.
+    kind = models.CharField(max_length=8)
+    # Upper bound of a bucket as rendered, e.g. "2.5"; empty otherwise.
+    le = models.CharField(max_length=16, blank=True)
+    value = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'labels', 'kind', 'le'], name='unique_metric_series'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}{{{self.labels}}} {self.kind}{self.le} {self.value}"
+
+
+class Conversation(models.Model):
+    """Graded results of a job, kept compact for follow-up questions (scanner.conversations)."""
+
+    job = models.OneToOneField(Job, on_delete=models.CASCADE, related_name='conversation')
+    answer_key = models.JSONField()
+    # One record per student: name, answers and per-question evaluation.
+    records = models.JSONField(default=list)
+    # Older turns, condensed; the most recent turns are kept verbatim in ``turns``.
+    summary = models.TextField(blank=True)
+    turns = models.JSONField(default=list)
+    # Students and questions the last turn was about, for follow-ups like "peki 3. soru?"
+    focus = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Conversation for job {self.job_id}"
+
+
+class AnswerScore(models.Model):
+    """A verdict on one normalized answer to one question, reused for identical answers (scanner.services.prescoring)."""
+
+    answer_key_hash = models.CharField(max_length=64)
+    evaluation_version = models.CharField(max_length=16)
+    # Hash of the question number and the normalized answer.
+    answer_hash = models.CharField(max_length=64)
+    question_number = models.PositiveIntegerField()
+    score = models.PositiveSmallIntegerField()
+    rationale = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['answer_key_hash', 'evaluation_version', 'answer_hash'],
+                name='unique_answer_score',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Soru {self.question_number}: {self.score}"
+
+
+class Exam(models.Model):
+    """Graded results of one finished job, for the history listing (scanner.results)."""
+
+    job = models.OneToOneField(Job, on_delete=models.CASCADE, related_name='exam')
+    answer_key_hash = models.CharField(max_length=64)
+    answer_key = models.JSONField()
+    student_count = models.PositiveIntegerField()
+    question_count = models.PositiveIntegerField()
+    average = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Keyset pagination: newest first, id breaks ties.
+            models.Index(fields=['-created_at', '-id'], name='exam_created'),
+            models.Index(fields=['answer_key_hash', '-created_at', '-id'], name='exam_answer_key_created'),
+        ]
+
+    def __str__(self):
+        return f"Exam {self.pk} ({self.student_count} students)"
+
+
+class Student(models.Model):
+
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='students')
+    index = models.PositiveIntegerField()
+    name = models.CharField(max_length=255)
+    # Case-folded name (scanner.conversations.fold), searched by prefix.
+    name_folded = models.CharField(max_length=255)
+    average = models.FloatField(null=True, blank=True)
+    report = models.TextField(blank=True)
+    # The exam's, copied so name searches are ordered without a join.
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['exam', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['exam', 'index'], name='unique_exam_student'),
+        ]
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='student_created'),
+            models.Index(fields=['name_folded', '-created_at', '-id'], name='student_name_created'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class QuestionResult(models.Model):
+
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='questions')
+    question_number = models.PositiveIntegerField()
+    answer = models.TextField(blank=True)
+    score = models.FloatField(null=True, blank=True)
+    rationale = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['student', 'question_number']
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'question_number'], name='unique_student_question'),
+        ]
+
+    def __str__(self):
+        return f"{self.student_id} Soru {self.question_number}: {self.score}"
@@ -0,0 +1,332 @@
+import asyncio
+import time
+from dataclasses import asdict
+
+from django.conf import settings
+
+from .metrics import JobMetrics
+from .services.cache import ExtractionCache
+from .services.openai import AsyncReadAnswerKeyService, AsyncReadStudentAnswersService, AsyncEvaluateStudentAnswersService
+from .services.prescoring import Prescorer
+from .services.scores import (
+    STUDENT_SEPARATOR, class_statistics, local_student, merge_known, parse_evaluation, pending_answers,
+    render_evaluation, render_statistics,
+)
+from .services.usage import CallUsage
+
+
+async def grade_exams(answer_key_file, student_exams: list, completed: dict | None = None, metrics: JobMetrics | None = None):
+    """
+    Yield (event_type, data) pairs while grading one upload.
+
+    The answer key and every student exam are read at the same time, and
+    every question is sent as ``question_extracted`` as soon as the model has
+    transcribed it. In
+    per_student mode each student is evaluated as soon as both its own exam
+    and the answer key are ready; in batch mode the class is evaluated in one
+    request once every exam has been read.
+
+    ``completed`` maps (stage name, student index) to the result of an
+    evaluation that already finished in an earlier attempt; those are reused
+    instead of being requested again.
+
+    With EVALUATION_FORMAT 'json' the model's scores are not streamed as
+    they arrive: each evaluation is parsed when it completes, sent as rendered
+    Turkish text, and the class statistics are computed at the end. Answers
+    with a known verdict (see scanner.services.prescoring) are not sent to
+    the model at all.
+
+    Stage timings and token usage are recorded in ``metrics``; the usage of
+    every model call is also sent last as ``usage_summary``.
+    """
+    completed = completed or {}
+    metrics = metrics or JobMetrics()
+    per_student = settings.EVALUATION_MODE == 'per_student'
+    structured = settings.EVALUATION_FORMAT == 'json'
+    extraction_cache = ExtractionCache()
+    read_answer_key_service = AsyncReadAnswerKeyService(metrics=metrics)
+    read_student_answers_service = AsyncReadStudentAnswersService(metrics=metrics)
+    evaluate_student_answers_service = AsyncEvaluateStudentAnswersService(metrics=metrics)
+    queue = asyncio.Queue()
+    emit = queue.put_nowait
+    evaluation_texts = [[] for _ in student_exams]
+    evaluations = [None] * len(student_exams)
+    evaluation_started = False
+    prescorer = None
+
+    def report_input(document: str, student: int | None = None):
+        return lambda report: emit(('input_report', {'document': document, 'student': student, **report}))
+
+    def report_question(document: str, student: int | None = None):
+        started = time.perf_counter()
+        first = True
+
+        def report(question: dict, window):
+            nonlocal first
+            if first:
+                first = False
+                metrics.observe('scanner_first_question_seconds', time.perf_counter() - started, document=document)
+            emit(('question_extracted', {'document': document, 'student': student, 'window': window, 'question': question}))
+        return report
+
+    def report_reset(document: str, student: int | None = None):
+        # Questions already sent by an extraction that failed validation.
+        return lambda window: emit(('stage_reset', {
+            'message': 'Sorular yeniden okunuyor',
+            'stages': [{'stage': document, 'student': student, 'window': window}],
+        }))
+
+    async def read_answer_key():
+        started = time.perf_counter()
+        answer_key, cached = await extraction_cache.get_or_extract(
+            'answer_key',
+            answer_key_file,
+            lambda file: read_answer_key_service.read_answer_key(
+                file,
+                report=report_input('answer_key'),
+                on_question=report_question('answer_key'),
+                on_reset=report_reset('answer_key'),
+            ),
+        )
+        metrics.observe('scanner_answer_key_read_seconds', time.perf_counter() - started, cached=cached)
+        nonlocal prescorer
+        prescorer = Prescorer(answer_key, metrics)
+        emit(('answer_key_complete', {
+            'message': 'Cevap anahtarı okunması tamamlandı',
+            'data': answer_key,
+            'cached': cached
+        }))
+        return answer_key
+
+    async def request_evaluation(index: int, student_answer: dict, answer_key: dict, texts: list):
+        """Send one student's evaluation request, collecting its output in ``texts``."""
+        timer = EvaluationTimer(metrics, mode='per_student')
+        response_stream = await evaluate_student_answers_service.evaluate_student_answers([student_answer], answer_key)
+        async for event in response_stream:
+            if event.type == 'response.output_text.delta':
+                timer.first_token()
+                texts.append(event.delta)
+                if not structured:
+                    emit(('evaluation_chunk', {'delta': event.delta, 'student': index}))
+            elif event.type == 'response.completed':
+                timer.completed(event.response)
+
+    async def evaluate_student(index: int, student_answer: dict, answer_key: dict):
+        nonlocal evaluation_started
+        stored = completed.get(('evaluation', index))
+        if stored is not None:
+            evaluation_texts[index].append(stored['full_text'])
+            evaluations[index] = stored.get('evaluation')
+            emit(('student_evaluation_complete', stored))
+            return
+        if not evaluation_started:
+            evaluation_started = True
+            emit(('status', {'stage': 'evaluation', 'message': 'Değerlendirme başlatılıyor...'}))
+        known, shared, claimed = await prescorer.claim(student_answer) if structured else ({}, {}, set())
+        try:
+            request_answer = student_answer
+            if structured:
+                request_answer = pending_answers(student_answer, known)
+                request_answer['questions'] = [
+                    question for question in request_answer['questions'] if question['question_number'] not in shared
+                ]
+            if request_answer['questions'] or not structured:
+                await request_evaluation(index, request_answer, answer_key, evaluation_texts[index])
+            result = {'student': index, 'student_name': student_answer.get('student_name')}
+            if structured:
+                evaluation = None
+                if request_answer['questions']:
+                    evaluation = parse_evaluation(''.join(evaluation_texts[index]))[0]
+                    await prescorer.remember(student_answer, evaluation['questions'])
+                # Only after this student's own request, so two students never wait on each other.
+                known.update(await prescorer.shared_verdicts(shared))
+                # The model left these out for the student that asked first: ask again for this one.
+                missing = [
+                    question for question in student_answer['questions']
+                    if question['question_number'] in shared and question['question_number'] not in known
+                ]
+                if missing:
+                    texts = []
+                    retry = pending_answers({**student_answer, 'questions': missing}, known)
+                    await request_evaluation(index, retry, answer_key, texts)
+                    retried = parse_evaluation(''.join(texts))[0]
+                    await prescorer.remember(student_answer, retried['questions'])
+                    if evaluation:
+                        evaluation = {**evaluation, 'questions': evaluation['questions'] + retried['questions']}
+                    else:
+                        evaluation = retried
+                evaluations[index] = merge_known(evaluation, known) if evaluation else local_student(student_answer, known)
+                evaluation_texts[index] = [render_evaluation([evaluations[index]])]
+                emit(('evaluation_chunk', {'delta': evaluation_texts[index][0], 'student': index}))
+                result['evaluation'] = evaluations[index]
+        finally:
+            if structured:
+                prescorer.release(claimed)
+        emit(('student_evaluation_complete', {**result, 'full_text': ''.join(evaluation_texts[index])}))
+
+    async def read_answer_key_or_none():
+        # Shielded: a student that fails must not cancel the answer key.
+        try:
+            return await asyncio.shield(answer_key_task)
+        except Exception:
+            return None
+
+    async def grade_student(index: int, exam):
+        started = time.perf_counter()
+        student_answer, cached = await extraction_cache.get_or_extract(
+            'student_exam',
+            exam,
+            lambda file: read_student_answers_service.read_student_answers(
+                file,
+                report=report_input('student_exam', index),
+                on_question=report_question('student_exam', index),
+                answer_key=read_answer_key_or_none,
+                on_reset=report_reset('student_exam', index),
+            ),
+        )
+        metrics.observe('scanner_student_read_seconds', time.perf_counter() - started, cached=cached)
+        emit(('student_reading_complete', {
+            'message': f'{student_answer.get("student_name") or exam.name} sınavı okundu',
+            'student': index,
+            'data': student_answer,
+            'cached': cached
+        }))
+        if per_student:
+            await evaluate_student(index, student_answer, await answer_key_task)
+        return student_answer
+
+    emit(('status', {'stage': 'answer_key_reading', 'message': 'Cevap anahtarı okunuyor...'}))
+    emit(('status', {'stage': 'student_reading', 'message': f'{len(student_exams)} öğrenci sınavı okunuyor...'}))
+
+    answer_key_task = asyncio.create_task(read_answer_key())
+    student_tasks = [asyncio.create_task(grade_student(index, exam)) for index, exam in enumerate(student_exams)]
+    tasks = [answer_key_task, *student_tasks]
+    for task in tasks:
+        task.add_done_callback(queue.put_nowait)
+
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await queue.get()
+            if isinstance(item, asyncio.Task):
+                remaining -= 1
+                item.result()
+                continue
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if per_student:
+        full_text = STUDENT_SEPARATOR.join(''.join(text) for text in evaluation_texts)
+        summary = {}
+        if structured:
+            summary['statistics'] = class_statistics([evaluation for evaluation in evaluations if evaluation])
+            yield ('evaluation_chunk', {'delta': render_statistics(summary['statistics'])})
+        yield ('evaluation_complete', {
+            'message': 'Değerlendirme tamamlandı',
+            'full_text': full_text,
+            'response_id': None,
+            **summary,
+        })
+    elif (stored := completed.get(('evaluation', None))) is not None:
+        yield ('evaluation_complete', stored)
+    else:
+        yield ('status', {'stage': 'evaluation', 'message': 'Değerlendirme başlatılıyor...'})
+        student_answers = [task.result() for task in student_tasks]
+        async for item in evaluate_class(student_answers, answer_key_task.result(), metrics, prescorer):
+            yield item
+
+    yield ('usage_summary', {
+        'calls': [asdict(call) for call in metrics.calls],
+        'summary': metrics.usage_summary(),
+        'routing': metrics.routing_summary(),
+        'prescoring': prescorer.report() if structured and prescorer else None,
+    })
+
+
+class EvaluationTimer:
+    """Records time to first token and total time of one streamed evaluation."""
+
+    def __init__(self, metrics: JobMetrics, mode: str):
+        self.metrics = metrics
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.first_token_at = None
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def completed(self, response):
+        labels = {'model': response.model, 'mode': self.mode}
+        if self.first_token_at is not None:
+            self.metrics.observe('scanner_evaluation_first_token_seconds', self.first_token_at - self.started, **labels)
+        self.metrics.observe('scanner_evaluation_seconds', time.perf_counter() - self.started, **labels)
+        usage = CallUsage.from_response('evaluation', response, self.started)
+        if usage:
+            self.metrics.record_call(usage)
+
+
+async def evaluate_class(
+    student_answers: list[dict], answer_key: dict, metrics: JobMetrics | None = None, prescorer: Prescorer | None = None
+):
+    metrics = metrics or JobMetrics()
+    evaluate_student_answers_service = AsyncEvaluateStudentAnswersService(metrics=metrics)
+    structured = settings.EVALUATION_FORMAT == 'json'
+    request_answers = student_answers
+    if structured:
+        prescorer = prescorer or Prescorer(answer_key, metrics)
+        known = [await prescorer.known(student_answer) for student_answer in student_answers]
+        pending = [pending_answers(student_answer, verdicts) for student_answer, verdicts in zip(student_answers, known)]
+        # An answer identical to one already in this request is judged once.
+        duplicates = prescorer.share_duplicates(pending)
+        sent = [index for index, student in enumerate(pending) if student['questions']]
+        request_answers = [pending[index] for index in sent]
+
+    text_parts = []
+    current_response_id = None
+    if request_answers:
+        timer = EvaluationTimer(metrics, mode='batch')
+        response_stream = await evaluate_student_answers_service.evaluate_student_answers(request_answers, answer_key)
+        async for event in response_stream:
+            if event.type == 'response.created':
+                current_response_id = event.response.id
+                yield ('response_id', {
+                    'response_id': current_response_id
+                })
+            elif event.type == 'response.output_text.delta':
+                timer.first_token()
+                text_parts.append(event.delta)
+                if not structured:
+                    yield ('evaluation_chunk', {
+                        'delta': event.delta
+                    })
+            elif event.type == 'response.completed':
+                timer.completed(event.response)
+
+    full_text = ''.join(text_parts)
+    summary = {}
+    if structured:
+        evaluated = dict(zip(sent, parse_evaluation(full_text) if request_answers else []))
+        verdicts = {}
+        for index, evaluation in evaluated.items():
+            verdicts.update(await prescorer.remember(student_answers[index], evaluation['questions']))
+        prescorer.fill_duplicates(known, duplicates, verdicts)
+        students = [
+            merge_known(evaluated[index], known[index]) if index in evaluated else local_student(student_answer, known[index])
+            for index, student_answer in enumerate(student_answers)
+        ]
+        statistics = class_statistics(students)
+        full_text = render_evaluation(students)
+        for student in students:
+            yield ('evaluation_chunk', {'delta': render_evaluation([student]) + STUDENT_SEPARATOR})
+        yield ('evaluation_chunk', {'delta': render_statistics(statistics)})
+        summary = {'evaluations': students, 'statistics': statistics}
+
+    yield ('evaluation_complete', {
+        'message': 'Değerlendirme tamamlandı',
+        'full_text': full_text,
+        'response_id': current_response_id,
+        **summary,
+    })
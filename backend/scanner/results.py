@@ -0,0 +1,149 @@
+"""
+Graded results stored as rows (Exam, Student, QuestionResult) for the
+history API, and keyset pagination over them.
+
+A job's results are written once, when it finishes, with one bulk insert
+per table in a single transaction. Listings are ordered newest first by
+(created_at, id) and continue from an opaque cursor instead of an offset,
+so a page deep in a long history costs the same as the first one.
+"""
+import base64
+import json
+import statistics
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .conversations import fold
+from .models import Exam, QuestionResult, Student
+from .services.prescoring import answer_key_hash
+
+
+def write_results(job, conversation) -> Exam:
+    """Replace the stored results of ``job`` with the records of its conversation."""
+    records = conversation.records
+    averages = [record["average"] for record in records if record["average"] is not None]
+    with transaction.atomic():
+        Exam.objects.filter(job=job).delete()
+        exam = Exam.objects.create(
+            job=job,
+            answer_key_hash=answer_key_hash(conversation.answer_key),
+            answer_key=conversation.answer_key,
+            student_count=len(records),
+            question_count=len(conversation.answer_key.get("questions", [])),
+            average=round(statistics.fmean(averages), 2) if averages else None,
+        )
+        students = Student.objects.bulk_create(
+            [
+                Student(
+                    exam=exam,
+                    index=record["student"],
+                    name=record["name"],
+                    name_folded=fold(record["name"]),
+                    average=record["average"],
+                    report=record["report"],
+                    created_at=exam.created_at,
+                )
+                for record in records
+            ]
+        )
+        QuestionResult.objects.bulk_create(
+            [
+                QuestionResult(
+                    student=student,
+                    question_number=int(number),
+                    answer=question.get("answer") or "",
+                    score=question.get("score"),
+                    rationale=question.get("rationale", ""),
+                )
+                for student, record in zip(students, records)
+                for number, question in record["questions"].items()
+            ],
+            batch_size=500,
+        )
+    return exam
+
+
+save_results = sync_to_async(write_results)
+
+
+def encode_cursor(row) -> str:
+    value = json.dumps([row.created_at.isoformat(), row.pk], separators=(",", ":"))
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError for a cursor that was not made by encode_cursor."""
+    try:
+        created_at, pk = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Geçersiz cursor: {cursor}") from e
+
+
+def page_size(value: str | None) -> int:
+    try:
+        size = int(value) if value else settings.RESULTS_PAGE_SIZE
+    except ValueError:
+        size = settings.RESULTS_PAGE_SIZE
+    return min(max(size, 1), settings.RESULTS_MAX_PAGE_SIZE)
+
+
+async def keyset_page(queryset, cursor: str | None, size: int) -> tuple[list, str | None]:
+    """One page of ``queryset`` newest first, and the cursor of the next page (None on the last one)."""
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    rows = [row async for row in queryset.order_by("-created_at", "-pk")[:size + 1]]
+    if len(rows) > size:
+        return rows[:size], encode_cursor(rows[size - 1])
+    return rows, None
+
+
+def exam_summary(exam: Exam) -> dict:
+    return {
+        "id": exam.pk,
+        "job_id": exam.job_id,
+        "answer_key_hash": exam.answer_key_hash,
+        "student_count": exam.student_count,
+        "question_count": exam.question_count,
+        "average": exam.average,
+        "created_at": exam.created_at.isoformat(),
+    }
+
+
+def student_summary(student: Student) -> dict:
+    return {
+        "id": student.pk,
+        "exam_id": student.exam_id,
+        "index": student.index,
+        "name": student.name,
+        "average": student.average,
+        "created_at": student.created_at.isoformat(),
+    }
+
+
+def exam_detail(exam: Exam) -> dict:
+    return {
+        **exam_summary(exam),
+        "answer_key": exam.answer_key,
+        "students": [
+            {
+                **student_summary(student),
+                "report": student.report,
+                "questions": [
+                    {
+                        "question_number": question.question_number,
+                        "answer": question.answer,
+                        "score": question.score,
+                        "rationale": question.rationale,
+                    }
+                    for question in student.questions.all()
+                ],
+            }
+            for student in exam.students.all()
+        ],
+    }
@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import json
+import weakref
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Scan
+from ..storage import blob_digest
+from .openai import ANSWER_KEY_PROMPT, ANSWER_KEY_SCHEMA, STUDENT_EXAM_PROMPT, STUDENT_EXAM_SCHEMA
+
+
+def extraction_version(prompt: str, schema: dict) -> str:
+    payload = prompt + json.dumps(schema, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+EXTRACTION_VERSIONS = {
+    "answer_key": extraction_version(ANSWER_KEY_PROMPT, ANSWER_KEY_SCHEMA),
+    "student_exam": extraction_version(STUDENT_EXAM_PROMPT, STUDENT_EXAM_SCHEMA),
+}
+
+# Extractions currently running, per event loop, so identical concurrent
+# uploads wait on the same model call instead of starting their own.
+_inflight = weakref.WeakKeyDictionary()
+
+
+def file_hash(file) -> str:
+    # Files in the blob store are named by this hash already.
+    if stored := blob_digest(getattr(file, "name", None)):
+        return stored
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+@dataclass
+class ExtractionCache:
+    max_entries: int = field(default_factory=lambda: settings.EXTRACTION_CACHE_MAX_ENTRIES)
+    ttl: timedelta = field(default_factory=lambda: timedelta(seconds=settings.EXTRACTION_CACHE_TTL))
+
+    async def get_or_extract(self, kind: str, file, extract) -> tuple[dict, bool]:
+        key = (file_hash(file), kind, EXTRACTION_VERSIONS[kind])
+
+        result = await self.get(*key)
+        if result is not None:
+            return result, True
+
+        inflight = _inflight.setdefault(asyncio.get_running_loop(), {})
+        if key in inflight:
+            return await asyncio.shield(inflight[key]), True
+
+        task = asyncio.ensure_future(self._extract_and_store(key, file, extract))
+        inflight[key] = task
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+        return await asyncio.shield(task), False
+
+    async def _extract_and_store(self, key: tuple, file, extract) -> dict:
+        result = await extract(file)
+        await self.put(*key, filename=file.name, result=result)
+        return result
+
+    async def get(self, content_hash: str, kind: str, version: str) -> dict | None:
+        scan = await Scan.objects.filter(
+            content_hash=content_hash, kind=kind, extraction_version=version
+        ).afirst()
+        if scan is None:
+            return None
+
+        now = timezone.now()
+        if scan.created_at < now - self.ttl:
+            await scan.adelete()
+            return None
+
+        await Scan.objects.filter(pk=scan.pk).aupdate(hits=F("hits") + 1, last_used_at=now)
+        return scan.result
+
+    async def put(self, content_hash: str, kind: str, version: str, filename: str, result: dict):
+        await Scan.objects.aupdate_or_create(
+            content_hash=content_hash,
+            kind=kind,
+            extraction_version=version,
+            defaults={"filename": filename, "result": result, "last_used_at": timezone.now()},
+        )
+        await self.evict()
+
+    async def evict(self):
+        await Scan.objects.filter(created_at__lt=timezone.now() - self.ttl).adelete()
+
+        stale = [
+            pk
+            async for pk in Scan.objects.order_by("-last_used_at").values_list("pk", flat=True)[
+                self.max_entries:
+            ]
+        ]
+        if stale:
+            await Scan.objects.filter(pk__in=stale).adelete()
@@ -0,0 +1,109 @@
+import asyncio
+
+from django.conf import settings
+
+from .text_layer import page_count, select_pages
+
+# Shortest shared run of characters accepted as the seam between two halves
+# of a question that was cut at a window edge.
+MIN_SEAM = 20
+
+
+def page_windows(pages: int, size: int, overlap: int) -> list[tuple[int, int]]:
+    """Split 1..pages into (first, last) windows of ``size`` pages sharing ``overlap`` pages."""
+    step = max(size - overlap, 1)
+    windows = []
+    first = 1
+    while True:
+        last = min(first + size - 1, pages)
+        windows.append((first, last))
+        if last == pages:
+            return windows
+        first += step
+
+
+def document_windows(file) -> list[tuple[tuple[int, int], object]] | None:
+    """
+    Return ((first, last), PDF) for every page window of ``file``, or None
+    when the document should be extracted in a single request.
+    """
+    if settings.EXTRACTION_MODE != "chunked":
+        return None
+    pages = page_count(file)
+    if pages is None or pages < settings.CHUNKED_EXTRACTION_MIN_PAGES:
+        return None
+    return [
+        ((first, last), select_pages(file, list(range(first, last + 1))))
+        for first, last in page_windows(pages, settings.EXTRACTION_CHUNK_PAGES, settings.EXTRACTION_CHUNK_OVERLAP)
+    ]
+
+
+def window_hint(window: tuple[int, int], pages: int) -> dict:
+    first, last = window
+    return {
+        "type": "input_text",
+        "text": (
+            f"This is pages {first}-{last} of a {pages}-page document that is read in overlapping parts. "
+            "Extract every question on these pages, including questions cut off at the first or last page. "
+            "Skip text at the top of the first page that continues a question whose number is not shown."
+        ),
+    }
+
+
+def join_text(first: str, second: str) -> str:
+    """Join two readings of the same field, dropping the text they share."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    for size in range(min(len(first), len(second)) - 1, MIN_SEAM - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    # No seam: keep the longer reading, the earlier window on ties.
+    return second if len(second) > len(first) else first
+
+
+def merge_questions(results: list[list[dict]], answer_field: str) -> list[dict]:
+    """
+    Merge per-window question lists into one, ordered by question_number.
+
+    Windows are merged in page order, so the result does not depend on which
+    request finished first.
+    """
+    merged = {}
+    for questions in results:
+        for question in questions:
+            number = question["question_number"]
+            current = merged.get(number)
+            if current is None:
+                merged[number] = dict(question)
+                continue
+            current["question"] = join_text(current["question"], question["question"])
+            current[answer_field] = join_text(current[answer_field], question[answer_field])
+    return [merged[number] for number in sorted(merged)]
+
+
+def merge_answer_key(results: list[dict]) -> dict:
+    return {"questions": merge_questions([result["questions"] for result in results], "answer")}
+
+
+def merge_student_exam(results: list[dict]) -> dict:
+    return {
+        "student_name": next((result["student_name"] for result in results if result["student_name"]), ""),
+        "questions": merge_questions([result["questions"] for result in results], "student_answer"),
+    }
+
+
+async def extract_in_windows(file, extract, merge):
+    """
+    Run ``extract(file, hints, window)`` once for the whole document, or
+    concurrently for every page window and ``merge`` the results.
+    """
+    windows = await asyncio.to_thread(document_windows, file)
+    if windows is None:
+        return await extract(file, [], None)
+    pages = windows[-1][0][1]
+    results = await asyncio.gather(
+        *(extract(window_file, [window_hint(window, pages)], window) for window, window_file in windows)
+    )
+    return merge(results)
@@ -0,0 +1,42 @@
+import asyncio
+import importlib.util
+import weakref
+
+import httpx
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+# httpx.AsyncClient pools are tied to the event loop that first used them.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def http_options() -> dict:
+    if settings.OPENAI_HTTP2 and importlib.util.find_spec('h2') is None:
+        raise ImproperlyConfigured('OPENAI_HTTP2 requires the h2 package: pip install "httpx[http2]"')
+
+    return {
+        'http2': settings.OPENAI_HTTP2,
+        'limits': httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        'timeout': httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+    }
+
+
+def get_async_client() -> AsyncOpenAI:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        # Retries are done by scanner.services.retries, under the adaptive limiter.
+        client = AsyncOpenAI(http_client=DefaultAsyncHttpxClient(**http_options()), max_retries=0)
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
@@ -1,9 +1,21 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAIError
 from dataclasses import dataclass
+from django.conf import settings
 from django.core.files.base import ContentFile
-import base64
+import hashlib
+import logging
+import time
+from .chunking import extract_in_windows, merge_answer_key, merge_student_exam
+from .clients import get_async_client
+from .pdf import async_document_input
+from .retries import call_with_retries
+from .streaming_json import ArrayItemParser
+from .usage import CallUsage
+from .validation import InvalidExtraction, validate_answer_key, validate_student_exam
 import json
 
+logger = logging.getLogger(__name__)
+
 ANSWER_KEY_PROMPT = """Extract all questions and their corresponding answers from an answer key document. For each question-answer pair:
 
 - Identify the full question number or label, supporting multiple languages or variants (such as "Soru 1:" or "Question 1:"). Use only the numerical value (e.g., 1).
@@ -190,95 +202,256 @@ STUDENT_EXAM_SCHEMA = {
 }
 
 
-@dataclass
-class ReadAnswerKeyService:
-    client: OpenAI
+def canonical_json(value) -> str:
+    """Serialize ``value`` byte-for-byte the same way every time, so request prefixes stay cacheable."""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
 
-    def __init__(self):
-        self.client = OpenAI()
 
-    def read_answer_key(self, file: ContentFile) -> list[dict]:
-        response = self.client.responses.create(
-            model="gpt-5",
-            input=[
-                {
-                    "role": "developer",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": ANSWER_KEY_PROMPT,
-                        }
-                    ],
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_file",
-                            "filename": "Cevap Anahtarı.pdf",
-                            "file_data": "data:application/pdf;base64,"
-                            + base64.b64encode(file.read()).decode("utf-8"),
-                        }
-                    ],
-                },
-            ],
-            text={
-                "format": ANSWER_KEY_SCHEMA,
-                "verbosity": "high",
-            },
-            reasoning={"effort": "minimal"},
-            store=True,
-        )
+def prompt_cache_key(kind: str, *parts) -> str:
+    digest = hashlib.sha256(canonical_json(parts).encode("utf-8")).hexdigest()[:16]
+    return f"{kind}-{digest}"
 
-        print(response.output_text)
 
-        return json.loads(response.output_text)
+@dataclass(frozen=True)
+class ModelTier:
+    model: str
+    effort: str
+    verbosity: str
 
 
-@dataclass
-class ReadStudentAnswersService:
-    client: OpenAI
+def extraction_tiers() -> list[ModelTier]:
+    """The models an extraction is tried with, cheapest first."""
+    tiers = [ModelTier(settings.EXTRACTION_MODEL, settings.EXTRACTION_EFFORT, settings.EXTRACTION_VERBOSITY)]
+    if settings.EXTRACTION_FALLBACK_MODEL:
+        tiers.append(
+            ModelTier(
+                settings.EXTRACTION_FALLBACK_MODEL, settings.EXTRACTION_FALLBACK_EFFORT, settings.EXTRACTION_FALLBACK_VERBOSITY
+            )
+        )
+    return tiers
 
-    def __init__(self):
-        self.client = OpenAI()
 
-    def read_student_answers(self, file: ContentFile) -> dict:
-        response = self.client.responses.create(
-            model="gpt-5",
-            input=[
-                {
-                    "role": "developer",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": STUDENT_EXAM_PROMPT,
-                        }
-                    ],
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_file",
-                            "filename": "Student_Exam.pdf",
-                            "file_data": "data:application/pdf;base64,"
-                            + base64.b64encode(file.read()).decode("utf-8"),
-                        }
-                    ],
-                },
-            ],
-            text={
-                "format": STUDENT_EXAM_SCHEMA,
-                "verbosity": "high",
+def answer_key_request(document: list[dict], tier: ModelTier | None = None) -> dict:
+    # Without a tier (no validation and escalation) the most capable one is used.
+    tier = tier or extraction_tiers()[-1]
+    return dict(
+        model=tier.model,
+        input=[
+            {
+                "role": "developer",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": ANSWER_KEY_PROMPT,
+                    }
+                ],
             },
-            reasoning={"effort": "minimal"},
-            store=True,
-        )
+            {
+                "role": "user",
+                "content": document,
+            },
+        ],
+        text={
+            "format": ANSWER_KEY_SCHEMA,
+            "verbosity": tier.verbosity,
+        },
+        reasoning={"effort": tier.effort},
+        prompt_cache_key=prompt_cache_key("answer_key", ANSWER_KEY_PROMPT, ANSWER_KEY_SCHEMA),
+        store=True,
+    )
 
-        print(response.output_text)
 
+def student_exam_request(document: list[dict], tier: ModelTier | None = None) -> dict:
+    tier = tier or extraction_tiers()[-1]
+    return dict(
+        model=tier.model,
+        input=[
+            {
+                "role": "developer",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": STUDENT_EXAM_PROMPT,
+                    }
+                ],
+            },
+            {
+                "role": "user",
+                "content": document,
+            },
+        ],
+        text={
+            "format": STUDENT_EXAM_SCHEMA,
+            "verbosity": tier.verbosity,
+        },
+        reasoning={"effort": tier.effort},
+        prompt_cache_key=prompt_cache_key("student_exam", STUDENT_EXAM_PROMPT, STUDENT_EXAM_SCHEMA),
+        store=True,
+    )
+
+
+async def create_response(client: AsyncOpenAI, request: dict, kind: str, metrics=None):
+    """
+    Send ``request`` with retries under the shared adaptive limiter, recording
+    its token usage or its failure in ``metrics``.
+    """
+    started = time.perf_counter()
+    try:
+        response = await call_with_retries(
+            lambda: client.responses.create(**request),
+            model=request["model"],
+            metrics=metrics,
+            stream=request.get("stream", False),
+        )
+    except OpenAIError as e:
+        if metrics:
+            metrics.record_error(request["model"], e)
+        raise
+    # Streamed responses report their usage on the final event instead.
+    if metrics and not request.get("stream"):
+        usage = CallUsage.from_response(kind, response, started)
+        if usage:
+            metrics.record_call(usage)
+    return response
+
+
+async def extract(client: AsyncOpenAI, request: dict, kind: str, metrics=None, on_question=None) -> dict:
+    """
+    Run an extraction request. With ``on_question`` the response is streamed
+    and every item of its "questions" array is passed to it as soon as the
+    item is complete, before the rest of the document is transcribed.
+    """
+    if on_question is None:
+        response = await create_response(client, request, kind, metrics)
         return json.loads(response.output_text)
 
+    started = time.perf_counter()
+    parser = ArrayItemParser("questions")
+    response_stream = await create_response(client, {**request, "stream": True}, kind, metrics)
+    async for event in response_stream:
+        if event.type == "response.output_text.delta":
+            for question in parser.feed(event.delta):
+                on_question(question)
+        elif event.type == "response.completed" and metrics:
+            usage = CallUsage.from_response(kind, event.response, started)
+            if usage:
+                metrics.record_call(usage)
+    return json.loads(parser.text)
+
+
+async def extract_routed(
+    client: AsyncOpenAI, build_request, kind: str, validate, metrics=None, on_question=None, on_reset=None
+) -> dict:
+    """
+    Extract with each of extraction_tiers() in turn until the output passes
+    ``await validate(result)``; ``build_request(tier)`` returns the request
+    for a tier.
+
+    The output of the last tier is returned even if it fails validation.
+    With ``on_question``, every tier sends its questions as they are read;
+    when a tier that sent some is rejected, ``on_reset()`` is called before
+    the next tier sends them again.
+    """
+    tiers = extraction_tiers()
+    for index, tier in enumerate(tiers):
+        last = index == len(tiers) - 1
+        sent = False
+        started = time.perf_counter()
+
+        def send(question):
+            nonlocal sent
+            sent = True
+            on_question(question)
+
+        try:
+            result = await extract(client, build_request(tier), kind, metrics, on_question and send)
+            await validate(result)
+        except (json.JSONDecodeError, InvalidExtraction) as e:
+            reason = e.reason if isinstance(e, InvalidExtraction) else "invalid_json"
+            if metrics:
+                metrics.record_extraction(kind, tier.model, index, time.perf_counter() - started, accepted=False)
+            if last:
+                if isinstance(e, json.JSONDecodeError):
+                    raise
+                logger.warning("%s extraction by %s kept despite failed validation: %s", kind, tier.model, e)
+                return result
+            if metrics:
+                metrics.count("scanner_extraction_escalations_total", kind=kind, model=tier.model, reason=reason)
+            logger.info("%s extraction by %s rejected (%s), retrying with %s", kind, tier.model, e, tiers[index + 1].model)
+            if sent and on_reset:
+                on_reset()
+            continue
+        if metrics:
+            metrics.record_extraction(kind, tier.model, index, time.perf_counter() - started, accepted=True)
+        return result
+
+
+@dataclass
+class AsyncReadAnswerKeyService:
+    client: AsyncOpenAI
+
+    def __init__(self, client: AsyncOpenAI | None = None, metrics=None):
+        self.client = client or get_async_client()
+        self.metrics = metrics
+
+    async def read_answer_key(self, file: ContentFile, report=None, on_question=None, on_reset=None) -> list[dict]:
+        async def extract_window(file, hints, window):
+            async def validate(result):
+                validate_answer_key(result, ANSWER_KEY_SCHEMA, window)
+
+            async with async_document_input(self.client, file, "Cevap Anahtarı.pdf") as (document, input_report):
+                result = await extract_routed(
+                    self.client,
+                    lambda tier: answer_key_request(hints + document, tier),
+                    "answer_key",
+                    validate,
+                    self.metrics,
+                    on_question and (lambda question: on_question(question, window)),
+                    on_reset and (lambda: on_reset(window)),
+                )
+            if report:
+                report({**input_report, "window": window})
+            return result
+
+        return await extract_in_windows(file, extract_window, merge_answer_key)
+
+
+@dataclass
+class AsyncReadStudentAnswersService:
+    client: AsyncOpenAI
+
+    def __init__(self, client: AsyncOpenAI | None = None, metrics=None):
+        self.client = client or get_async_client()
+        self.metrics = metrics
+
+    async def read_student_answers(
+        self, file: ContentFile, report=None, on_question=None, answer_key=None, on_reset=None
+    ) -> dict:
+        """
+        ``await answer_key()``, if given, returns the answer key (or None if it
+        could not be read) to check question numbers against; the document is
+        read meanwhile, only its validation waits.
+        """
+        async def extract_window(file, hints, window):
+            async def validate(result):
+                validate_student_exam(result, STUDENT_EXAM_SCHEMA, window, await answer_key() if answer_key else None)
+
+            async with async_document_input(self.client, file, "Student_Exam.pdf") as (document, input_report):
+                result = await extract_routed(
+                    self.client,
+                    lambda tier: student_exam_request(hints + document, tier),
+                    "student_exam",
+                    validate,
+                    self.metrics,
+                    on_question and (lambda question: on_question(question, window)),
+                    on_reset and (lambda: on_reset(window)),
+                )
+            if report:
+                report({**input_report, "window": window})
+            return result
+
+        return await extract_in_windows(file, extract_window, merge_student_exam)
+
 
 EVALUATE_STUDENT_ANSWERS_PROMPT = """Evaluate each student's exam answers against an answer key (both provided in JSON format), scoring each question out of 10 and providing objective, constructive feedback IN TURKISH. You will evaluate EACH STUDENT SEPARATELY, one after another.
 
@@ -371,73 +544,213 @@ Excellent answer that fully captures the essence of Goethe's quote. The student
 - Always end each student's evaluation with the summary report"""
 
 
-@dataclass
-class EvaluateStudentAnswersService:
-    client: OpenAI
+STRUCTURED_EVALUATION_PROMPT = """Evaluate each student's exam answers against an answer key (both provided in JSON format). Score every question of every student out of 10 and justify each score IN TURKISH.
 
-    def __init__(self):
-        self.client = OpenAI()
+Scoring Guide:
+- 10: Fully correct and complete
+- 7-9: Mostly correct but some details missing
+- 5-6: Basic understanding but superficial or incomplete
+- 3-4: Major parts missing or misunderstood
+- 0-2: Off-topic, incorrect, or blank
 
-    def evaluate_student_answers(self, student_answers: list[dict], answer_key: dict):
-        inputs = [
-            {
-                "role": "developer",
-                "content": [
-                    {"type": "input_text", "text": EVALUATE_STUDENT_ANSWERS_PROMPT}
-                ],
-            },
-            {
-                "role": "assistant",
-                "content": [
-                    {
-                        "type": "output_text",
-                        "text": str(answer_key),
-                    }
-                ],
-            },
-        ]
-        for student_answer in student_answers:
-            inputs.append(
+For each student return:
+- student_name: the student's name as given
+- questions: one entry per question in the student's "questions", in order, with question_number, an integer score from 0 to 10, and rationale: ONE short Turkish sentence comparing the answer to the answer key
+- strengths (Güçlü Yönler), weaknesses (Zayıf Yönler) and knowledge_gaps (Konu Boşlukları): one short Turkish sentence each
+
+Some students also have "scored": questions that already have a score. Do not return them, but take their scores into account in strengths, weaknesses and knowledge gaps.
+
+# Notes
+- Do not compute averages or totals; they are calculated from your scores
+- Do not repeat question texts or student answers
+- ALL TEXT MUST BE IN TURKISH"""
+
+EVALUATION_SCHEMA = {
+    "type": "json_schema",
+    "name": "evaluation",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "students": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "student_name": {"type": "string"},
+                        "questions": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "question_number": {"type": "integer"},
+                                    "score": {"type": "integer", "minimum": 0, "maximum": 10},
+                                    "rationale": {"type": "string"},
+                                },
+                                "required": ["question_number", "score", "rationale"],
+                                "additionalProperties": False,
+                            },
+                        },
+                        "strengths": {"type": "string"},
+                        "weaknesses": {"type": "string"},
+                        "knowledge_gaps": {"type": "string"},
+                    },
+                    "required": ["student_name", "questions", "strengths", "weaknesses", "knowledge_gaps"],
+                    "additionalProperties": False,
+                },
+            }
+        },
+        "required": ["students"],
+        "additionalProperties": False,
+    },
+}
+
+
+def evaluation_request(student_answers: list[dict], answer_key: dict, structured: bool | None = None) -> dict:
+    """
+    Evaluation of ``student_answers``: free Turkish text, or with ``structured``
+    (default: EVALUATION_FORMAT == 'json') scores in EVALUATION_SCHEMA that
+    are aggregated and rendered by scanner.services.scores.
+    """
+    if structured is None:
+        structured = settings.EVALUATION_FORMAT == "json"
+    prompt = STRUCTURED_EVALUATION_PROMPT if structured else EVALUATE_STUDENT_ANSWERS_PROMPT
+    # Fixed prompt first, then the answer key, then the students: everything
+    # before the students is identical for a class and can be served from the
+    # provider's prompt cache.
+    inputs = [
+        {
+            "role": "developer",
+            "content": [
+                {"type": "input_text", "text": prompt}
+            ],
+        },
+        {
+            "role": "assistant",
+            "content": [
                 {
-                    "role": "assistant",
-                    "content": [{"type": "output_text", "text": str(student_answer)}],
+                    "type": "output_text",
+                    "text": canonical_json(answer_key),
                 }
-            )
-        response = self.client.responses.create(
-            model="gpt-5",
-            input=inputs,
-            text={"format": {"type": "text"}, "verbosity": "medium"},
-            reasoning={"effort": "medium"},
-            tools=[],
-            store=True,
-            include=["reasoning.encrypted_content", "web_search_call.action.sources"],
-            stream=True,
+            ],
+        },
+    ]
+    for student_answer in student_answers:
+        inputs.append(
+            {
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": canonical_json(student_answer)}],
+            }
+        )
+    verbosity = settings.EVALUATION_VERBOSITY or ("low" if structured else "medium")
+    return dict(
+        model=settings.EVALUATION_MODEL,
+        input=inputs,
+        text={"format": EVALUATION_SCHEMA if structured else {"type": "text"}, "verbosity": verbosity},
+        reasoning={"effort": settings.EVALUATION_EFFORT},
+        tools=[],
+        prompt_cache_key=prompt_cache_key("evaluation", prompt, answer_key),
+        store=True,
+        include=["reasoning.encrypted_content", "web_search_call.action.sources"],
+        stream=True,
+    )
+
+
+@dataclass
+class AsyncEvaluateStudentAnswersService:
+    client: AsyncOpenAI
+
+    def __init__(self, client: AsyncOpenAI | None = None, metrics=None):
+        self.client = client or get_async_client()
+        self.metrics = metrics
+
+    async def evaluate_student_answers(self, student_answers: list[dict], answer_key: dict):
+        response = await create_response(
+            self.client, evaluation_request(student_answers, answer_key), "evaluation", self.metrics
         )
 
         return response
 
 
+def continue_chat_request(response_id: str, message: str) -> dict:
+    return dict(
+        previous_response_id=response_id,
+        model=settings.CHAT_MODEL,
+        text={"format": {"type": "text"}, "verbosity": settings.CHAT_VERBOSITY},
+        reasoning={"effort": settings.CHAT_EFFORT},
+        input=[
+            {
+                "role": "user",
+                "content": message
+            }
+        ],
+        store=True,
+        stream=True,
+    )
+
+
+CONVERSATION_PROMPT = """You answer a teacher's follow-up questions about exams that have already been graded. ANSWER IN TURKISH.
+
+You are given the answer key, then the graded records the question is about: for each student their answers, the score (out of 10) and rationale per question, the average and the summary report. Questions about the whole class come with every student's scores only. Earlier turns of the conversation are given as a short summary and the most recent turns verbatim.
+
+- Base every statement on the records given; if they do not contain what is asked, say so
+- Keep the scores as they are unless the teacher asks you to reconsider one, and then explain the change
+- Be brief and concrete"""
+
+
+def conversation_request(conversation, message: str, context: dict) -> dict:
+    # The prompt and answer key stay the same for the whole conversation and
+    # come first so they are served from the prompt cache after the first turn.
+    inputs = [
+        {"role": "developer", "content": [{"type": "input_text", "text": CONVERSATION_PROMPT}]},
+        {"role": "developer", "content": [{"type": "input_text", "text": canonical_json(conversation.answer_key)}]},
+    ]
+    if conversation.summary:
+        inputs.append({
+            "role": "developer",
+            "content": [{"type": "input_text", "text": "Önceki konuşmanın özeti:\n" + conversation.summary}],
+        })
+    for turn in conversation.turns:
+        inputs.append({"role": "user", "content": [{"type": "input_text", "text": turn["question"]}]})
+        inputs.append({"role": "assistant", "content": [{"type": "output_text", "text": turn["answer"]}]})
+    inputs.append({"role": "developer", "content": [{"type": "input_text", "text": canonical_json(context)}]})
+    inputs.append({"role": "user", "content": [{"type": "input_text", "text": message}]})
+    return dict(
+        model=settings.CHAT_MODEL,
+        input=inputs,
+        text={"format": {"type": "text"}, "verbosity": settings.CHAT_VERBOSITY},
+        reasoning={"effort": settings.CHAT_EFFORT},
+        prompt_cache_key=prompt_cache_key("conversation", conversation.pk),
+        # Each turn carries its own context; nothing is chained on the provider side.
+        store=False,
+        stream=True,
+    )
+
+
 @dataclass
-class ContuniueChatService:
-    client: OpenAI
-
-    def __init__(self):
-        self.client = OpenAI()
-
-    def continue_chat(self, response_id: str, message: str):
-        response_stream = self.client.responses.create(
-            previous_response_id=response_id,
-            model="gpt-5",
-            text={"format": {"type": "text"}, "verbosity": "medium"},
-            reasoning={"effort": "medium"},
-            input=[
-                {
-                    "role": "user",
-                    "content": message
-                }
-            ],
-            store=True,
-            stream=True,
+class AsyncConversationChatService:
+    client: AsyncOpenAI
+
+    def __init__(self, client: AsyncOpenAI | None = None, metrics=None):
+        self.client = client or get_async_client()
+        self.metrics = metrics
+
+    async def continue_conversation(self, conversation, message: str, context: dict):
+        return await create_response(
+            self.client, conversation_request(conversation, message, context), "conversation", self.metrics
+        )
+
+
+@dataclass
+class AsyncContuniueChatService:
+    client: AsyncOpenAI
+
+    def __init__(self, client: AsyncOpenAI | None = None):
+        self.client = client or get_async_client()
+
+    async def continue_chat(self, response_id: str, message: str):
+        response_stream = await self.client.responses.create(
+            **continue_chat_request(response_id, message)
         )
 
-        return response_stream
\ No newline at end of file
+        return response_stream
@@ -0,0 +1,114 @@
+import asyncio
+import base64
+import os
+import time
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from openai import AsyncOpenAI
+
+from .retries import call_with_retries
+from .text_layer import input_report, pages_text, read_text_layer, select_pages
+
+DATA_URL_PREFIX = b"data:application/pdf;base64,"
+
+
+def pdf_data_url(file, chunk_size: int | None = None) -> str:
+    """
+    Base64-encode ``file`` as a data URL, one chunk at a time.
+
+    The raw PDF is read ``chunk_size`` bytes at a time, but the encoded
+    buffer and the returned string are each held in full, and the request
+    body copies it again; uses_files_api() keeps large PDFs off this path.
+    """
+    chunk_size = chunk_size or settings.PDF_ENCODE_CHUNK_SIZE
+    # Chunks must be a multiple of 3 bytes so their encodings concatenate without padding.
+    chunk_size -= chunk_size % 3
+    buffer = bytearray(DATA_URL_PREFIX)
+    file.seek(0)
+    while chunk := file.read(chunk_size):
+        buffer += base64.b64encode(chunk)
+    return buffer.decode("ascii")
+
+
+def pdf_size(file) -> int:
+    size = getattr(file, "size", None)
+    if size is None:
+        position = file.tell()
+        size = file.seek(0, os.SEEK_END)
+        file.seek(position)
+    return size
+
+
+def uses_files_api(file) -> bool:
+    """Whether ``file`` is sent through the Files API rather than inline, see PDF_UPLOAD_MODE."""
+    if settings.PDF_UPLOAD_MODE == "auto":
+        return pdf_size(file) > settings.PDF_INLINE_MAX_BYTES
+    return settings.PDF_UPLOAD_MODE == "file"
+
+
+def inline_pdf_part(file, filename: str) -> dict:
+    return {
+        "type": "input_file",
+        "filename": filename,
+        "file_data": pdf_data_url(file),
+    }
+
+
+def file_pdf_part(file_id: str) -> dict:
+    return {"type": "input_file", "file_id": file_id}
+
+
+@asynccontextmanager
+async def async_pdf_input(client: AsyncOpenAI, file, filename: str):
+    """
+    Yield the ``input_file`` content part for ``file``.
+
+    PDFs sent through the Files API (see uses_files_api()) are streamed to
+    it and referenced by id, then deleted once the request is done.
+    """
+    if not uses_files_api(file):
+        yield inline_pdf_part(file, filename)
+        return
+
+    def upload():
+        file.seek(0)
+        return client.files.create(file=(filename, file, "application/pdf"), purpose="user_data")
+
+    uploaded = await call_with_retries(upload)
+    try:
+        yield file_pdf_part(uploaded.id)
+    finally:
+        await call_with_retries(lambda: client.files.delete(uploaded.id))
+
+
+def document_plan(file):
+    """
+    Decide how to send an exam PDF: returns (text part, PDF to attach, input report).
+
+    Pages with a usable text layer become one ``input_text`` part; only the
+    scanned pages are left to attach as a PDF. Either may be None.
+    """
+    started = time.perf_counter()
+    layer = read_text_layer(file)
+    if layer is None or not layer.text_pages:
+        text_part, attachment = None, file
+    elif not layer.scanned_pages:
+        text_part, attachment = {"type": "input_text", "text": pages_text(layer)}, None
+    else:
+        text_part = {"type": "input_text", "text": pages_text(layer)}
+        attachment = select_pages(file, layer.scanned_pages)
+    return text_part, attachment, input_report(layer, (time.perf_counter() - started) * 1000)
+
+
+@asynccontextmanager
+async def async_document_input(client: AsyncOpenAI, file, filename: str):
+    """Yield (content parts, input report) for an exam PDF, see document_plan()."""
+    text_part, attachment, report = await asyncio.to_thread(document_plan, file)
+    parts = [text_part] if text_part else []
+    if attachment is None:
+        yield parts, report
+        return
+
+    async with async_pdf_input(client, attachment, filename) as part:
+        yield parts + [part], report
@@ -0,0 +1,275 @@
+"""
+Verdicts for student answers that are known before the model is asked.
+
+Blank answers ("", "bilmiyorum", ...) and answers that repeat the answer
+key are scored locally. Scores the model gave earlier are cached per
+(answer key, question, normalized answer), so any other answer is judged
+once per answer key, across students and uploads. Only the answers without
+a known verdict are sent for evaluation; the rest are merged back locally.
+"""
+import asyncio
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from ..conversations import fold
+from ..models import AnswerScore
+from .cache import extraction_version
+from .openai import EVALUATION_SCHEMA, STRUCTURED_EVALUATION_PROMPT, canonical_json
+from .scores import MAX_SCORE
+
+EVALUATION_VERSION = extraction_version(STRUCTURED_EVALUATION_PROMPT, EVALUATION_SCHEMA)
+
+PUNCTUATION = re.compile(r"[^\w\s]")
+
+# Compared after normalize_answer and strip_diacritics. Short words that
+# can be real answers ("yok", "x") are left to the model.
+BLANK_ANSWERS = {
+    "", "bilmiyorum", "bilmiyorum hocam", "hatirlamiyorum", "fikrim yok", "cevap yok", "bos", "bos birakildi",
+    "i dont know", "idk",
+}
+
+LOCAL_VERDICTS = {
+    "blank": {"score": 0, "rationale": "Cevap verilmemiş."},
+    "exact": {"score": MAX_SCORE, "rationale": "Cevap, cevap anahtarıyla aynı."},
+}
+
+
+def normalize_answer(text: str) -> str:
+    text = fold(unicodedata.normalize("NFKC", text or ""))
+    return " ".join(PUNCTUATION.sub(" ", text).split())
+
+
+def strip_diacritics(text: str) -> str:
+    """ASCII-fold a normalized answer ("ışık" -> "isik") for comparisons that ignore Turkish keyboard differences."""
+    text = unicodedata.normalize("NFKD", text.replace("ı", "i"))
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def shingles(text: str, size: int = 3) -> set[str]:
+    text = f" {text} "
+    return {text[i:i + size] for i in range(max(len(text) - size + 1, 1))}
+
+
+def jaccard(first: set, second: set) -> float:
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+def similarity(answer: str, expected: str) -> float:
+    """Overlap of the word sets and of the character 3-shingles; the lower of the two."""
+    if answer == expected:
+        return 1.0
+    return min(jaccard(set(answer.split()), set(expected.split())), jaccard(shingles(answer), shingles(expected)))
+
+
+def local_source(answer: str, expected: str | None) -> str | None:
+    """"blank" or "exact" when ``answer`` can be scored without the model."""
+    answer = strip_diacritics(normalize_answer(answer))
+    # Before the blanks: "Bilmiyorum" is right when the answer key says so.
+    if expected is not None:
+        expected = strip_diacritics(normalize_answer(expected))
+        if expected and similarity(answer, expected) >= settings.PRESCORE_EXACT_THRESHOLD:
+            return "exact"
+    if answer in BLANK_ANSWERS:
+        return "blank"
+    return None
+
+
+def answer_key_hash(answer_key: dict) -> str:
+    return hashlib.sha256(canonical_json(answer_key).encode("utf-8")).hexdigest()
+
+
+def answer_hash(question_number: int, answer: str) -> str:
+    return hashlib.sha256(f"{question_number}\n{normalize_answer(answer)}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ScoreCache:
+    max_entries: int = field(default_factory=lambda: settings.SCORE_CACHE_MAX_ENTRIES)
+    ttl: timedelta = field(default_factory=lambda: timedelta(seconds=settings.SCORE_CACHE_TTL))
+
+    async def get_many(self, key_hash: str, hashes: list[str]) -> dict[str, dict]:
+        now = timezone.now()
+        rows = [
+            row
+            async for row in AnswerScore.objects.filter(
+                answer_key_hash=key_hash,
+                evaluation_version=EVALUATION_VERSION,
+                answer_hash__in=hashes,
+                created_at__gte=now - self.ttl,
+            )
+        ]
+        if rows:
+            await AnswerScore.objects.filter(pk__in=[row.pk for row in rows]).aupdate(
+                hits=F("hits") + 1, last_used_at=now
+            )
+        return {row.answer_hash: {"score": row.score, "rationale": row.rationale} for row in rows}
+
+    async def put_many(self, key_hash: str, verdicts: dict[str, tuple[int, dict]]):
+        if not verdicts:
+            return
+        await AnswerScore.objects.abulk_create(
+            [
+                AnswerScore(
+                    answer_key_hash=key_hash,
+                    evaluation_version=EVALUATION_VERSION,
+                    answer_hash=hash_,
+                    question_number=question_number,
+                    score=verdict["score"],
+                    rationale=verdict["rationale"],
+                )
+                for hash_, (question_number, verdict) in verdicts.items()
+            ],
+            ignore_conflicts=True,
+        )
+        await self.evict()
+
+    async def evict(self):
+        await AnswerScore.objects.filter(created_at__lt=timezone.now() - self.ttl).adelete()
+
+        stale = [
+            pk
+            async for pk in AnswerScore.objects.order_by("-last_used_at").values_list("pk", flat=True)[
+                self.max_entries:
+            ]
+        ]
+        if stale:
+            await AnswerScore.objects.filter(pk__in=stale).adelete()
+
+
+class Prescorer:
+    """Known verdicts for the answers of one class, counted per source in ``metrics``."""
+
+    def __init__(self, answer_key: dict, metrics=None, cache: ScoreCache | None = None):
+        self.key_hash = answer_key_hash(answer_key)
+        self.expected = {question["question_number"]: question.get("answer") for question in answer_key.get("questions", [])}
+        self.metrics = metrics
+        self.cache = cache or ScoreCache()
+        self.sources = {}
+        # Answer hash -> verdict of an answer a student of this class is (or was) being scored for.
+        self.inflight: dict[str, asyncio.Future] = {}
+
+    def count(self, source: str, answers: int):
+        if not answers:
+            return
+        self.sources[source] = self.sources.get(source, 0) + answers
+        if self.metrics:
+            self.metrics.count("scanner_scored_answers_total", answers, source=source)
+
+    async def known(self, student_answer: dict) -> dict[int, dict]:
+        """question_number -> {"score", "rationale"} for every answer that needs no model call."""
+        known = {}
+        local = {source: 0 for source in LOCAL_VERDICTS}
+        hashes = {}
+        for question in student_answer.get("questions", []):
+            number = question["question_number"]
+            source = local_source(question["student_answer"], self.expected.get(number)) if settings.PRESCORE_LOCAL else None
+            if source:
+                known[number] = dict(LOCAL_VERDICTS[source])
+                local[source] += 1
+            else:
+                hashes[number] = answer_hash(number, question["student_answer"])
+        for source, answers in local.items():
+            self.count(source, answers)
+
+        cached = await self.cache.get_many(self.key_hash, list(hashes.values())) if hashes else {}
+        hits = {number: cached[hash_] for number, hash_ in hashes.items() if hash_ in cached}
+        self.count("cache", len(hits))
+        return {**known, **hits}
+
+    async def claim(self, student_answer: dict) -> tuple[dict[int, dict], dict[int, asyncio.Future], set[str]]:
+        """
+        known() for one of several students evaluated at the same time. Answers
+        another student is already being scored for are returned as futures
+        of that verdict, to be awaited once this student's own request is
+        sent; the rest are claimed until remember() or release(), so every
+        normalized answer is asked once however the students are scheduled.
+        """
+        known = await self.known(student_answer)
+        shared, claimed = {}, set()
+        loop = asyncio.get_running_loop()
+        for question in student_answer.get("questions", []):
+            number = question["question_number"]
+            if number in known:
+                continue
+            hash_ = answer_hash(number, question["student_answer"])
+            if hash_ in self.inflight:
+                shared[number] = self.inflight[hash_]
+            else:
+                self.inflight[hash_] = loop.create_future()
+                claimed.add(hash_)
+        return known, shared, claimed
+
+    async def shared_verdicts(self, shared: dict[int, asyncio.Future]) -> dict[int, dict]:
+        verdicts = dict(zip(shared, await asyncio.gather(*shared.values())))
+        verdicts = {number: verdict for number, verdict in verdicts.items() if verdict is not None}
+        self.count("duplicate", len(verdicts))
+        return verdicts
+
+    def release(self, claimed: set[str]):
+        """
+        Unblock the students waiting on claimed answers the model gave no
+        verdict for; they send those answers in a request of their own.
+        """
+        for hash_ in claimed:
+            if not self.inflight[hash_].done():
+                self.inflight[hash_].set_result(None)
+
+    def share_duplicates(self, pending: list[dict]) -> dict[int, dict[int, str]]:
+        """
+        Drop answers identical to one asked earlier in the same request from
+        ``pending`` and return student -> {question_number: answer hash} for them.
+        """
+        seen = set()
+        duplicates = {}
+        for index, student in enumerate(pending):
+            questions = []
+            for question in student["questions"]:
+                hash_ = answer_hash(question["question_number"], question["student_answer"])
+                if hash_ in seen:
+                    duplicates.setdefault(index, {})[question["question_number"]] = hash_
+                else:
+                    seen.add(hash_)
+                    questions.append(question)
+            student["questions"] = questions
+        return duplicates
+
+    def fill_duplicates(self, known: list[dict], duplicates: dict[int, dict[int, str]], verdicts: dict[str, dict]):
+        """Give the dropped duplicates the verdict of the answer they repeat."""
+        for index, hashes in duplicates.items():
+            filled = {number: verdicts[hash_] for number, hash_ in hashes.items() if hash_ in verdicts}
+            known[index].update(filled)
+            self.count("duplicate", len(filled))
+
+    async def remember(self, student_answer: dict, scored: list[dict]) -> dict[str, dict]:
+        """Cache the verdicts the model gave for ``student_answer``; returns them by answer hash."""
+        answers = {question["question_number"]: question["student_answer"] for question in student_answer.get("questions", [])}
+        verdicts = {
+            answer_hash(question["question_number"], answers[question["question_number"]]): (
+                question["question_number"],
+                {"score": question["score"], "rationale": question["rationale"]},
+            )
+            for question in scored
+            if question["question_number"] in answers
+        }
+        self.count("model", len(verdicts))
+        for hash_, (_, verdict) in verdicts.items():
+            future = self.inflight.get(hash_)
+            if future is not None and not future.done():
+                future.set_result(verdict)
+        await self.cache.put_many(self.key_hash, verdicts)
+        return {hash_: verdict for hash_, (_, verdict) in verdicts.items()}
+
+    def report(self) -> dict:
+        answers = sum(self.sources.values())
+        return {
+            "answers": answers,
+            "sources": self.sources,
+            "skipped_rate": round(1 - self.sources.get("model", 0) / answers, 3) if answers else 0.0,
+        }
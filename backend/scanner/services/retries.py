@@ -0,0 +1,182 @@
+import asyncio
+import email.utils
+import logging
+import random
+import re
+import time
+import weakref
+
+from django.conf import settings
+from openai import APIConnectionError, APIStatusError
+
+logger = logging.getLogger(__name__)
+
+# Limiters are per event loop, like the async clients they throttle.
+_limiters = weakref.WeakKeyDictionary()
+
+RETRYABLE_STATUSES = {408, 409, 429}
+OVERLOAD_STATUSES = {429, 503}
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for OpenAI requests that adapts with AIMD.
+
+    Every successful request adds 1/limit, so the limit grows by one per
+    round of successes; a rate limit multiplies it by ``backoff``. Only one
+    decrease happens per round: requests that started before the last
+    decrease do not shrink the limit again.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, backoff: float):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._waiters = []
+
+    async def acquire(self) -> float:
+        """Wait for a free slot and return the time the request started."""
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self.in_flight += 1
+        return time.monotonic()
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def on_overload(self, started: float):
+        if started < self._last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        self._last_decrease = time.monotonic()
+        logger.warning("OpenAI is rate limiting; concurrency lowered to %d", int(self.limit))
+
+    def _wake(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+def get_limiter() -> AdaptiveLimiter:
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = AdaptiveLimiter(
+            initial=settings.OPENAI_MAX_CONCURRENCY,
+            minimum=settings.OPENAI_MIN_CONCURRENCY,
+            maximum=settings.OPENAI_MAX_CONCURRENCY_LIMIT,
+            backoff=settings.OPENAI_CONCURRENCY_BACKOFF,
+        )
+        _limiters[loop] = limiter
+    return limiter
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (
+        error.status_code in RETRYABLE_STATUSES or error.status_code >= 500
+    )
+
+
+def parse_duration(value: str) -> float | None:
+    """Parse rate-limit reset durations such as "1s", "20ms" or "6m0s"."""
+    parts = re.fullmatch(r"(?:(\d+(?:\.\d+)?)h)?(?:(\d+(?:\.\d+)?)m(?!s))?(?:(\d+(?:\.\d+)?)s)?(?:(\d+(?:\.\d+)?)ms)?", value)
+    if not parts or not any(parts.groups()):
+        return None
+    hours, minutes, seconds, milliseconds = (float(part or 0) for part in parts.groups())
+    return hours * 3600 + minutes * 60 + seconds + milliseconds / 1000
+
+
+def header_delay(headers) -> float | None:
+    """Delay asked for by the response headers, if any."""
+    if value := headers.get("retry-after-ms"):
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    if value := headers.get("retry-after"):
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            if retry_at is not None:
+                return max(retry_at.timestamp() - time.time(), 0)
+    # Wait for the reset of whichever limit is used up.
+    resets = [
+        parse_duration(headers.get(f"x-ratelimit-reset-{limit}", ""))
+        for limit in ("requests", "tokens")
+        if headers.get(f"x-ratelimit-remaining-{limit}") == "0"
+    ]
+    resets = [reset for reset in resets if reset is not None]
+    return max(resets) if resets else None
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    delay = header_delay(error.response.headers) if isinstance(error, APIStatusError) else None
+    if delay is None:
+        # Full jitter: anywhere up to the exponential backoff for this attempt.
+        return random.uniform(0, min(settings.OPENAI_RETRY_MAX_DELAY, settings.OPENAI_RETRY_BASE_DELAY * 2 ** attempt))
+    # A little jitter so requests told to wait the same time do not return together.
+    return min(settings.OPENAI_RETRY_MAX_DELAY, delay * random.uniform(1, 1.1))
+
+
+async def release_after(stream, limiter: AdaptiveLimiter):
+    try:
+        async for event in stream:
+            yield event
+    finally:
+        limiter.release()
+
+
+async def call_with_retries(call, model: str = "", metrics=None, stream: bool = False):
+    """
+    Run ``call()`` (an OpenAI request) under the shared adaptive limiter,
+    retrying rate limits and transient failures.
+
+    With ``stream`` the slot is held until the returned stream is consumed.
+    """
+    limiter = get_limiter()
+    attempt = 0
+    while True:
+        started = await limiter.acquire()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            limiter.release()
+            raise
+        except Exception as e:
+            limiter.release()
+            if isinstance(e, APIStatusError) and e.status_code in OVERLOAD_STATUSES:
+                limiter.on_overload(started)
+            if not is_retryable(e) or attempt >= settings.OPENAI_MAX_RETRIES:
+                raise
+            delay = retry_delay(e, attempt)
+            attempt += 1
+            status = getattr(e, "status_code", "connection")
+            logger.warning("OpenAI request failed (%s), retry %d in %.2fs", status, attempt, delay)
+            if metrics:
+                metrics.count("scanner_retries_total", model=model, status=status)
+            await asyncio.sleep(delay)
+            continue
+
+        limiter.on_success()
+        if stream:
+            return release_after(result, limiter)
+        limiter.release()
+        return result
@@ -0,0 +1,129 @@
+"""
+Scores from structured (EVALUATION_FORMAT='json') evaluations: averages and
+class statistics are computed here instead of by the model, and the Turkish
+report is rendered from the parsed result.
+"""
+import json
+import statistics
+
+MAX_SCORE = 10
+
+STUDENT_SEPARATOR = "\n\n---\n\n"
+
+
+def format_score(value: float) -> str:
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def parse_evaluation(text: str) -> list[dict]:
+    """The students of a structured evaluation, with scores clamped to 0-10."""
+    students = json.loads(text)["students"]
+    for student in students:
+        for question in student["questions"]:
+            question["score"] = min(max(question["score"], 0), MAX_SCORE)
+        student["average"] = student_average(student)
+    return students
+
+
+def student_average(student: dict) -> float:
+    scores = [question["score"] for question in student["questions"]]
+    return round(statistics.fmean(scores), 2) if scores else 0.0
+
+
+def pending_answers(student_answer: dict, known: dict[int, dict]) -> dict:
+    """``student_answer`` with only the questions that still need a verdict, and the known scores."""
+    pending = {
+        **student_answer,
+        "questions": [q for q in student_answer.get("questions", []) if q["question_number"] not in known],
+    }
+    if known:
+        pending["scored"] = [{"question_number": number, "score": known[number]["score"]} for number in sorted(known)]
+    return pending
+
+
+def merge_known(student: dict, known: dict[int, dict]) -> dict:
+    """Add the known verdicts to a student the model evaluated, and recompute the average."""
+    questions = [q for q in student["questions"] if q["question_number"] not in known]
+    questions += [{"question_number": number, **verdict} for number, verdict in known.items()]
+    student = {**student, "questions": sorted(questions, key=lambda question: question["question_number"])}
+    student["average"] = student_average(student)
+    return student
+
+
+def local_student(student_answer: dict, known: dict[int, dict]) -> dict:
+    """A student whose every answer has a known verdict, summarized without the model."""
+    student = merge_known(
+        {"student_name": student_answer.get("student_name") or "", "questions": []}, known
+    )
+    strong = [q["question_number"] for q in student["questions"] if q["score"] >= 7]
+    weak = [q for q in student["questions"] if q["score"] <= 4]
+    student["strengths"] = (
+        f"{question_list(strong)} tam veya tama yakın cevaplanmış." if strong else "Belirgin bir güçlü yön yok."
+    )
+    student["weaknesses"] = (
+        f"{question_list([q['question_number'] for q in weak])} zayıf veya boş." if weak else "Belirgin bir zayıf yön yok."
+    )
+    student["knowledge_gaps"] = " ".join(f"Soru {q['question_number']}: {q['rationale']}" for q in weak) or "-"
+    return student
+
+
+def question_list(numbers: list[int]) -> str:
+    return ", ".join(f"Soru {number}" for number in numbers)
+
+
+def render_student(student: dict) -> str:
+    lines = [f"{student['student_name']}:", ""]
+    for question in student["questions"]:
+        lines += [f"Soru {question['question_number']}: {MAX_SCORE} üzerinden {question['score']}", question["rationale"], ""]
+    lines += [
+        f"Genel Ortalama: {format_score(student['average'])}/{MAX_SCORE}",
+        "",
+        "Özet Rapor:",
+        f"Güçlü Yönler: {student['strengths']}",
+        f"Zayıf Yönler: {student['weaknesses']}",
+        f"Konu Boşlukları: {student['knowledge_gaps']}",
+    ]
+    return "\n".join(lines)
+
+
+def render_evaluation(students: list[dict]) -> str:
+    return STUDENT_SEPARATOR.join(render_student(student) for student in students)
+
+
+def class_statistics(students: list[dict]) -> dict:
+    averages = [student["average"] for student in students]
+    if not averages:
+        return {"students": 0}
+
+    by_question = {}
+    for student in students:
+        for question in student["questions"]:
+            by_question.setdefault(question["question_number"], []).append(question["score"])
+    return {
+        "students": len(averages),
+        "mean": round(statistics.fmean(averages), 2),
+        "median": round(statistics.median(averages), 2),
+        "stdev": round(statistics.pstdev(averages), 2),
+        "min": min(averages),
+        "max": max(averages),
+        "questions": {
+            number: round(statistics.fmean(scores), 2) for number, scores in sorted(by_question.items())
+        },
+    }
+
+
+def render_statistics(summary: dict) -> str:
+    if not summary["students"]:
+        return ""
+    lines = [
+        "Sınıf Özeti:",
+        f"Öğrenci Sayısı: {summary['students']}",
+        f"Sınıf Ortalaması: {format_score(summary['mean'])}/{MAX_SCORE}",
+        f"Medyan: {format_score(summary['median'])}/{MAX_SCORE}",
+        f"En Düşük / En Yüksek: {format_score(summary['min'])} / {format_score(summary['max'])}",
+    ]
+    lines += [
+        f"Soru {number} Ortalaması: {format_score(mean)}/{MAX_SCORE}"
+        for number, mean in summary["questions"].items()
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,87 @@
+import json
+from collections import deque
+
+
+class ArrayItemParser:
+    """
+    Finds the items of one top-level array field (such as "questions") in
+    JSON that arrives in pieces, returning each item as soon as it closes.
+
+    Only brackets and strings are tracked and every character is scanned
+    once, so feeding is linear in the length of the output. Deltas are kept
+    only while they hold part of an unfinished item or key, and joined once
+    when it closes; the whole output is kept as a list of deltas and joined
+    once, by ``text``.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self._parts = []
+        # Deltas still needed, the first starting at offset _base of the output.
+        self._chunks = deque()
+        self._base = 0
+        # "".join(self._chunks), made when first needed after a change.
+        self._joined = None
+        self._length = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+        self._last_key = None
+        self._in_array = False
+        self._item_start = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def _slice(self, start: int, end: int) -> str:
+        if self._joined is None:
+            self._joined = "".join(self._chunks)
+        return self._joined[start - self._base:end - self._base]
+
+    def feed(self, delta: str) -> list:
+        self._parts.append(delta)
+        self._chunks.append(delta)
+        self._joined = None
+        items = []
+        offset = self._length
+        for index, char in enumerate(delta, offset):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = self._slice(self._string_start, index)
+            elif char == '"':
+                self._in_string = True
+                self._string_start = index + 1
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._depth == 2 and self._last_key == self.field:
+                    self._in_array = True
+                elif self._in_array and self._depth == 3:
+                    self._item_start = index
+            elif char in "}]":
+                if self._in_array and self._depth == 3 and self._item_start is not None:
+                    items.append(json.loads(self._slice(self._item_start, index + 1)))
+                    self._item_start = None
+                elif self._in_array and self._depth == 2:
+                    self._in_array = False
+                self._depth -= 1
+        self._length += len(delta)
+        self._trim()
+        return items
+
+    def _trim(self):
+        keep = self._length
+        if self._item_start is not None:
+            keep = self._item_start
+        elif self._in_string:
+            keep = self._string_start
+        while self._chunks and self._base + len(self._chunks[0]) <= keep:
+            self._base += len(self._chunks.popleft())
+            self._joined = None
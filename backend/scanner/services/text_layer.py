@@ -0,0 +1,104 @@
+import io
+import logging
+from dataclasses import dataclass
+
+from django.conf import settings
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PyPdfError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TextLayer:
+    # Extracted text per page, None where the page has no usable text layer.
+    pages: list[str | None]
+
+    @property
+    def text_pages(self) -> list[int]:
+        return [number for number, text in enumerate(self.pages, start=1) if text is not None]
+
+    @property
+    def scanned_pages(self) -> list[int]:
+        return [number for number, text in enumerate(self.pages, start=1) if text is None]
+
+
+def has_usable_text(text: str) -> bool:
+    characters = "".join(text.split())
+    if len(characters) < settings.TEXT_LAYER_MIN_CHARS:
+        return False
+    letters = sum(character.isalnum() for character in characters)
+    return letters / len(characters) >= settings.TEXT_LAYER_MIN_ALNUM_RATIO
+
+
+def read_text_layer(file) -> TextLayer | None:
+    if not settings.TEXT_LAYER_ENABLED:
+        return None
+
+    file.seek(0)
+    try:
+        reader = PdfReader(file)
+        pages = []
+        for page in reader.pages:
+            text = page.extract_text() or ""
+            pages.append(text.strip() if has_usable_text(text) else None)
+    except (PyPdfError, ValueError, KeyError) as e:
+        logger.warning("Could not read the text layer of %s: %s", getattr(file, "name", "PDF"), e)
+        return None
+    finally:
+        file.seek(0)
+
+    return TextLayer(pages)
+
+
+def page_count(file) -> int | None:
+    file.seek(0)
+    try:
+        return len(PdfReader(file).pages)
+    except (PyPdfError, ValueError, KeyError):
+        return None
+    finally:
+        file.seek(0)
+
+
+def pages_text(layer: TextLayer) -> str:
+    parts = [f"Page {number}:\n{layer.pages[number - 1]}" for number in layer.text_pages]
+    if layer.scanned_pages:
+        pages = ", ".join(str(number) for number in layer.scanned_pages)
+        parts.append(f"Pages {pages} are scanned and attached as a PDF, in the same order.")
+    return "\n\n".join(parts)
+
+
+def select_pages(file, page_numbers: list[int]) -> io.BytesIO:
+    file.seek(0)
+    reader = PdfReader(file)
+    writer = PdfWriter()
+    for number in page_numbers:
+        writer.add_page(reader.pages[number - 1])
+    output = io.BytesIO()
+    writer.write(output)
+    output.seek(0)
+    file.seek(0)
+    return output
+
+
+def input_report(layer: TextLayer | None, preprocess_ms: float) -> dict:
+    if layer is None:
+        return {"path": "pdf", "pages": None, "text_pages": 0, "preprocess_ms": round(preprocess_ms, 1),
+                "estimated_tokens_saved": 0, "estimated_ms_saved": 0}
+
+    text_pages = len(layer.text_pages)
+    if not layer.scanned_pages:
+        path = "text"
+    elif text_pages:
+        path = "mixed"
+    else:
+        path = "pdf"
+    return {
+        "path": path,
+        "pages": len(layer.pages),
+        "text_pages": text_pages,
+        "preprocess_ms": round(preprocess_ms, 1),
+        "estimated_tokens_saved": text_pages * settings.PDF_PAGE_IMAGE_TOKENS,
+        "estimated_ms_saved": round(text_pages * settings.PDF_PAGE_PROCESSING_MS - preprocess_ms),
+    }
@@ -0,0 +1,61 @@
+import logging
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CallUsage:
+    kind: str
+    model: str
+    input_tokens: int
+    cached_tokens: int
+    output_tokens: int
+    reasoning_tokens: int
+    duration_ms: float
+
+    @classmethod
+    def from_response(cls, kind: str, response, started: float) -> "CallUsage | None":
+        """Build from a finished response; ``started`` is a time.perf_counter() value."""
+        usage = response.usage
+        if usage is None:
+            return None
+        input_details = getattr(usage, "input_tokens_details", None)
+        output_details = getattr(usage, "output_tokens_details", None)
+        call = cls(
+            kind=kind,
+            model=response.model,
+            input_tokens=usage.input_tokens,
+            cached_tokens=getattr(input_details, "cached_tokens", 0) or 0,
+            output_tokens=usage.output_tokens,
+            reasoning_tokens=getattr(output_details, "reasoning_tokens", 0) or 0,
+            duration_ms=round((time.perf_counter() - started) * 1000, 1),
+        )
+        logger.info(
+            "%s call to %s: %d input tokens (%d cached), %d output tokens, %.0f ms",
+            kind, call.model, call.input_tokens, call.cached_tokens, call.output_tokens, call.duration_ms,
+        )
+        return call
+
+
+def mean(values: list[float]) -> float | None:
+    return round(sum(values) / len(values), 1) if values else None
+
+
+def usage_summary(calls: list[CallUsage]) -> dict:
+    """Prompt cache hit rate and latency with and without a cache hit, per kind of call."""
+    summary = {}
+    for kind in sorted({call.kind for call in calls}):
+        kind_calls = [call for call in calls if call.kind == kind]
+        input_tokens = sum(call.input_tokens for call in kind_calls)
+        cached_tokens = sum(call.cached_tokens for call in kind_calls)
+        summary[kind] = {
+            "calls": len(kind_calls),
+            "input_tokens": input_tokens,
+            "cached_tokens": cached_tokens,
+            "cache_hit_rate": round(cached_tokens / input_tokens, 3) if input_tokens else 0.0,
+            "mean_ms_with_cache": mean([call.duration_ms for call in kind_calls if call.cached_tokens]),
+            "mean_ms_without_cache": mean([call.duration_ms for call in kind_calls if not call.cached_tokens]),
+        }
+    return summary
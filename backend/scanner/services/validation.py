@@ -0,0 +1,66 @@
+"""
+Checks on extraction output that decide whether a cheaper model's reading
+is kept or the document is read again by the next model tier.
+"""
+
+
+class InvalidExtraction(ValueError):
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+def conforms(value, schema: dict) -> bool:
+    """Whether ``value`` matches ``schema``, for the JSON schema subset the extraction formats use."""
+    kind = schema.get("type")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        return (
+            isinstance(value, dict)
+            and all(name in value for name in schema.get("required", []))
+            and (schema.get("additionalProperties", True) or set(value) <= set(properties))
+            and all(conforms(value[name], properties[name]) for name in properties if name in value)
+        )
+    if kind == "array":
+        return isinstance(value, list) and all(conforms(item, schema["items"]) for item in value)
+    if kind == "string":
+        return isinstance(value, str)
+    if kind == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    return True
+
+
+def check_questions(questions: list[dict], text_fields: tuple[str, ...], window=None):
+    if not questions and window is None:
+        raise InvalidExtraction("no_questions")
+    numbers = [question["question_number"] for question in questions]
+    if numbers != sorted(set(numbers)) or any(number < 1 for number in numbers):
+        raise InvalidExtraction("question_order", str(numbers))
+    for question in questions:
+        for field in text_fields:
+            if not question[field].strip():
+                raise InvalidExtraction("empty_question", f"{field} of question {question['question_number']}")
+
+
+def validate_answer_key(result, schema: dict, window=None):
+    if not conforms(result, schema["schema"]):
+        raise InvalidExtraction("schema")
+    questions = result["questions"]
+    check_questions(questions, ("question", "answer"), window)
+    numbers = [question["question_number"] for question in questions]
+    # Answer keys are numbered without gaps.
+    if numbers and numbers != list(range(numbers[0], numbers[0] + len(numbers))):
+        raise InvalidExtraction("question_gap", str(numbers))
+
+
+def validate_student_exam(result, schema: dict, window=None, answer_key: dict | None = None):
+    """A student may skip questions, but not answer ones the answer key does not have."""
+    if not conforms(result, schema["schema"]):
+        raise InvalidExtraction("schema")
+    questions = result["questions"]
+    check_questions(questions, ("question",), window)
+    if answer_key:
+        expected = {question["question_number"] for question in answer_key.get("questions", [])}
+        unknown = [question["question_number"] for question in questions if question["question_number"] not in expected]
+        if unknown:
+            raise InvalidExtraction("unknown_question", str(unknown))
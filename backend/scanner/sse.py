@@ -0,0 +1,142 @@
+"""
+Server-sent events for the streaming views.
+
+Text deltas that arrive close together are coalesced into one event, and
+everything ready at the same time is sent in one write, so a long
+evaluation costs a few hundred writes instead of one per token.
+"""
+import asyncio
+import json
+
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:  # Without orjson events are encoded with the json module.
+    orjson = None
+
+# Events whose ``delta`` can be joined with the next one of the same type
+# (and the same student).
+DELTA_EVENTS = {'evaluation_chunk', 'chat_chunk'}
+
+HEARTBEAT = b': keepalive\n\n'
+
+
+def encode_data(data: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def encode_event(event_type: str, data: dict, event_id: int | None = None) -> bytes:
+    event = b'event: %s\ndata: %s\n\n' % (event_type.encode(), encode_data(data))
+    if event_id is not None:
+        event = b'id: %d\n' % event_id + event
+    return event
+
+
+class SSEWriter:
+    """
+    Buffers events and returns them as one chunk of bytes when flushed.
+
+    Deltas are held for up to ``window`` seconds or ``max_bytes`` of text
+    and joined per event type and student, so interleaved per-student
+    streams are coalesced too. The last event of a flush carries the
+    highest id it covers: a client resuming from that id has seen all of it.
+    """
+
+    def __init__(self, window: float | None = None, max_bytes: int | None = None, debug: bool | None = None):
+        self.window = settings.SSE_COALESCE_WINDOW if window is None else window
+        self.max_bytes = settings.SSE_COALESCE_MAX_BYTES if max_bytes is None else max_bytes
+        self.debug = settings.SSE_DEBUG_EVENTS if debug is None else debug
+        self._chunks = []
+        self._deltas = {}
+        self._delta_size = 0
+        self._last_id = None
+        self.deadline = None
+
+    @property
+    def pending(self) -> bool:
+        return bool(self._chunks or self._deltas)
+
+    def add(self, event_type: str, data: dict, event_id: int | None = None):
+        if event_type == 'debug' and not self.debug:
+            return
+        if event_type not in DELTA_EVENTS:
+            self._end_deltas()
+            self._chunks.append(encode_event(event_type, data, event_id))
+            return
+
+        if not self._deltas:
+            self.deadline = asyncio.get_running_loop().time() + self.window
+        key = (event_type, data.get('student'))
+        if key not in self._deltas:
+            self._deltas[key] = (data, [])
+        delta = data.get('delta', '')
+        self._deltas[key][1].append(delta)
+        self._delta_size += len(delta)
+        if event_id is not None:
+            self._last_id = event_id
+
+    def ready(self) -> bool:
+        """Whether the buffer should be written now instead of waiting for more deltas."""
+        if self._chunks:
+            return True
+        return bool(self._deltas) and (
+            self._delta_size >= self.max_bytes or asyncio.get_running_loop().time() >= self.deadline
+        )
+
+    def flush(self) -> bytes:
+        self._end_deltas()
+        chunk = b''.join(self._chunks)
+        self._chunks = []
+        return chunk
+
+    def _end_deltas(self):
+        if not self._deltas:
+            return
+        last = len(self._deltas) - 1
+        for index, ((event_type, _), (data, parts)) in enumerate(self._deltas.items()):
+            event_id = self._last_id if index == last else None
+            self._chunks.append(encode_event(event_type, {**data, 'delta': ''.join(parts)}, event_id))
+        self._deltas = {}
+        self._delta_size = 0
+        self._last_id = None
+        self.deadline = None
+
+
+async def sse_stream(events, writer: SSEWriter | None = None, heartbeat: float | None = None):
+    """
+    Turn an async iterable of (event_type, data, event_id) into SSE chunks,
+    with a heartbeat comment whenever nothing was sent for ``heartbeat`` seconds.
+    """
+    writer = writer or SSEWriter()
+    heartbeat = settings.SSE_HEARTBEAT_INTERVAL if heartbeat is None else heartbeat
+    loop = asyncio.get_running_loop()
+    iterator = aiter(events)
+    next_event = None
+    last_write = loop.time()
+    try:
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(anext(iterator))
+            wake_at = writer.deadline if writer.deadline is not None else last_write + heartbeat
+            done, _ = await asyncio.wait({next_event}, timeout=max(wake_at - loop.time(), 0))
+            if done:
+                event, next_event = next_event, None
+                try:
+                    writer.add(*event.result())
+                except StopAsyncIteration:
+                    break
+                if not writer.ready():
+                    continue
+            if writer.pending:
+                yield writer.flush()
+            else:
+                yield HEARTBEAT
+            last_write = loop.time()
+        if writer.pending:
+            yield writer.flush()
+    finally:
+        if next_event is not None:
+            next_event.cancel()
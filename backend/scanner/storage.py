@@ -0,0 +1,172 @@
+"""
+Content-addressed file storage for uploaded PDFs.
+
+Files are named by the SHA-256 of their content (blobs/ab/cd/<digest>.pdf)
+and written once: saving a file that is already stored only adds a
+reference to its Blob row. The digest is computed by the upload handlers
+while the request body streams in, so a repeated upload is neither read
+again nor written. Files nothing refers to any more are removed by
+``python manage.py gc_blobs``.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path, PurePosixPath
+
+from django.apps import apps
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+BLOB_NAME = re.compile(r'(?:^|/)blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(?:\.\w+)?$')
+
+
+def blob_name(digest: str, extension: str = '') -> str:
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def blob_digest(name: str | None) -> str | None:
+    """The digest a stored file is named by, or None for a file outside the blob store."""
+    match = BLOB_NAME.search(name or '')
+    return match.group(1) if match else None
+
+
+def content_digest(content) -> str:
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Equal names mean equal content; there is nothing to avoid.
+        return name
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        digest = content_digest(content)
+        name = blob_name(digest, PurePosixPath(name).suffix.lower())
+        # The reference is taken before the file is checked, so gc_blobs does not remove it meanwhile.
+        _, created = Blob.objects.get_or_create(digest=digest, defaults={'name': name, 'size': content.size, 'refs': 1})
+        if not created:
+            Blob.objects.filter(digest=digest).update(refs=F('refs') + 1, updated_at=timezone.now())
+
+        path = self.path(name)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            # Written next to the target and renamed, so a blob is never seen half-written.
+            if hasattr(content, 'temporary_file_path'):
+                file_move_safe(content.temporary_file_path(), path, allow_overwrite=True)
+            else:
+                fd, partial = tempfile.mkstemp(dir=directory, suffix='.part')
+                with os.fdopen(fd, 'wb') as output:
+                    for chunk in content.chunks():
+                        output.write(chunk)
+                os.replace(partial, path)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        return name
+
+    def delete(self, name):
+        from .models import Blob
+
+        # Only the reference goes; the file is removed by gc_blobs once unused.
+        if digest := blob_digest(name):
+            Blob.objects.filter(digest=digest, refs__gt=0).update(refs=F('refs') - 1, updated_at=timezone.now())
+
+
+def blob_references() -> Counter:
+    """Digest -> number of file fields, in every model, that refer to it."""
+    references = Counter()
+    for model in apps.get_models():
+        for field in model._meta.get_fields():
+            if isinstance(field, models.FileField) and isinstance(field.storage, BlobStorage):
+                names = model._default_manager.exclude(**{field.name: ''}).values_list(field.name, flat=True)
+                references.update(digest for name in names.iterator() if (digest := blob_digest(name)))
+    return references
+
+
+def collect_garbage(storage: BlobStorage, grace: int, dry_run: bool = False) -> dict:
+    """
+    Recount the references of every blob and delete the files nothing has
+    referred to for ``grace`` seconds, along with stray and half-written
+    files of the same age.
+    """
+    from .models import Blob
+
+    references = blob_references()
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    removed = []
+    recounted = 0
+    for blob in Blob.objects.iterator():
+        refs = references.get(blob.digest, 0)
+        if refs != blob.refs:
+            recounted += 1
+            if not dry_run:
+                Blob.objects.filter(pk=blob.pk).update(refs=refs)
+        if refs == 0 and blob.updated_at < cutoff:
+            if dry_run:
+                removed.append((blob.name, blob.size))
+            # Skipped if the blob was referenced again since it was read.
+            elif Blob.objects.filter(pk=blob.pk, updated_at=blob.updated_at).delete()[0]:
+                removed.append((blob.name, blob.size))
+                FileSystemStorage.delete(storage, blob.name)
+
+    # Files without a Blob row: interrupted writes, or a row that was rolled back.
+    known = set(Blob.objects.values_list('name', flat=True))
+    root = Path(storage.path(BLOB_DIR))
+    for path in root.rglob('*') if root.is_dir() else ():
+        name = path.relative_to(storage.path('')).as_posix()
+        if path.is_file() and name not in known and path.stat().st_mtime < time.time() - grace:
+            removed.append((name, path.stat().st_size))
+            if not dry_run:
+                path.unlink()
+    return {'removed': len(removed), 'bytes': sum(size for _, size in removed), 'recounted': recounted}
+
+
+class HashingUploadHandler:
+    """Computes the SHA-256 of an uploaded file as its chunks arrive and sets it as ``file.sha256``."""
+
+    def new_file(self, *args, **kwargs):
+        # Before super(): the memory handler stops the chain by raising when it takes the file.
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super().receive_data_chunk(raw_data, start)
+        # A handler that passes the chunk on is not keeping this file.
+        if data is None:
+            self.hasher.update(raw_data)
+        return data
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.hasher.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandler, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandler, TemporaryFileUploadHandler):
+    pass
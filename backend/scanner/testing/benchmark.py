@@ -0,0 +1,144 @@
+import asyncio
+import io
+import json
+import resource
+import statistics
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient
+from pypdf import PdfWriter
+
+from ..jobs import claim_job, run_job
+
+SAMPLES = Path(__file__).resolve().parent.parent / "management" / "commands"
+
+ANSWER_KEY = {
+    "questions": [
+        {"question_number": number, "question": f"Soru {number} metni", "answer": f"Soru {number} cevabı"}
+        for number in range(1, 6)
+    ]
+}
+
+STUDENT_EXAM = {
+    "student_name": "Öğrenci",
+    "questions": [
+        {"question_number": number, "question": f"Soru {number} metni", "student_answer": f"Öğrenci cevabı {number}"}
+        for number in range(1, 6)
+    ],
+}
+
+EVALUATION = "\n\n".join(
+    f"Soru {number}: 10 üzerinden 8\nCevap büyük ölçüde doğru, bazı ayrıntılar eksik." for number in range(1, 6)
+) + "\n\nGenel Ortalama: 8/10"
+
+STRUCTURED_EVALUATION = {
+    "students": [
+        {
+            "student_name": "Öğrenci",
+            "questions": [
+                {"question_number": number, "score": 8, "rationale": "Cevap büyük ölçüde doğru, bazı ayrıntılar eksik."}
+                for number in range(1, 6)
+            ],
+            "strengths": "Temel kavramları biliyor.",
+            "weaknesses": "Ayrıntılar eksik.",
+            "knowledge_gaps": "Örneklendirme.",
+        }
+    ]
+}
+
+# Canned outputs for MockOpenAIServer(outputs=...).
+MOCK_OUTPUTS = {
+    "answer_key": json.dumps(ANSWER_KEY, ensure_ascii=False),
+    "student_exam": json.dumps(STUDENT_EXAM, ensure_ascii=False),
+    "text": EVALUATION,
+    "evaluation": json.dumps(STRUCTURED_EVALUATION, ensure_ascii=False),
+}
+
+
+@dataclass
+class BenchmarkResult:
+    students: int
+    wall_s: float
+    first_byte_s: float
+    events: int
+    errors: int
+    sse_bytes: int
+    sse_writes: int
+    peak_rss_mb: float
+    loop_lag_p99_ms: float
+    loop_lag_max_ms: float
+
+
+def exam_pdf(sample: str, title: str) -> SimpleUploadedFile:
+    """A copy of a sample exam with its own title, so every upload has distinct content."""
+    writer = PdfWriter(clone_from=SAMPLES / sample)
+    writer.add_metadata({"/Title": title})
+    content = io.BytesIO()
+    writer.write(content)
+    return SimpleUploadedFile(f"{title}.pdf", content.getvalue(), content_type="application/pdf")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def watch_loop_lag(samples: list[float], interval: float = 0.01):
+    """Record how late the event loop wakes up from a short sleep."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - started - interval)
+
+
+async def benchmark_upload(students: int, run_id: str = "") -> BenchmarkResult:
+    """
+    Upload one answer key and ``students`` exams through the ASGI test client,
+    run the job in-process and follow its SSE stream to the end.
+
+    The OpenAI client must already point at a mock server.
+    """
+    client = AsyncClient()
+    answer_key = exam_pdf("Cevap Anahtarı.pdf", f"Cevap Anahtarı {run_id}")
+    exams = [exam_pdf("Öğrenci 1.pdf", f"Öğrenci {run_id}-{index}") for index in range(students)]
+
+    lag = []
+    lag_watcher = asyncio.create_task(watch_loop_lag(lag))
+    started = time.perf_counter()
+    first_byte = None
+    events = errors = sse_bytes = sse_writes = 0
+    try:
+        response = await client.post("/api/scans/upload/", {"answer_key": answer_key, "student_exams": exams})
+        job = response.json()
+        worker = asyncio.create_task(run_job(await sync_to_async(claim_job)()))
+
+        stream = await client.get(job["events_url"])
+        async for chunk in stream.streaming_content:
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            events += chunk.count(b"\n\n")
+            sse_bytes += len(chunk)
+            sse_writes += 1
+            errors += chunk.count(b"event: error\n")
+        await worker
+    finally:
+        lag_watcher.cancel()
+    wall = time.perf_counter() - started
+
+    lag_ms = sorted(value * 1000 for value in lag) or [0.0]
+    return BenchmarkResult(
+        students=students,
+        wall_s=round(wall, 3),
+        first_byte_s=round(first_byte or wall, 3),
+        events=events,
+        errors=errors,
+        sse_bytes=sse_bytes,
+        sse_writes=sse_writes,
+        peak_rss_mb=round(peak_rss_mb(), 1),
+        loop_lag_p99_ms=round(statistics.quantiles(lag_ms, n=100)[-1] if len(lag_ms) > 1 else lag_ms[0], 1),
+        loop_lag_max_ms=round(lag_ms[-1], 1),
+    )
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+from dataclasses import dataclass
+
+import httpx
+import uvicorn
+from asgiref.sync import sync_to_async
+
+from backend.asgi import application
+from ..lifespan import server_options
+from ..models import Job, JobEvent
+from .benchmark import peak_rss_mb, watch_loop_lag
+
+
+@dataclass
+class LoadResult:
+    streams: int
+    held: int
+    rejected: int
+    dropped: int
+    connect_p50_ms: float
+    connect_p99_ms: float
+    delivery_p50_ms: float
+    delivery_p99_ms: float
+    delivery_max_ms: float
+    loop_lag_p99_ms: float
+    threads: int
+    peak_rss_mb: float
+
+
+def quantile(values: list[float], q: int) -> float:
+    values = sorted(values) or [0.0]
+    if len(values) == 1:
+        return round(values[0], 1)
+    return round(statistics.quantiles(values, n=100)[q - 1], 1)
+
+
+class ServerThread:
+    """One uvicorn worker serving the project's ASGI application on a thread of its own, with its loop lag recorded."""
+
+    def __init__(self, **options):
+        options = server_options(host='127.0.0.1', port=0, workers=1, log_level='warning', access_log=False, **options)
+        self.server = uvicorn.Server(uvicorn.Config(application, **options))
+        self.lag = []
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(),), daemon=True)
+
+    async def serve(self):
+        watcher = asyncio.create_task(watch_loop_lag(self.lag))
+        try:
+            await self.server.serve()
+        finally:
+            watcher.cancel()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError('The server did not start')
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+async def follow(client: httpx.AsyncClient, url: str, connect: list, delivery: list, answered: asyncio.Semaphore) -> str:
+    """Read one job's event stream to its end: 'completed', 'rejected' (503) or 'dropped'."""
+    started = time.perf_counter()
+    try:
+        async with client.stream('GET', url) as response:
+            answered.release()
+            if response.status_code != 200:
+                return 'rejected'
+            connect.append((time.perf_counter() - started) * 1000)
+            async for line in response.aiter_lines():
+                if line.startswith('data: '):
+                    data = json.loads(line[6:])
+                    delivery.append((time.time() - data['sent']) * 1000)
+                elif line == 'event: done':
+                    return 'completed'
+    except httpx.HTTPError:
+        answered.release()
+    return 'dropped'
+
+
+async def grade(jobs: list[Job], events: int, interval: float):
+    """Stand in for the worker: one event per job every ``interval`` seconds, then 'done'."""
+    for number in range(events + 1):
+        await asyncio.sleep(interval)
+        event = 'status' if number < events else 'done'
+        await JobEvent.objects.abulk_create(
+            [JobEvent(job=job, event=event, data={'sent': time.time(), 'number': number}) for job in jobs]
+        )
+
+
+async def load_test_sse(base_url: str, streams: int, events: int = 20, interval: float = 0.5, server=None) -> LoadResult:
+    """
+    Open ``streams`` job event streams at once against the server at
+    ``base_url`` and keep them busy with ``events`` events each, written
+    every ``interval`` seconds, starting once every stream was answered. A
+    stream counts as held if it was accepted and read to its 'done' event.
+    """
+    jobs = await sync_to_async(Job.objects.bulk_create)([Job(status=Job.RUNNING) for _ in range(streams)])
+    connect, delivery = [], []
+    lag_from = len(server.lag) if server else 0
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=httpx.Timeout(60, pool=None)) as client:
+        answered = asyncio.Semaphore(0)
+        readers = [
+            asyncio.create_task(follow(client, f'/api/scans/jobs/{job.pk}/events/', connect, delivery, answered))
+            for job in jobs
+        ]
+        for _ in jobs:
+            await answered.acquire()
+        threads = threading.active_count()
+        writer = asyncio.create_task(grade(jobs, events, interval))
+        # Threads are counted while every stream is open, before they start to finish.
+        while not writer.done():
+            threads = max(threads, threading.active_count())
+            await asyncio.sleep(interval)
+        await writer
+        outcomes = await asyncio.gather(*readers)
+
+    lag = [value * 1000 for value in (server.lag[lag_from:] if server else [])]
+    return LoadResult(
+        streams=streams,
+        held=outcomes.count('completed'),
+        rejected=outcomes.count('rejected'),
+        dropped=outcomes.count('dropped'),
+        connect_p50_ms=quantile(connect, 50),
+        connect_p99_ms=quantile(connect, 99),
+        delivery_p50_ms=quantile(delivery, 50),
+        delivery_p99_ms=quantile(delivery, 99),
+        delivery_max_ms=round(max(delivery, default=0.0), 1),
+        loop_lag_p99_ms=quantile(lag, 99),
+        threads=threads,
+        peak_rss_mb=round(peak_rss_mb(), 1),
+    )
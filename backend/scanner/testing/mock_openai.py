@@ -0,0 +1,259 @@
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAULT_MESSAGES = {
+    429: ("rate_limit_exceeded", "Rate limit reached for gpt-5 (mock)."),
+    500: ("server_error", "The server had an error while processing your request (mock)."),
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Split ``text`` into roughly token-sized pieces that join back to the original."""
+    return re.findall(r"\s*\S{1,4}|\s+", text) or [""]
+
+
+def response_body(text: str, model: str, input_tokens: int = 0, output_tokens: int = 0) -> dict:
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": model,
+        "output": [
+            {
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }
+        ],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens,
+        },
+    }
+
+
+class MockOpenAIServer:
+    """
+    Local stand-in for the OpenAI Responses and Files APIs, for tests and benchmarks.
+
+    Use as a context manager and point a client at ``base_url``.
+
+    ``latency`` is the delay before the first byte of every response and
+    ``token_rate`` the output speed in tokens per second (unlimited if None).
+    ``outputs`` maps a text format name ("answer_key", "student_exam",
+    "text") to the canned output for requests using it; other requests get
+    ``output_text``. ``faults`` maps an HTTP status (429 or 500) to the
+    probability that a model request fails with it.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        output_text: str = "{}",
+        outputs: dict[str, str] | None = None,
+        token_rate: float | None = None,
+        faults: dict[int, float] | None = None,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.output_text = output_text
+        self.outputs = outputs or {}
+        self.token_rate = token_rate
+        self.faults = faults or {}
+        self.requests = 0
+        self.uploads = 0
+        self.connections = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def output_for(self, body: dict) -> str:
+        format_name = body.get("text", {}).get("format", {})
+        format_name = format_name.get("name") or format_name.get("type")
+        return self.outputs.get(format_name, self.output_text)
+
+    def draw_fault(self) -> int | None:
+        with self._lock:
+            roll = self._random.random()
+        for status, probability in self.faults.items():
+            if roll < probability:
+                return status
+            roll -= probability
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_json(self, body: dict, status: int = 200, headers: dict | None = None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def send_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def send_event(self, event: dict):
+                self.send_chunk(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+
+            def drain_body(self) -> int:
+                """Read and discard the request body in chunks, returning its size."""
+                size = 0
+                if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                    while chunk_size := int(self.rfile.readline().strip() or b"0", 16):
+                        size += chunk_size
+                        while chunk_size:
+                            chunk_size -= len(self.rfile.read(min(chunk_size, 64 * 1024)))
+                        self.rfile.readline()
+                    self.rfile.readline()
+                    return size
+                remaining = int(self.headers.get("Content-Length", 0))
+                while remaining:
+                    read = len(self.rfile.read(min(remaining, 64 * 1024)))
+                    size += read
+                    remaining -= read
+                return size
+
+            def send_fault(self, status: int):
+                code, message = FAULT_MESSAGES.get(status, ("server_error", "Mock failure."))
+                self.send_json(
+                    {"error": {"message": message, "type": code, "param": None, "code": code}},
+                    status=status,
+                    headers={"Retry-After": "0"} if status == 429 else None,
+                )
+
+            def stream(self, text: str, model: str, input_tokens: int):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                tokens = tokenize(text)
+                body = response_body(text, model, input_tokens, len(tokens))
+                item_id = body["output"][0]["id"]
+                sequence = 0
+                self.send_event({
+                    "type": "response.created",
+                    "sequence_number": sequence,
+                    "response": {**body, "status": "in_progress", "output": [], "usage": None},
+                })
+                for token in tokens:
+                    if server.token_rate:
+                        time.sleep(1 / server.token_rate)
+                    sequence += 1
+                    self.send_event({
+                        "type": "response.output_text.delta",
+                        "sequence_number": sequence,
+                        "item_id": item_id,
+                        "output_index": 0,
+                        "content_index": 0,
+                        "delta": token,
+                        "logprobs": [],
+                    })
+                self.send_event({
+                    "type": "response.output_text.done",
+                    "sequence_number": sequence + 1,
+                    "item_id": item_id,
+                    "output_index": 0,
+                    "content_index": 0,
+                    "text": text,
+                    "logprobs": [],
+                })
+                self.send_event({"type": "response.completed", "sequence_number": sequence + 2, "response": body})
+                self.send_chunk(b"")
+
+            def do_DELETE(self):
+                file_id = self.path.rsplit("/", 1)[-1]
+                self.send_json({"id": file_id, "object": "file", "deleted": True})
+
+            def do_POST(self):
+                if self.path.endswith("/files"):
+                    size = self.drain_body()
+                    with server._lock:
+                        server.uploads += 1
+                    self.send_json({
+                        "id": f"file-{uuid.uuid4().hex}",
+                        "object": "file",
+                        "bytes": size,
+                        "created_at": int(time.time()),
+                        "filename": "upload.pdf",
+                        "purpose": "user_data",
+                        "status": "processed",
+                    })
+                    return
+
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                body = json.loads(raw or b"{}")
+                with server._lock:
+                    server.requests += 1
+                if server.latency:
+                    time.sleep(server.latency)
+
+                fault = server.draw_fault()
+                if fault:
+                    with server._lock:
+                        server.failures += 1
+                    self.send_fault(fault)
+                    return
+
+                text = server.output_for(body)
+                model = body.get("model", "gpt-5")
+                input_tokens = len(raw) // 4
+                if body.get("stream"):
+                    self.stream(text, model, input_tokens)
+                    return
+
+                tokens = tokenize(text)
+                if server.token_rate:
+                    time.sleep(len(tokens) / server.token_rate)
+                self.send_json(response_body(text, model, input_tokens, len(tokens)))
+
+        return Handler
@@ -1,3 +1,1458 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+from pathlib import Path
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+import httpx
+from openai import AsyncOpenAI, InternalServerError, OpenAI, RateLimitError
+from pypdf import PdfReader, PdfWriter
+
+from .conversations import build_records, fold, parse_report, select_context, split_class_evaluation
+from backend.asgi import application
+from .jobs import claim_job, coalesce_deltas, follow_job_events, get_event_hub, run_job
+from .metrics import JobMetrics, render_metrics
+from .models import Blob, Conversation, Exam, Job, JobEvent, JobMetric, QuestionResult, Scan, Stage, Student
+from .services.cache import ExtractionCache
+from .services.chunking import merge_student_exam, page_windows
+from .services import clients
+from .services.clients import close_async_client
+from .services.retries import AdaptiveLimiter, header_delay
+from .services.streaming_json import ArrayItemParser
+from .sse import HEARTBEAT, SSEWriter, sse_stream
+from .services.prescoring import Prescorer, normalize_answer, similarity
+from .services.validation import InvalidExtraction, validate_answer_key, validate_student_exam
+from .services.openai import (
+    ANSWER_KEY_SCHEMA,
+    STUDENT_EXAM_SCHEMA,
+    AsyncReadAnswerKeyService,
+    AsyncReadStudentAnswersService,
+    evaluation_request,
+)
+from .services.pdf import async_document_input, pdf_data_url
+from .testing.benchmark import MOCK_OUTPUTS, benchmark_upload, exam_pdf
+from .testing.mock_openai import MockOpenAIServer
+
+SAMPLES = Path(__file__).parent / "management" / "commands"
+ANSWER_KEY = {"questions": [{"question_number": 1, "question": "Soru", "answer": "Cevap"}]}
+
+
+def student_exam(name, answer="Cevap"):
+    return {
+        "student_name": name,
+        "questions": [{"question_number": 1, "question": "Soru", "student_answer": answer}],
+    }
+
+
+class FakeFiles:
+    def __init__(self):
+        self.uploaded = {}
+        self.deleted = []
+
+    async def create(self, file, purpose):
+        _, handle, _ = file
+        file_id = f"file-{len(self.uploaded)}"
+        self.uploaded[file_id] = handle.read()
+        return SimpleNamespace(id=file_id)
+
+    async def delete(self, file_id):
+        self.deleted.append(file_id)
+
+
+class FakeResponses:
+    def __init__(
+        self, delay=0.0, deltas=("Soru 1: ", "10 üzerinden 10"), delay_for=None, errors=(), answer_key_output=None,
+        distinct_answers=False, evaluation_deltas=None,
+    ):
+        self.delay = delay
+        # Every student answers differently instead of "Cevap".
+        self.distinct_answers = distinct_answers
+        self.delay_for = delay_for
+        # Answer key output for a call, or None for ANSWER_KEY.
+        self.answer_key_output = answer_key_output
+        # Raised by the first calls, one per call.
+        self.errors = list(errors)
+        self.deltas = deltas
+        # Deltas of an evaluation or chat call, or None for ``deltas``.
+        self.evaluation_deltas = evaluation_deltas
+        self.files = FakeFiles()
+        self.calls = []
+        # (request, usage) for every usage reported, in the order reported.
+        self.reported = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Evaluation and chat streams being read at once.
+        self.streaming = 0
+        self.max_streaming = 0
+        # ("delta", format name, last) as extraction deltas are handed out, and
+        # whatever the test adds to it meanwhile.
+        self.log = []
+
+    async def create(self, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.calls.append(kwargs)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay_for(kwargs) if self.delay_for else self.delay)
+        finally:
+            self.in_flight -= 1
+        usage = self.usage(kwargs)
+        format_name = kwargs["text"]["format"].get("name")
+        if format_name not in ("answer_key", "student_exam"):
+            deltas = self.evaluation_deltas and self.evaluation_deltas(kwargs)
+            return self.stream(len(self.calls), kwargs["model"], usage, deltas, tracked=True)
+        if format_name == "answer_key":
+            output = (self.answer_key_output and self.answer_key_output(kwargs)) or json.dumps(ANSWER_KEY)
+        else:
+            number = self.call_number(kwargs)
+            answer = f"Cevap {number}" if self.distinct_answers else "Cevap"
+            output = json.dumps(student_exam(f"Öğrenci {number}", answer))
+        if kwargs.get("stream"):
+            deltas = [output[start:start + 20] for start in range(0, len(output), 20)]
+            return self.stream(len(self.calls), kwargs["model"], usage, deltas, delay=0, kind=format_name)
+        return SimpleNamespace(output_text=output, model=kwargs["model"], usage=usage)
+
+    def call_number(self, kwargs):
+        # Counted when the call was made, not when it returns: calls overlap.
+        return next(i for i, call in enumerate(self.calls, 1) if call is kwargs)
+
+    def usage(self, kwargs):
+        # Pretend the provider caches a 1024-token prefix per prompt_cache_key.
+        key = kwargs.get("prompt_cache_key")
+        earlier = self.calls[:self.call_number(kwargs) - 1]
+        seen = any(call.get("prompt_cache_key") == key for call in earlier)
+        usage = SimpleNamespace(
+            input_tokens=1200,
+            input_tokens_details=SimpleNamespace(cached_tokens=1024 if key and seen else 0),
+            output_tokens=50,
+        )
+        self.reported.append((kwargs, usage))
+        return usage
+
+    def pdf_content(self, kwargs):
+        for message in kwargs["input"]:
+            for part in message["content"]:
+                if isinstance(part, dict) and part.get("type") == "input_file":
+                    if "file_id" in part:
+                        return self.files.uploaded[part["file_id"]]
+                    return base64.b64decode(part["file_data"].split(",", 1)[1])
+        return None
+
+    async def stream(self, call, model="gpt-5", usage=None, deltas=None, delay=None, tracked=False, kind=None):
+        yield SimpleNamespace(type="response.created", response=SimpleNamespace(id=f"resp_{call}"))
+        if tracked:
+            self.streaming += 1
+            self.max_streaming = max(self.max_streaming, self.streaming)
+        try:
+            deltas = deltas or self.deltas
+            for number, delta in enumerate(deltas, 1):
+                await asyncio.sleep(self.delay if delay is None else delay)
+                if kind:
+                    self.log.append(("delta", kind, number == len(deltas)))
+                yield SimpleNamespace(type="response.output_text.delta", delta=delta)
+        finally:
+            if tracked:
+                self.streaming -= 1
+        yield SimpleNamespace(
+            type="response.completed", response=SimpleNamespace(id=f"resp_{call}", model=model, usage=usage)
+        )
+
+
+class FakeAsyncOpenAI:
+    def __init__(self, responses):
+        self.responses = responses
+        self.files = responses.files
+
+
+def api_error(error_class, status, headers=None):
+    response = httpx.Response(status, headers=headers, request=httpx.Request("POST", "https://api.openai.com/v1/responses"))
+    return error_class(f"Hata {status}", response=response, body=None)
+
+
+def pdf(name, content=None):
+    content = content if content is not None else f"%PDF-1.4 {name}".encode()
+    return SimpleUploadedFile(name, content, content_type="application/pdf")
+
+
+def parse_sse(body, with_ids=False):
+    events = []
+    for block in body.decode().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in lines:
+            event = (lines["event"], json.loads(lines["data"]))
+            events.append((int(lines["id"]), *event) if with_ids else event)
+    return events
+
+
+async def read_events(response):
+    return parse_sse(b"".join([chunk async for chunk in response.streaming_content]))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UploadScanTests(TestCase):
+    async def submit(self, student_count, student_offset=0):
+        response = await self.async_client.post(
+            "/api/scans/upload/",
+            {
+                "answer_key": pdf("Cevap Anahtarı.pdf"),
+                "student_exams": [
+                    pdf(f"Öğrenci {i}.pdf") for i in range(student_offset, student_offset + student_count)
+                ],
+            },
+        )
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    async def upload(self, student_count, student_offset=0):
+        job = await self.submit(student_count, student_offset)
+        await run_job(await sync_to_async(claim_job)())
+        return await read_events(await self.async_client.get(job["events_url"]))
+
+    @override_settings(OPENAI_MAX_CONCURRENCY=4, OPENAI_MAX_CONCURRENCY_LIMIT=4)
+    async def test_student_exams_are_read_concurrently_up_to_the_limit(self):
+        responses = FakeResponses(delay=0.1)
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            events = await self.upload(student_count=10)
+
+        names = [name for name, _ in events]
+        self.assertNotIn("error", names)
+        self.assertIn("done", names)
+        student_reads = [data for name, data in events if name == "student_reading_complete"]
+        self.assertEqual(sorted(data["student"] for data in student_reads), list(range(10)))
+        # The answer key and the student exams share the limit, and fill it.
+        self.assertEqual(responses.max_in_flight, 4)
+
+    async def test_repeated_answer_key_is_served_from_the_cache(self):
+        responses = FakeResponses()
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            first = dict(await self.upload(student_count=1))
+            second = dict(await self.upload(student_count=1, student_offset=1))
+
+        answer_key_calls = [c for c in responses.calls if c["text"]["format"].get("name") == "answer_key"]
+        self.assertEqual(len(answer_key_calls), 1)
+        self.assertFalse(first["answer_key_complete"]["cached"])
+        self.assertTrue(second["answer_key_complete"]["cached"])
+        self.assertEqual(second["answer_key_complete"]["data"], ANSWER_KEY)
+
+    @override_settings(EVALUATION_MODE="per_student", OPENAI_MAX_CONCURRENCY=10)
+    async def test_per_student_evaluation_streams_concurrently(self):
+        responses = FakeResponses(delay=0.05)
+
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            events = await self.upload(student_count=5)
+
+        chunks = [data for name, data in events if name == "evaluation_chunk"]
+        self.assertEqual(sorted({chunk["student"] for chunk in chunks}), [0, 1, 2, 3, 4])
+        self.assertNotEqual([chunk["student"] for chunk in chunks], sorted(chunk["student"] for chunk in chunks))
+        completed = [data for name, data in events if name == "student_evaluation_complete"]
+        self.assertEqual(len(completed), 5)
+        self.assertEqual(completed[0]["full_text"], "Soru 1: 10 üzerinden 10")
+        self.assertIn("evaluation_complete", dict(events))
+        # The answer key and the students are read together, then the evaluations are streamed side by side.
+        self.assertEqual(responses.max_in_flight, 6)
+        self.assertGreater(responses.max_streaming, 1)
+
+    @override_settings(EVALUATION_MODE="per_student")
+    async def test_slow_exam_does_not_hold_back_other_students(self):
+        slow_exam = "%PDF-1.4 Öğrenci 0.pdf".encode()
+        responses = FakeResponses(delay_for=lambda kwargs: 0.3 if responses.pdf_content(kwargs) == slow_exam else 0.01)
+
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            events = await self.upload(student_count=2)
+
+        order = [(name, data.get("student")) for name, data in events]
+        self.assertLess(
+            order.index(("student_evaluation_complete", 1)),
+            order.index(("student_reading_complete", 0)),
+        )
+
+    @override_settings(EVALUATION_MODE="per_student")
+    async def test_usage_summary_reports_prompt_cache_hits(self):
+        responses = FakeResponses()
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            events = dict(await self.upload(student_count=3))
+
+        usage = events["usage_summary"]
+        self.assertEqual(len(usage["calls"]), 1 + 3 + 3)
+        evaluation = usage["summary"]["evaluation"]
+        self.assertEqual(evaluation["calls"], 3)
+        # Compared with what the provider reported, whichever call happened to come first.
+        reported = [u for call, u in responses.reported if call["prompt_cache_key"].startswith("evaluation")]
+        cached = sum(u.input_tokens_details.cached_tokens for u in reported)
+        self.assertGreater(cached, 0)
+        self.assertEqual(evaluation["cached_tokens"], cached)
+        self.assertEqual(evaluation["cache_hit_rate"], round(cached / sum(u.input_tokens for u in reported), 3))
+
+    async def test_job_metrics_are_saved_and_exposed(self):
+        responses = FakeResponses()
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            await self.upload(student_count=2)
+
+        names = {name async for name in JobMetric.objects.values_list("name", flat=True)}
+        self.assertIn("scanner_answer_key_read_seconds", names)
+        self.assertIn("scanner_evaluation_first_token_seconds", names)
+
+        response = await self.async_client.get("/metrics")
+        body = response.content.decode()
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn("# TYPE scanner_student_read_seconds histogram", body)
+        self.assertIn('scanner_student_read_seconds_count{cached="false"} 2', body)
+        self.assertIn('scanner_evaluation_seconds_bucket{mode="batch",model="gpt-5",le="+Inf"} 1', body)
+        self.assertIn('scanner_input_tokens_total{kind="student_exam",model="gpt-5-mini"} 2400', body)
+
+    async def test_metrics_are_rendered_from_running_totals(self):
+        job = await Job.objects.acreate()
+        for seconds in (0.1, 3):
+            metrics = JobMetrics()
+            metrics.observe("scanner_student_read_seconds", seconds, cached=False)
+            metrics.count("scanner_retries_total", model="gpt-5")
+            await metrics.save(job)
+        # Scrapes do not read the per-job rows.
+        await JobMetric.objects.all().adelete()
+
+        def render():
+            with self.assertNumQueries(1):
+                return render_metrics()
+
+        body = await sync_to_async(render)()
+        self.assertIn('scanner_student_read_seconds_bucket{cached="false",le="0.25"} 1', body)
+        self.assertIn('scanner_student_read_seconds_bucket{cached="false",le="5"} 2', body)
+        self.assertIn('scanner_student_read_seconds_bucket{cached="false",le="+Inf"} 2', body)
+        self.assertIn('scanner_student_read_seconds_sum{cached="false"} 3.1', body)
+        self.assertIn('scanner_retries_total{model="gpt-5"} 2', body)
+
+    @override_settings(OPENAI_RETRY_BASE_DELAY=0.01)
+    async def test_rate_limits_and_server_errors_are_retried(self):
+        responses = FakeResponses(errors=[
+            api_error(RateLimitError, 429, {"retry-after-ms": "10"}),
+            api_error(RateLimitError, 429, {"retry-after-ms": "10"}),
+            api_error(InternalServerError, 500),
+        ])
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            events = await self.upload(student_count=3)
+
+        names = [name for name, _ in events]
+        self.assertNotIn("error", names)
+        self.assertIn("evaluation_complete", names)
+        retries = [value async for value in JobMetric.objects.filter(name="scanner_retries_total").values_list("value", flat=True)]
+        self.assertEqual(len(retries), 3)
+
+    @override_settings(EVALUATION_MODE="per_student", EVALUATION_FORMAT="json", PRESCORE_LOCAL=False)
+    async def test_structured_evaluation_is_aggregated_and_rendered_locally(self):
+        evaluation = json.dumps({"students": [{
+            "student_name": "Ayşe",
+            "questions": [
+                {"question_number": 1, "score": 7, "rationale": "Eksik."},
+                {"question_number": 2, "score": 12, "rationale": "Tam."},
+            ],
+            "strengths": "Güçlü.",
+            "weaknesses": "Zayıf.",
+            "knowledge_gaps": "Boşluk.",
+        }]})
+        # Distinct answers: each student gets the same canned evaluation, not a cached verdict.
+        responses = FakeResponses(deltas=(evaluation[:40], evaluation[40:]), distinct_answers=True)
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            events = await self.upload(student_count=2)
+
+        self.assertIn("evaluation", {c["text"]["format"].get("name") for c in responses.calls})
+        chunks = [data["delta"] for name, data in events if name == "evaluation_chunk"]
+        self.assertFalse(any(chunk.startswith("{") for chunk in chunks))
+        completed = [data for name, data in events if name == "student_evaluation_complete"]
+        self.assertEqual(completed[0]["evaluation"]["questions"][1]["score"], 10)
+        self.assertIn("Soru 1: 10 üzerinden 7\nEksik.", completed[0]["full_text"])
+        self.assertIn("Genel Ortalama: 8.5/10", completed[0]["full_text"])
+        statistics = dict(events)["evaluation_complete"]["statistics"]
+        self.assertEqual((statistics["students"], statistics["mean"]), (2, 8.5))
+        self.assertEqual(statistics["questions"], {"1": 7, "2": 10})
+
+    @override_settings(EVALUATION_MODE="per_student", EVALUATION_FORMAT="json", PRESCORE_LOCAL=False)
+    async def test_concurrent_students_with_identical_answers_share_one_verdict(self):
+        evaluation = json.dumps({"students": [{
+            "student_name": "Öğrenci",
+            "questions": [{"question_number": 1, "score": 6, "rationale": "Kısmen."}],
+            "strengths": "-",
+            "weaknesses": "-",
+            "knowledge_gaps": "-",
+        }]})
+        # Reads finish in a different order than they started.
+        responses = FakeResponses(deltas=(evaluation,), delay_for=lambda kwargs: 0.01 * (len(responses.calls) % 3))
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            events = await self.upload(student_count=4)
+
+        evaluations = [c for c in responses.calls if c["text"]["format"].get("name") == "evaluation"]
+        self.assertEqual(len(evaluations), 1)
+        completed = [data["evaluation"] for name, data in events if name == "student_evaluation_complete"]
+        self.assertEqual([student["average"] for student in completed], [6, 6, 6, 6])
+        # The others wait on the verdict, or read it from the cache if they start after it landed.
+        sources = dict(events)["usage_summary"]["prescoring"]["sources"]
+        self.assertEqual((sources.pop("model"), sum(sources.values())), (1, 3))
+
+    @override_settings(EVALUATION_MODE="per_student", EVALUATION_FORMAT="json", PRESCORE_LOCAL=False)
+    async def test_answers_the_model_left_out_are_asked_again_for_waiting_students(self):
+        def evaluation(questions):
+            return (json.dumps({"students": [{
+                "student_name": "Öğrenci", "questions": questions, "strengths": "-", "weaknesses": "-", "knowledge_gaps": "-",
+            }]}),)
+
+        def evaluation_deltas(kwargs):
+            first = sum(call["text"]["format"].get("name") == "evaluation" for call in responses.calls) == 1
+            return evaluation([] if first else [{"question_number": 1, "score": 6, "rationale": "Kısmen."}])
+
+        responses = FakeResponses(evaluation_deltas=evaluation_deltas, delay=0.05)
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            events = await self.upload(student_count=2)
+
+        evaluations = [c for c in responses.calls if c["text"]["format"].get("name") == "evaluation"]
+        self.assertEqual(len(evaluations), 2)
+        completed = sorted(
+            (data["evaluation"]["questions"] for name, data in events if name == "student_evaluation_complete"), key=len
+        )
+        # The student that asked first got no verdict; the other one asked for itself.
+        self.assertEqual(completed, [[], [{"question_number": 1, "score": 6, "rationale": "Kısmen."}]])
+
+    @override_settings(EVALUATION_MODE="batch", EVALUATION_FORMAT="json", PRESCORE_LOCAL=False)
+    async def test_identical_answers_are_scored_once_across_students_and_uploads(self):
+        evaluation = json.dumps({"students": [{
+            "student_name": "Öğrenci 2",
+            "questions": [{"question_number": 1, "score": 8, "rationale": "Doğru."}],
+            "strengths": "Güçlü.",
+            "weaknesses": "Zayıf.",
+            "knowledge_gaps": "Boşluk.",
+        }]})
+        responses = FakeResponses(deltas=(evaluation,))
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            first = await self.upload(student_count=3)
+            second = await self.upload(student_count=2, student_offset=3)
+
+        evaluations = [c for c in responses.calls if c["text"]["format"].get("name") == "evaluation"]
+        # Every student answered "Cevap": one student is sent once, nothing the second time.
+        self.assertEqual(len(evaluations), 1)
+        self.assertEqual(len(evaluations[0]["input"]), 3)
+        students = dict(first)["evaluation_complete"]["evaluations"]
+        self.assertEqual([student["questions"][0]["score"] for student in students], [8, 8, 8])
+        self.assertEqual(dict(first)["usage_summary"]["prescoring"]["sources"], {"model": 1, "duplicate": 2})
+        report = dict(second)["usage_summary"]["prescoring"]
+        self.assertEqual((report["sources"], report["skipped_rate"]), ({"cache": 2}, 1.0))
+        self.assertIn("Genel Ortalama: 8/10", dict(second)["evaluation_complete"]["full_text"])
+        self.assertEqual(normalize_answer("  İstanbul'DA, IRMAK! "), "istanbul da ırmak")
+
+    @override_settings(EXTRACTION_FALLBACK_MODEL="gpt-5")
+    async def test_questions_are_sent_before_their_document_is_read(self):
+        answer_key = {"questions": [
+            {"question_number": number, "question": "Soru", "answer": "Cevap"} for number in (1, 2)
+        ]}
+        responses = FakeResponses(answer_key_output=lambda kwargs: json.dumps(answer_key))
+
+        class LoggingQueue(asyncio.Queue):
+            def put_nowait(self, item):
+                if isinstance(item, tuple) and item[0] == "question_extracted":
+                    responses.log.append(("question", item[1]["document"], item[1]["question"]["question_number"]))
+                super().put_nowait(item)
+
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)), \
+                mock.patch("scanner.pipeline.asyncio.Queue", LoggingQueue):
+            events = await self.upload(student_count=2)
+
+        # The first answer key question is sent while the model is still writing the second.
+        self.assertLess(
+            responses.log.index(("question", "answer_key", 1)), responses.log.index(("delta", "answer_key", True))
+        )
+
+        order = [(name, data.get("document"), data.get("student")) for name, data in events]
+        for document, student, complete in (("answer_key", None, "answer_key_complete"), ("student_exam", 1, "student_reading_complete")):
+            question = order.index(("question_extracted", document, student))
+            self.assertLess(question, next(i for i, (name, _, s) in enumerate(order) if name == complete and s == student))
+        questions = [data["question"] for name, data in events if name == "question_extracted"]
+        self.assertIn(ANSWER_KEY["questions"][0], questions)
+        self.assertEqual(await JobMetric.objects.filter(name="scanner_first_question_seconds").acount(), 3)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GradingJobTests(TestCase):
+    async def submit(self):
+        response = await self.async_client.post(
+            "/api/scans/upload/",
+            {"answer_key": pdf("Cevap Anahtarı.pdf"), "student_exams": [pdf("Öğrenci 0.pdf"), pdf("Öğrenci 1.pdf")]},
+        )
+        return response.json()
+
+    async def test_events_replay_after_last_event_id(self):
+        job = await self.submit()
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(FakeResponses())):
+            await run_job(await sync_to_async(claim_job)())
+
+        response = await self.async_client.get(job["events_url"])
+        events = parse_sse(b"".join([c async for c in response.streaming_content]), with_ids=True)
+        answer_key_id = next(event_id for event_id, name, _ in events if name == "answer_key_complete")
+
+        response = await self.async_client.get(job["events_url"], headers={"Last-Event-ID": str(answer_key_id)})
+        resumed = parse_sse(b"".join([c async for c in response.streaming_content]), with_ids=True)
+
+        self.assertEqual(resumed, [event for event in events if event[0] > answer_key_id])
+        self.assertEqual(resumed[-1][1], "done")
+
+        # Reconnecting after "done" ends the stream at once.
+        response = await self.async_client.get(job["events_url"], headers={"Last-Event-ID": str(events[-1][0])})
+
+        async def read_all():
+            return b"".join([c async for c in response.streaming_content])
+
+        self.assertEqual(parse_sse(await asyncio.wait_for(read_all(), 1), with_ids=True), [])
+
+    @override_settings(EVALUATION_MODE="per_student")
+    async def test_resumed_job_skips_completed_evaluations(self):
+        job = await self.submit()
+        await Stage.objects.acreate(
+            job_id=job["job_id"],
+            name=Stage.EVALUATION,
+            student=0,
+            status=Stage.COMPLETED,
+            result={"student": 0, "student_name": "Öğrenci 0", "full_text": "Önceden değerlendirildi"},
+        )
+        # Output the stopped attempt streamed for a student it did not finish.
+        stale = await JobEvent.objects.acreate(
+            job_id=job["job_id"], event="evaluation_chunk", data={"delta": "Yarım kalan", "student": 1}
+        )
+        await Job.objects.filter(pk=job["job_id"]).aupdate(attempts=1)
+        responses = FakeResponses()
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            await run_job(await sync_to_async(claim_job)())
+
+        self.assertEqual(len([call for call in responses.calls if call["prompt_cache_key"].startswith("evaluation")]), 1)
+        events = [(event.event, event.data) async for event in JobEvent.objects.filter(job_id=job["job_id"])]
+        evaluated = [data["student"] for name, data in events if name == "student_evaluation_complete"]
+        self.assertEqual(evaluated, [1])
+        self.assertIn("Önceden değerlendirildi", dict(events)["evaluation_complete"]["full_text"])
+        self.assertFalse(await JobEvent.objects.filter(pk=stale.pk).aexists())
+        self.assertEqual(dict(events)["stage_reset"]["stages"], [{"stage": "evaluation", "student": 1}])
+        chunks = [data["delta"] for name, data in events if name == "evaluation_chunk" and data.get("student") == 1]
+        self.assertNotIn("Yarım kalan", "".join(chunks))
+
+    async def test_jobs_with_stale_heartbeats_are_reclaimed(self):
+        job = await self.submit()
+        await Job.objects.filter(pk=job["job_id"]).aupdate(
+            status=Job.RUNNING, attempts=1, heartbeat_at=timezone.now() - timedelta(hours=1)
+        )
+
+        claimed = await sync_to_async(claim_job)()
+
+        self.assertEqual(claimed.pk, job["job_id"])
+        self.assertEqual(claimed.attempts, 2)
+        self.assertIsNone(await sync_to_async(claim_job)())
+
+
+class DeltaCoalescingTests(SimpleTestCase):
+    async def test_deltas_are_joined_per_student_before_they_are_stored(self):
+        async def events():
+            for token in ("Bir", " iki", " üç"):
+                yield "evaluation_chunk", {"delta": token, "student": 0}
+                yield "evaluation_chunk", {"delta": token.upper(), "student": 1}
+            yield "student_evaluation_complete", {"student": 0}
+            yield "evaluation_chunk", {"delta": "son", "student": 1}
+
+        coalesced = [event async for event in coalesce_deltas(events(), window=10, max_chars=1000)]
+
+        self.assertEqual(coalesced, [
+            ("evaluation_chunk", {"delta": "Bir iki üç", "student": 0}),
+            ("evaluation_chunk", {"delta": "BIR IKI ÜÇ", "student": 1}),
+            ("student_evaluation_complete", {"student": 0}),
+            ("evaluation_chunk", {"delta": "son", "student": 1}),
+        ])
+
+    async def test_deltas_are_stored_after_the_window_or_size_limit(self):
+        async def events():
+            yield "evaluation_chunk", {"delta": "a"}
+            await asyncio.sleep(0.05)
+            yield "evaluation_chunk", {"delta": "b"}
+            yield "evaluation_chunk", {"delta": "cd"}
+            yield "evaluation_chunk", {"delta": "e"}
+
+        coalesced = [event[1]["delta"] async for event in coalesce_deltas(events(), window=0.01, max_chars=3)]
+
+        self.assertEqual(coalesced, ["a", "bcd", "e"])
+
+
+class SharedClientTests(SimpleTestCase):
+    async def test_services_share_one_pooled_client(self):
+        outputs = {"answer_key": json.dumps(ANSWER_KEY), "student_exam": json.dumps(student_exam("Ali"))}
+        with MockOpenAIServer(outputs=outputs) as server, \
+                mock.patch.dict(os.environ, {"OPENAI_BASE_URL": server.base_url, "OPENAI_API_KEY": "test"}):
+            try:
+                read_answer_key_service = AsyncReadAnswerKeyService()
+                read_student_answers_service = AsyncReadStudentAnswersService()
+                self.assertIs(read_answer_key_service.client, read_student_answers_service.client)
+
+                await read_answer_key_service.read_answer_key(pdf("Cevap Anahtarı.pdf"))
+                await read_student_answers_service.read_student_answers(pdf("Öğrenci 0.pdf"))
+            finally:
+                await close_async_client()
+
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(server.connections, 1)
+
+
+class PdfUploadTests(SimpleTestCase):
+    size = 8 * 1024 * 1024
+
+    async def peak_memory(self, coroutine):
+        tracemalloc.start()
+        try:
+            await coroutine
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    async def test_default_mode_keeps_peak_memory_bounded(self):
+        exam = pdf("Öğrenci 0.pdf", os.urandom(self.size))
+        small = pdf("Öğrenci 1.pdf", os.urandom(100_000))
+
+        with MockOpenAIServer(output_text=json.dumps(ANSWER_KEY)) as server:
+            client = AsyncOpenAI(base_url=server.base_url, api_key="test")
+            service = AsyncReadAnswerKeyService(client)
+            await service.read_answer_key(exam)
+            peak = await self.peak_memory(service.read_answer_key(exam))
+            await service.read_answer_key(small)
+            await client.close()
+
+        # Large PDFs go through the Files API, small ones inline.
+        self.assertEqual(server.uploads, 2)
+        self.assertLess(peak, 1024 * 1024)
+
+    def test_data_url_is_encoded_in_chunks(self):
+        content = os.urandom(100_000)
+        expected = "data:application/pdf;base64," + base64.b64encode(content).decode()
+
+        self.assertEqual(pdf_data_url(pdf("a.pdf", content), chunk_size=1000), expected)
+
+
+class ChatContinueTests(TestCase):
+    async def test_concurrent_sse_clients_make_interleaved_progress(self):
+        responses = FakeResponses(delay=0.05, deltas=("a", "b", "c", "d"))
+        progress = []
+
+        async def client(name):
+            response = await self.async_client.post(
+                "/api/scans/upload/", {"response_id": "resp_previous", "message": name}
+            )
+            async for chunk in response.streaming_content:
+                if b"chat_chunk" in chunk:
+                    progress.append(name)
+
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            await asyncio.gather(client("first"), client("second"))
+
+        self.assertEqual(sorted(progress), ["first"] * 4 + ["second"] * 4)
+        # A blocking stream would deliver one client's chunks before the other's.
+        self.assertNotIn(progress, [["first"] * 4 + ["second"] * 4, ["second"] * 4 + ["first"] * 4])
+
+
+class ExtractionCacheTests(TestCase):
+    async def test_concurrent_identical_requests_share_one_extraction(self):
+        calls = []
+
+        async def extract(file):
+            calls.append(file.name)
+            await asyncio.sleep(0.05)
+            return ANSWER_KEY
+
+        cache = ExtractionCache()
+        results = await asyncio.gather(
+            cache.get_or_extract("answer_key", pdf("a.pdf", b"same"), extract),
+            cache.get_or_extract("answer_key", pdf("b.pdf", b"same"), extract),
+        )
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result for result, _ in results], [ANSWER_KEY, ANSWER_KEY])
+        self.assertEqual(sorted(cached for _, cached in results), [False, True])
+
+    async def test_least_recently_used_entries_are_evicted(self):
+        async def extract(file):
+            return {"questions": []}
+
+        cache = ExtractionCache(max_entries=2)
+        await cache.get_or_extract("answer_key", pdf("a.pdf", b"a"), extract)
+        await cache.get_or_extract("answer_key", pdf("b.pdf", b"b"), extract)
+        await cache.get_or_extract("answer_key", pdf("a.pdf", b"a"), extract)
+        await cache.get_or_extract("answer_key", pdf("c.pdf", b"c"), extract)
+
+        filenames = sorted([scan.filename async for scan in Scan.objects.all()])
+        self.assertEqual(filenames, ["a.pdf", "c.pdf"])
+
+
+class TextLayerTests(SimpleTestCase):
+    def sample(self, name, blank_pages=0):
+        writer = PdfWriter(clone_from=SAMPLES / name)
+        for _ in range(blank_pages):
+            writer.add_blank_page(width=595, height=842)
+        content = io.BytesIO()
+        writer.write(content)
+        return pdf(name, content.getvalue())
+
+    async def read(self, file):
+        client = FakeAsyncOpenAI(FakeResponses())
+        async with async_document_input(client, file, "Student_Exam.pdf") as (document, report):
+            attached = client.responses.pdf_content({"input": [{"content": document}]})
+        return document, report, [attached] if attached is not None else []
+
+    async def test_text_pdf_is_sent_as_text(self):
+        file = pdf("Öğrenci 1.pdf", (SAMPLES / "Öğrenci 1.pdf").read_bytes())
+        document, report, uploaded = await self.read(file)
+
+        self.assertEqual([part["type"] for part in document], ["input_text"])
+        self.assertIn("Page 3:", document[0]["text"])
+        self.assertEqual(uploaded, [])
+        self.assertEqual(report["path"], "text")
+        self.assertEqual(report["text_pages"], 3)
+        self.assertEqual(report["estimated_tokens_saved"], 3 * 1105)
+
+    async def test_only_scanned_pages_are_sent_as_pdf(self):
+        document, report, uploaded = await self.read(self.sample("Cevap Anahtarı.pdf", blank_pages=1))
+
+        self.assertEqual([part["type"] for part in document], ["input_text", "input_file"])
+        self.assertIn("Pages 3 are scanned", document[0]["text"])
+        self.assertEqual(len(PdfReader(io.BytesIO(uploaded[0])).pages), 1)
+        self.assertEqual((report["path"], report["pages"], report["text_pages"]), ("mixed", 3, 2))
+
+    async def test_unreadable_pdf_falls_back_to_the_file(self):
+        document, report, uploaded = await self.read(pdf("bozuk.pdf"))
+
+        self.assertEqual([part["type"] for part in document], ["input_file"])
+        self.assertEqual(uploaded, [b"%PDF-1.4 bozuk.pdf"])
+        self.assertEqual(report["path"], "pdf")
+
+    @override_settings(TEXT_LAYER_ENABLED=False)
+    async def test_fast_path_can_be_disabled(self):
+        file = pdf("Öğrenci 1.pdf", (SAMPLES / "Öğrenci 1.pdf").read_bytes())
+        document, report, _ = await self.read(file)
+
+        self.assertEqual([part["type"] for part in document], ["input_file"])
+        self.assertEqual(report["path"], "pdf")
+
+
+class ChunkedExtractionTests(SimpleTestCase):
+    def blank_pdf(self, pages):
+        writer = PdfWriter()
+        for _ in range(pages):
+            writer.add_blank_page(width=595, height=842)
+        content = io.BytesIO()
+        writer.write(content)
+        return pdf("Uzun Cevap Anahtarı.pdf", content.getvalue())
+
+    def test_page_windows_overlap_and_cover_every_page(self):
+        self.assertEqual(page_windows(12, 4, 1), [(1, 4), (4, 7), (7, 10), (10, 12)])
+        self.assertEqual(page_windows(3, 4, 1), [(1, 3)])
+
+    @override_settings(CHUNKED_EXTRACTION_MIN_PAGES=8, EXTRACTION_CHUNK_PAGES=4, EXTRACTION_CHUNK_OVERLAP=1)
+    async def test_long_documents_are_extracted_in_concurrent_windows(self):
+        responses = FakeResponses(delay=0.2)
+        reports = []
+        service = AsyncReadAnswerKeyService(FakeAsyncOpenAI(responses))
+
+        result = await service.read_answer_key(self.blank_pdf(12), report=reports.append)
+
+        self.assertEqual(result, ANSWER_KEY)
+        # All four windows are requested at once.
+        self.assertEqual(responses.max_in_flight, 4)
+        self.assertEqual(sorted(report["window"] for report in reports), [(1, 4), (4, 7), (7, 10), (10, 12)])
+        sent_pages = sorted(len(PdfReader(io.BytesIO(responses.pdf_content(call))).pages) for call in responses.calls)
+        self.assertEqual(sent_pages, [3, 4, 4, 4])
+
+    @override_settings(EXTRACTION_MODE="single")
+    async def test_single_mode_sends_the_whole_document(self):
+        responses = FakeResponses()
+        await AsyncReadAnswerKeyService(FakeAsyncOpenAI(responses)).read_answer_key(self.blank_pdf(12))
+
+        self.assertEqual(len(responses.calls), 1)
+
+    def test_windows_are_merged_by_question_number(self):
+        seam = "ve bu nedenle tarih bilinci toplumun hafızasıdır"
+        windows = [
+            {"student_name": "Ayşe Yılmaz", "questions": [
+                {"question_number": 2, "question": "İkinci soru", "student_answer": "Kısa"},
+                {"question_number": 1, "question": "Birinci soru", "student_answer": "Tam cevap"},
+                {"question_number": 3, "question": "Üçüncü soru", "student_answer": f"Başlangıç {seam}"},
+            ]},
+            {"student_name": "", "questions": [
+                {"question_number": 3, "question": "Üçüncü soru", "student_answer": f"{seam} ve devamı"},
+                {"question_number": 2, "question": "İkinci soru", "student_answer": "Kısa"},
+                {"question_number": 4, "question": "Dördüncü soru", "student_answer": "Son"},
+            ]},
+        ]
+
+        merged = merge_student_exam(windows)
+
+        self.assertEqual(merged["student_name"], "Ayşe Yılmaz")
+        self.assertEqual([q["question_number"] for q in merged["questions"]], [1, 2, 3, 4])
+        self.assertEqual(merged["questions"][1]["student_answer"], "Kısa")
+        self.assertEqual(merged["questions"][2]["student_answer"], f"Başlangıç {seam} ve devamı")
+
+
+class PromptCacheTests(SimpleTestCase):
+    def test_evaluation_requests_share_a_canonical_prefix(self):
+        reordered_key = {"questions": [{"answer": "Cevap", "question": "Soru", "question_number": 1}]}
+        first = evaluation_request([student_exam("Ayşe")], ANSWER_KEY)
+        second = evaluation_request([student_exam("Can")], reordered_key)
+
+        self.assertEqual(first["input"][:2], second["input"][:2])
+        self.assertEqual(first["prompt_cache_key"], second["prompt_cache_key"])
+        self.assertNotEqual(first["input"][2], second["input"][2])
+        self.assertEqual(json.loads(first["input"][1]["content"][0]["text"]), ANSWER_KEY)
+
+
+class MockOpenAIServerTests(SimpleTestCase):
+    async def test_streams_canned_output_as_deltas(self):
+        with MockOpenAIServer(outputs={"text": "Soru 1: 10 üzerinden 7"}, token_rate=1000) as server:
+            client = AsyncOpenAI(base_url=server.base_url, api_key="test")
+            stream = await client.responses.create(
+                model="gpt-5", input="Değerlendir", text={"format": {"type": "text"}}, stream=True
+            )
+            events = [event async for event in stream]
+            await client.close()
+
+        deltas = [event.delta for event in events if event.type == "response.output_text.delta"]
+        self.assertGreater(len(deltas), 1)
+        self.assertEqual("".join(deltas), "Soru 1: 10 üzerinden 7")
+        self.assertEqual(events[-1].type, "response.completed")
+        self.assertEqual(events[-1].response.usage.output_tokens, len(deltas))
+
+    async def test_injects_rate_limit_errors(self):
+        with MockOpenAIServer(faults={429: 1.0}) as server:
+            client = AsyncOpenAI(base_url=server.base_url, api_key="test", max_retries=1)
+            with self.assertRaises(RateLimitError):
+                await client.responses.create(model="gpt-5", input="Merhaba")
+            await client.close()
+
+        self.assertEqual((server.requests, server.failures), (2, 2))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UploadBenchmarkTests(TestCase):
+    async def test_benchmark_runs_offline_against_the_mock_server(self):
+        with MockOpenAIServer(outputs=MOCK_OUTPUTS, token_rate=2000) as server, mock.patch.dict(
+            os.environ, {"OPENAI_BASE_URL": server.base_url, "OPENAI_API_KEY": "test"}
+        ):
+            result = await benchmark_upload(students=3)
+
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(server.requests, 1 + 3 + 1)
+        self.assertGreater(result.events, 3)
+        self.assertLess(result.first_byte_s, result.wall_s)
+        self.assertGreater(result.peak_rss_mb, 0)
+
+
+class AdaptiveConcurrencyTests(SimpleTestCase):
+    async def test_limit_grows_additively_and_halves_once_per_round(self):
+        limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=10, backoff=0.5)
+        for _ in range(4):
+            limiter.on_success()
+        self.assertEqual(int(limiter.limit), 4)
+        limiter.on_success()
+        self.assertEqual(int(limiter.limit), 5)
+
+        first = await limiter.acquire()
+        second = await limiter.acquire()
+        limiter.on_overload(first)
+        limiter.on_overload(second)
+        self.assertEqual(int(limiter.limit), 2)
+        limiter.release()
+        limiter.release()
+        # A request started after the decrease can lower it again.
+        limiter.on_overload(await limiter.acquire())
+        self.assertEqual(int(limiter.limit), 1)
+
+    async def test_waiters_run_when_a_slot_frees(self):
+        limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1, backoff=0.5)
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiting.done())
+        limiter.release()
+        await asyncio.wait_for(waiting, 1)
+        self.assertEqual(limiter.in_flight, 1)
+
+    def test_retry_delay_follows_response_headers(self):
+        self.assertEqual(header_delay(httpx.Headers({"retry-after-ms": "250"})), 0.25)
+        self.assertEqual(header_delay(httpx.Headers({"retry-after": "3"})), 3)
+        headers = httpx.Headers({
+            "x-ratelimit-remaining-requests": "5",
+            "x-ratelimit-reset-requests": "1s",
+            "x-ratelimit-remaining-tokens": "0",
+            "x-ratelimit-reset-tokens": "6m0s",
+        })
+        self.assertEqual(header_delay(headers), 360)
+        self.assertIsNone(header_delay(httpx.Headers({})))
+
+    @override_settings(OPENAI_RETRY_BASE_DELAY=0.01)
+    async def test_large_class_survives_injected_rate_limits(self):
+        limiter = AdaptiveLimiter(initial=4, minimum=1, maximum=64, backoff=0.5)
+        with MockOpenAIServer(outputs=MOCK_OUTPUTS, faults={429: 0.3, 500: 0.05}) as server:
+            with mock.patch("scanner.services.retries.get_limiter", lambda: limiter):
+                client = AsyncOpenAI(base_url=server.base_url, api_key="test", max_retries=0)
+                service = AsyncReadAnswerKeyService(client)
+                results = await asyncio.gather(*(
+                    service.read_answer_key(pdf(f"Cevap {index}.pdf")) for index in range(40)
+                ))
+                await client.close()
+
+        self.assertEqual(len(results), 40)
+        self.assertGreater(server.failures, 0)
+
+
+class GradeBatchTests(TransactionTestCase):
+    # grade_batch runs its own event loop, whose database thread must see committed rows.
+    def setUp(self):
+        self.root = Path(tempfile.mkdtemp())
+        self.output = Path(tempfile.mkdtemp())
+        for folder in ("9-A", "9-B"):
+            (self.root / folder).mkdir()
+            for sample, name in (("Cevap Anahtarı.pdf", "Cevap Anahtarı"), ("Öğrenci 1.pdf", "Öğrenci 1"), ("Öğrenci 1.pdf", "Öğrenci 2")):
+                exam = exam_pdf(sample, f"{folder} {name}")
+                (self.root / folder / f"{name}.pdf").write_bytes(exam.read())
+
+    def grade(self, server):
+        with mock.patch.dict(os.environ, {"OPENAI_BASE_URL": server.base_url, "OPENAI_API_KEY": "test"}):
+            call_command("grade_batch", str(self.root), output=str(self.output), backend="local", stdout=io.StringIO())
+
+    def results(self):
+        with open(self.output / "results.jsonl", encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def test_grades_every_folder_and_resumes_without_repeating_requests(self):
+        with MockOpenAIServer(outputs=MOCK_OUTPUTS) as server:
+            self.grade(server)
+        self.assertEqual(server.requests, 6 + 4)
+        results = self.results()
+        self.assertEqual(len(results), 4)
+        self.assertEqual({row["folder"] for row in results}, {str(self.root / "9-A"), str(self.root / "9-B")})
+        self.assertEqual(results[0]["evaluation"], MOCK_OUTPUTS["text"])
+
+        with MockOpenAIServer(outputs=MOCK_OUTPUTS) as server:
+            self.grade(server)
+        self.assertEqual(server.requests, 0)
+
+        # Losing one result (e.g. a crash before it was written) costs exactly one request.
+        with open(self.output / "results.jsonl", "w", encoding="utf-8") as file:
+            file.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in results[1:])
+        with MockOpenAIServer(outputs=MOCK_OUTPUTS) as server:
+            self.grade(server)
+        self.assertEqual(server.requests, 1)
+        self.assertEqual(len(self.results()), 4)
+
+    def test_malformed_outputs_fail_their_request_without_blocking_the_run(self):
+        truncated = {**MOCK_OUTPUTS, "student_exam": MOCK_OUTPUTS["student_exam"][:20]}
+        with MockOpenAIServer(outputs=truncated) as server, self.assertRaisesMessage(CommandError, "4 requests failed"):
+            self.grade(server)
+        checkpoint = json.loads((self.output / "checkpoint.json").read_text())
+        self.assertTrue(all(batch["done"] for batch in checkpoint["batches"].values()))
+        self.assertEqual(Scan.objects.filter(kind="answer_key").count(), 2)
+
+        # Only the failed extractions are sent again, then the evaluations.
+        with MockOpenAIServer(outputs=MOCK_OUTPUTS) as server:
+            self.grade(server)
+        self.assertEqual(server.requests, 4 + 4)
+        self.assertEqual(len(self.results()), 4)
+        self.assertEqual(Scan.objects.filter(kind="student_exam").count(), 4)
+
+
+class StreamingExtractionTests(SimpleTestCase):
+    def test_questions_are_returned_as_soon_as_they_close(self):
+        exam = {
+            "student_name": "Ali \"questions\" [",
+            "questions": [
+                {"question_number": 1, "question": "{ } ] [ \\", "student_answer": "a"},
+                {"question_number": 2, "question": "Soru", "student_answer": "[\"b\"]"},
+            ],
+        }
+        text = json.dumps(exam, ensure_ascii=False)
+        parser = ArrayItemParser("questions")
+        seen = []
+        for index, char in enumerate(text):
+            for item in parser.feed(char):
+                seen.append((item, index))
+
+        self.assertEqual([item for item, _ in seen], exam["questions"])
+        # The first question is complete well before the end of the output.
+        self.assertLess(seen[0][1], len(text) - len(json.dumps(exam["questions"][1], ensure_ascii=False)))
+        self.assertEqual(json.loads(parser.text), exam)
+
+    def test_only_the_unfinished_item_is_buffered(self):
+        exam = {"student_name": "Ali", "questions": [
+            {"question_number": number, "question": "Soru", "student_answer": "Cevap " * 20} for number in range(1, 201)
+        ]}
+        text = json.dumps(exam, ensure_ascii=False)
+        parser = ArrayItemParser("questions")
+        items, longest = [], 0
+        for start in range(0, len(text), 7):
+            items += parser.feed(text[start:start + 7])
+            longest = max(longest, sum(len(chunk) for chunk in parser._chunks))
+
+        self.assertEqual(items, exam["questions"])
+        self.assertLess(longest, len(json.dumps(exam["questions"][-1], ensure_ascii=False)) + 7)
+        self.assertEqual(parser.text, text)
+
+    def test_other_arrays_are_ignored(self):
+        parser = ArrayItemParser("questions")
+        self.assertEqual(parser.feed('{"other": [{"a": 1}], "questions": [{"b": 2}]}'), [{"b": 2}])
+
+
+class SSEWriterTests(SimpleTestCase):
+    async def collect(self, events, **kwargs):
+        return [chunk async for chunk in sse_stream(events, **kwargs)]
+
+    async def test_deltas_are_coalesced_until_another_event(self):
+        async def events():
+            yield "evaluation_chunk", {"delta": "Soru", "student": 0}, 1
+            yield "evaluation_chunk", {"delta": "Soru 1", "student": 1}, 2
+            yield "evaluation_chunk", {"delta": " 1", "student": 0}, 3
+            yield "evaluation_chunk", {"delta": ": 10", "student": 0}, 4
+            yield "debug", {"event_type": "response.completed"}, 5
+            yield "student_evaluation_complete", {"student": 0}, 6
+
+        chunks = await self.collect(events(), writer=SSEWriter(window=1, max_bytes=1000, debug=False))
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(parse_sse(chunks[0]), [
+            ("evaluation_chunk", {"delta": "Soru 1: 10", "student": 0}),
+            ("evaluation_chunk", {"delta": "Soru 1", "student": 1}),
+            ("student_evaluation_complete", {"student": 0}),
+        ])
+        ids = [line for line in chunks[0].decode().splitlines() if line.startswith("id: ")]
+        self.assertEqual(ids, ["id: 4", "id: 6"])
+
+    async def test_deltas_are_sent_when_the_window_ends(self):
+        async def events():
+            yield "chat_chunk", {"delta": "Mer"}, None
+            yield "chat_chunk", {"delta": "haba"}, None
+            await asyncio.sleep(0.1)
+            yield "chat_chunk", {"delta": "!"}, None
+
+        chunks = await self.collect(events(), writer=SSEWriter(window=0.02, max_bytes=1000))
+        self.assertEqual([parse_sse(chunk)[0][1]["delta"] for chunk in chunks], ["Merhaba", "!"])
+
+    async def test_heartbeat_is_sent_while_idle(self):
+        async def events():
+            await asyncio.sleep(0.05)
+            yield "done", {"message": "Bitti"}, None
+
+        chunks = await self.collect(events(), heartbeat=0.01)
+        self.assertIn(HEARTBEAT, chunks)
+        self.assertEqual(parse_sse(chunks[-1]), [("done", {"message": "Bitti"})])
+
+
+class ConversationTests(TestCase):
+    CLASS_EVALUATION = (
+        "Ayşe Yılmaz:\n\nSoru 1: 10 üzerinden 7\nEksik.\n\nSoru 2: 10 üzerinden 9\nİyi.\n\n"
+        "Genel Ortalama: 8/10\n\nÖzet Rapor:\nGüçlü Yönler: Yorum.\n\n---\n\n"
+        "İsmail Can:\n\nSoru 1: 10 üzerinden 3\nYanlış.\n\nGenel Ortalama: 3/10"
+    )
+
+    def records(self):
+        answers = [
+            {"student_name": name, "questions": [
+                {"question_number": 1, "question": "Soru", "student_answer": f"{name} cevap 1"},
+                {"question_number": 2, "question": "Soru", "student_answer": f"{name} cevap 2"},
+            ]}
+            for name in ("İsmail Can", "Ayşe Yılmaz", "Mehmet Kaya")
+        ]
+        names = [answer["student_name"] for answer in answers]
+        return build_records(answers, split_class_evaluation(self.CLASS_EVALUATION, names))
+
+    def test_class_evaluation_is_split_into_compact_records(self):
+        records = self.records()
+        self.assertEqual(records[1]["questions"]["1"], {"answer": "Ayşe Yılmaz cevap 1", "score": 7, "rationale": "Eksik."})
+        self.assertEqual((records[1]["average"], records[0]["average"], records[2]["average"]), (8, 3, None))
+        self.assertTrue(records[1]["report"].startswith("Özet Rapor:"))
+        self.assertEqual(parse_report("Soru 3: 10 üzerinden 6,5\nOrta.")["questions"]["3"]["score"], 6.5)
+
+    def test_only_the_students_and_questions_asked_about_are_sent(self):
+        conversation = Conversation(answer_key=ANSWER_KEY, records=self.records())
+        context, focus = select_context(conversation, "ismail'in 1. sorusu neden düşük?")
+        self.assertEqual([record["name"] for record in context["students"]], ["İsmail Can"])
+        self.assertEqual(list(context["students"][0]["questions"]), ["1"])
+        self.assertEqual(context["answer_key"], ANSWER_KEY["questions"])
+
+        # A follow-up without a name stays on the same student.
+        conversation.focus = focus
+        context, _ = select_context(conversation, "Peki soru 2?")
+        self.assertEqual([(r["name"], list(r["questions"])) for r in context["students"]], [("İsmail Can", ["2"])])
+
+        context, _ = select_context(conversation, "Sınıfın genel durumu nasıl?")
+        self.assertEqual([row["scores"] for row in context["class"]][1], {"1": 7, "2": 9})
+        self.assertNotIn("students", context)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp(), CHAT_RECENT_TURNS=2, CHAT_SUMMARY_MAX_CHARS=200)
+    async def test_follow_up_turns_send_bounded_context(self):
+        responses = FakeResponses()
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            response = await self.async_client.post(
+                "/api/scans/upload/", {"answer_key": pdf("Cevap Anahtarı.pdf"), "student_exams": [pdf("Öğrenci 0.pdf"), pdf("Öğrenci 1.pdf")]}
+            )
+            job = response.json()
+            await run_job(await sync_to_async(claim_job)())
+            events = dict(await read_events(await self.async_client.get(job["events_url"])))
+            conversation_id = events["conversation"]["conversation_id"]
+
+            names = [record["name"] for record in (await Conversation.objects.aget(pk=conversation_id)).records]
+            for turn in range(5):
+                response = await self.async_client.post(
+                    "/api/scans/upload/", {"conversation_id": conversation_id, "message": f"{names[0]} soru 1 ({turn})"}
+                )
+                chat = dict(await read_events(response))
+                self.assertEqual(chat["chat_complete"]["full_text"], "Soru 1: 10 üzerinden 10")
+
+        calls = [call for call in responses.calls if call["prompt_cache_key"].startswith("conversation")]
+        self.assertEqual(len(calls), 5)
+        self.assertTrue(all(call["store"] is False and "previous_response_id" not in call for call in calls))
+        # prompt, answer key, summary, 2 turns, context, question
+        self.assertEqual([len(call["input"]) for call in calls], [4, 6, 8, 9, 9])
+        context = json.loads(calls[-1]["input"][-2]["content"][0]["text"])
+        self.assertEqual([record["name"] for record in context["students"]], names[:1])
+        conversation = await Conversation.objects.aget(pk=conversation_id)
+        self.assertEqual(len(conversation.turns), 2)
+        self.assertLessEqual(len(conversation.summary), 200)
+
+
+def sloppy_answer_key(kwargs):
+    """gpt-5-mini leaves an answer blank and numbers questions twice."""
+    if kwargs["model"] == "gpt-5-mini":
+        return json.dumps({"questions": [
+            {"question_number": 1, "question": "Soru", "answer": ""},
+            {"question_number": 1, "question": "Soru", "answer": "Cevap"},
+        ]})
+    return None
+
+
+class ModelRoutingTests(TestCase):
+    def test_extractions_are_validated(self):
+        schema = ANSWER_KEY_SCHEMA
+        validate_answer_key(ANSWER_KEY, schema)
+        for result, reason in (
+            ({"questions": []}, "no_questions"),
+            ({"questions": [{"question_number": "1", "question": "Soru", "answer": "Cevap"}]}, "schema"),
+            ({"questions": [{**ANSWER_KEY["questions"][0], "answer": " "}]}, "empty_question"),
+            ({"questions": [ANSWER_KEY["questions"][0], {**ANSWER_KEY["questions"][0], "question_number": 3}]}, "question_gap"),
+        ):
+            with self.assertRaises(InvalidExtraction) as raised:
+                validate_answer_key(result, schema)
+            self.assertEqual(raised.exception.reason, reason)
+
+        # Skipped questions are fine, questions the answer key does not have are not.
+        exam = {"student_name": "Ayşe", "questions": [{"question_number": 3, "question": "Soru", "student_answer": ""}]}
+        validate_student_exam(exam, STUDENT_EXAM_SCHEMA)
+        with self.assertRaises(InvalidExtraction):
+            validate_student_exam(exam, STUDENT_EXAM_SCHEMA, answer_key=ANSWER_KEY)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    async def test_rejected_extraction_is_escalated_to_the_fallback_model(self):
+        responses = FakeResponses(answer_key_output=sloppy_answer_key)
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            job = (await self.async_client.post(
+                "/api/scans/upload/", {"answer_key": pdf("Cevap Anahtarı.pdf"), "student_exams": [pdf("Öğrenci 0.pdf")]}
+            )).json()
+            await run_job(await sync_to_async(claim_job)())
+            event_list = await read_events(await self.async_client.get(job["events_url"]))
+            events = dict(event_list)
+
+        # The questions of the rejected reading were sent as read, then reset.
+        answer_key_events = [
+            (event, data.get("question")) for event, data in event_list
+            if event == "question_extracted" and data["document"] == "answer_key"
+            or event == "stage_reset" and data["stages"][0]["stage"] == "answer_key"
+        ]
+        reset = answer_key_events.index(("stage_reset", None))
+        self.assertEqual(len(answer_key_events[:reset]), 2)
+        self.assertEqual([question for _, question in answer_key_events[reset + 1:]], ANSWER_KEY["questions"])
+        calls = [(call["model"], call["text"]["format"].get("name"), call["text"]["verbosity"]) for call in responses.calls]
+        self.assertIn(("gpt-5-mini", "answer_key", "low"), calls)
+        self.assertIn(("gpt-5", "answer_key", "high"), calls)
+        self.assertIn(("gpt-5-mini", "student_exam", "low"), calls)
+        self.assertNotIn(("gpt-5", "student_exam", "high"), calls)
+        self.assertEqual(events["answer_key_complete"]["data"], ANSWER_KEY)
+        routing = events["usage_summary"]["routing"]
+        self.assertEqual((routing["answer_key"]["escalations"], routing["answer_key"]["escalation_rate"]), (1, 1.0))
+        self.assertEqual(set(routing["answer_key"]["models"]), {"gpt-5-mini", "gpt-5"})
+        self.assertEqual(routing["student_exam"]["escalation_rate"], 0.0)
+        escalations = await JobMetric.objects.filter(name="scanner_extraction_escalations_total").values_list("labels", flat=True).afirst()
+        self.assertEqual(escalations, 'kind="answer_key",model="gpt-5-mini",reason="question_order"')
+
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    async def test_student_exams_are_checked_against_an_answer_key_read_later(self):
+        # The answer key has no question 1, the students answer it; the key is read last.
+        responses = FakeResponses(
+            answer_key_output=lambda kwargs: json.dumps({"questions": [{"question_number": 2, "question": "Soru", "answer": "Cevap"}]}),
+            delay_for=lambda kwargs: 0.2 if kwargs["text"]["format"].get("name") == "answer_key" else 0,
+        )
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            await self.async_client.post(
+                "/api/scans/upload/", {"answer_key": pdf("Cevap Anahtarı.pdf"), "student_exams": [pdf("Öğrenci 0.pdf")]}
+            )
+            await run_job(await sync_to_async(claim_job)())
+
+        calls = [(call["model"], call["text"]["format"].get("name")) for call in responses.calls]
+        self.assertIn(("gpt-5", "student_exam"), calls)
+        escalations = await JobMetric.objects.filter(name="scanner_extraction_escalations_total").values_list("labels", flat=True).afirst()
+        self.assertEqual(escalations, 'kind="student_exam",model="gpt-5-mini",reason="unknown_question"')
+
+
+class PrescoringTests(TestCase):
+    ANSWER_KEY = {"questions": [
+        {"question_number": number, "question": "Soru", "answer": "Işık kırılması ışığın ortam değiştirirken yön değiştirmesidir."}
+        for number in range(1, 6)
+    ]}
+
+    async def test_blank_and_exact_answers_are_scored_without_the_model(self):
+        prescorer = Prescorer(self.ANSWER_KEY)
+        student = {"student_name": "Ayşe", "questions": [
+            {"question_number": 1, "question": "Soru", "student_answer": ""},
+            {"question_number": 2, "question": "Soru", "student_answer": "Bilmiyorum hocam."},
+            {"question_number": 3, "question": "Soru", "student_answer": "isik kirilmasi, isigin ortam degistirirken yon degistirmesidir"},
+            {"question_number": 4, "question": "Soru", "student_answer": "Işık kırılması ışığın hızlanmasıdır."},
+            {"question_number": 5, "question": "Soru", "student_answer": "Bilmiyorum ama yön değişir."},
+        ]}
+        known = await prescorer.known(student)
+
+        self.assertEqual({number: verdict["score"] for number, verdict in known.items()}, {1: 0, 2: 0, 3: 10})
+        self.assertEqual(prescorer.report(), {"answers": 3, "sources": {"blank": 2, "exact": 1}, "skipped_rate": 1.0})
+        self.assertLess(similarity("isik kirilmasi isigin hizlanmasidir", "isik kirilmasi isigin yon degistirmesidir"), 0.9)
+        with self.settings(PRESCORE_LOCAL=False):
+            self.assertEqual(await Prescorer(self.ANSWER_KEY).known(student), {})
+
+    async def test_short_answers_matching_the_key_are_not_taken_for_blanks(self):
+        answer_key = {"questions": [
+            {"question_number": 1, "question": "Tam sayı çözümü var mı?", "answer": "Yok"},
+            {"question_number": 2, "question": "Hangi şık doğru?", "answer": "B"},
+        ]}
+        student = {"student_name": "Can", "questions": [
+            {"question_number": 1, "question": "Soru", "student_answer": "yok."},
+            {"question_number": 2, "question": "Soru", "student_answer": "x"},
+        ]}
+        known = await Prescorer(answer_key).known(student)
+
+        self.assertEqual(known, {1: {"score": 10, "rationale": "Cevap, cevap anahtarıyla aynı."}})
+
+
+class ResultsTests(TestCase):
+    def exams(self, count, created_at=None):
+        created_at = created_at or timezone.now()
+        jobs = Job.objects.bulk_create([Job(status=Job.COMPLETED) for _ in range(count)])
+        return Exam.objects.bulk_create([
+            Exam(job=job, answer_key_hash="abc", answer_key=ANSWER_KEY, student_count=0, question_count=1, created_at=created_at)
+            for job in jobs
+        ])
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    async def test_finished_job_results_are_stored_as_rows(self):
+        responses = FakeResponses()
+        with mock.patch("scanner.services.openai.get_async_client", lambda: FakeAsyncOpenAI(responses)):
+            await self.async_client.post(
+                "/api/scans/upload/", {"answer_key": pdf("Cevap Anahtarı.pdf"), "student_exams": [pdf("Öğrenci 0.pdf"), pdf("Öğrenci 1.pdf")]}
+            )
+            job = await sync_to_async(claim_job)()
+            await run_job(job)
+            await run_job(job)
+
+        exam = await Exam.objects.aget(job=job)
+        self.assertEqual((exam.student_count, exam.question_count), (2, 1))
+        self.assertEqual(await Student.objects.acount(), 2)
+        question = await QuestionResult.objects.select_related("student").afirst()
+        self.assertEqual((question.question_number, question.answer), (1, "Cevap"))
+
+        listing = (await self.async_client.get("/api/scans/exams/")).json()
+        self.assertEqual([row["id"] for row in listing["results"]], [exam.pk])
+        detail = (await self.async_client.get(f"/api/scans/exams/{exam.pk}/")).json()
+        self.assertEqual([student["questions"][0]["answer"] for student in detail["students"]], ["Cevap", "Cevap"])
+        self.assertEqual((await self.async_client.get("/api/scans/exams/999/")).status_code, 404)
+
+    def test_listing_is_keyset_paginated(self):
+        older = self.exams(3, timezone.now() - timedelta(days=1))
+        # Same timestamp: the id decides the order.
+        newer = self.exams(4)
+        expected = [exam.pk for exam in sorted(older + newer, key=lambda exam: (exam.created_at, exam.pk), reverse=True)]
+
+        seen = []
+        cursor = None
+        while True:
+            with self.assertNumQueries(1):
+                page = self.client.get("/api/scans/exams/", {"limit": 3, **({"cursor": cursor} if cursor else {})}).json()
+            seen += [row["id"] for row in page["results"]]
+            cursor = page["next"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+        self.assertEqual(self.client.get("/api/scans/exams/", {"cursor": "bozuk"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/scans/exams/", {"answer_key_hash": "yok"}).json()["results"], [])
+
+    def test_unfiltered_student_pages_are_read_in_index_order(self):
+        plan = Student.objects.order_by("-created_at", "-pk")[:21].explain()
+        self.assertIn("student_created", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_students_are_found_by_name_prefix(self):
+        exam = self.exams(1)[0]
+        Student.objects.bulk_create([
+            Student(exam=exam, index=index, name=name, name_folded=fold(name), created_at=exam.created_at)
+            for index, name in enumerate(["İsmail Can", "Işıl Kaya", "Ayşe Yılmaz"])
+        ])
+        found = self.client.get("/api/scans/students/", {"name": "İSM"}).json()["results"]
+        self.assertEqual([student["name"] for student in found], ["İsmail Can"])
+        self.assertEqual(len(self.client.get("/api/scans/students/").json()["results"]), 3)
+
+        with self.assertNumQueries(3):
+            detail = self.client.get(f"/api/scans/exams/{exam.pk}/").json()
+        self.assertEqual([student["index"] for student in detail["students"]], [0, 1, 2])
+
+
+class BlobStorageTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.enterContext(override_settings(MEDIA_ROOT=self.media))
+
+    def upload(self, *names):
+        response = self.client.post(
+            "/api/scans/upload/", {"answer_key": pdf("Cevap Anahtarı.pdf"), "student_exams": [pdf(name) for name in names]}
+        )
+        return Job.objects.get(pk=response.json()["job_id"])
+
+    def stored_files(self):
+        return sorted(path.name for path in Path(self.media).rglob("*") if path.is_file())
+
+    def test_repeated_uploads_are_stored_once(self):
+        first = self.upload("Öğrenci 0.pdf", "Öğrenci 1.pdf")
+        # Larger than the memory limit: hashed by the temporary file handler instead.
+        with self.settings(FILE_UPLOAD_MAX_MEMORY_SIZE=10):
+            second = self.upload("Öğrenci 0.pdf")
+
+        content = "%PDF-1.4 Cevap Anahtarı.pdf".encode()
+        digest = hashlib.sha256(content).hexdigest()
+        names = {stage.file.name for stage in Stage.objects.filter(name=Stage.ANSWER_KEY)}
+        self.assertEqual(names, {f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.pdf"})
+        self.assertEqual(len(self.stored_files()), 3)
+        self.assertEqual(Blob.objects.get(digest=digest).refs, 2)
+        self.assertEqual(Stage.objects.get(job=second, name=Stage.ANSWER_KEY).file.read(), content)
+        self.assertEqual(Stage.objects.get(job=first, student=1).filename, "Öğrenci 1.pdf")
+
+    def test_unreferenced_files_are_collected(self):
+        first = self.upload("Öğrenci 0.pdf", "Öğrenci 1.pdf")
+        second = self.upload("Öğrenci 0.pdf")
+        stray = Path(self.media, "blobs", "00", "00", "yarım.part")
+        stray.parent.mkdir(parents=True)
+        stray.write_bytes(b"%PDF")
+
+        first.delete()
+        output = io.StringIO()
+        call_command("gc_blobs", "--grace", "0", stdout=output)
+        self.assertIn("Deleted 2 files", output.getvalue())
+        self.assertEqual(len(self.stored_files()), 2)
+        self.assertEqual(sorted(Blob.objects.values_list("refs", flat=True)), [1, 1])
+
+        second.delete()
+        call_command("gc_blobs", "--grace", "3600", stdout=io.StringIO())
+        self.assertEqual(len(self.stored_files()), 2)
+        call_command("gc_blobs", "--grace", "0", stdout=io.StringIO())
+        self.assertEqual((self.stored_files(), Blob.objects.count()), ([], 0))
+
+
+
+class ServingTests(TestCase):
+    async def lifespan(self, *messages):
+        received = asyncio.Queue()
+        for message in messages:
+            received.put_nowait({"type": message})
+        sent = []
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await application({"type": "lifespan", "asgi": {"version": "3.0"}}, received.get, send)
+        return sent
+
+    async def test_lifespan_opens_and_closes_shared_clients(self):
+        loop = asyncio.get_running_loop()
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            self.assertEqual(
+                await self.lifespan("lifespan.startup", "lifespan.shutdown"),
+                ["lifespan.startup.complete", "lifespan.shutdown.complete"],
+            )
+        self.assertNotIn(loop, clients._async_clients)
+
+    async def test_lifespan_startup_fails_on_a_bad_database(self):
+        with mock.patch("scanner.lifespan.check_databases", side_effect=OperationalError("unable to open database file")), \
+                self.assertLogs("scanner.lifespan", "ERROR"):
+            self.assertEqual(await self.lifespan("lifespan.startup"), ["lifespan.startup.failed"])
+
+    @override_settings(JOB_EVENT_POLL_INTERVAL=0.01)
+    async def test_streams_share_one_event_poll(self):
+        first, second = await Job.objects.acreate(), await Job.objects.acreate()
+        await JobEvent.objects.acreate(job=first, event="status", data={"number": 0})
+
+        async def read(job):
+            return [(event.event, event.data["number"]) async for event in follow_job_events(job.pk)]
+
+        readers = [asyncio.create_task(read(first)), asyncio.create_task(read(first)), asyncio.create_task(read(second))]
+        await asyncio.sleep(0.05)
+        hub = get_event_hub()
+        self.assertEqual(len(hub.queues[first.pk]), 2)
+        poll = hub.task
+        for number in (1, 2):
+            await JobEvent.objects.acreate(job=first, event="status", data={"number": number})
+        await JobEvent.objects.acreate(job=first, event="done", data={"number": 3})
+        await JobEvent.objects.acreate(job=second, event="done", data={"number": 0})
+
+        results = await asyncio.gather(*readers)
+        expected = [("status", 0), ("status", 1), ("status", 2), ("done", 3)]
+        self.assertEqual(results, [expected, expected, [("done", 0)]])
+        self.assertTrue(poll.cancelled() or poll.done())
+        self.assertIsNone(hub.task)
+
+    @override_settings(JOB_EVENT_POLL_INTERVAL=0.01)
+    async def test_event_poll_survives_a_failed_read_and_skips_other_jobs(self):
+        followed, other = await Job.objects.acreate(), await Job.objects.acreate()
+        hub = get_event_hub()
+        queue = await hub.subscribe(followed.pk)
+        original = JobEvent.objects.filter
+        queries = []
+
+        def failing_once(*args, **kwargs):
+            queries.append(kwargs)
+            if len(queries) == 1:
+                raise RuntimeError("unexpected")
+            return original(*args, **kwargs)
+
+        try:
+            with mock.patch.object(JobEvent.objects, "filter", failing_once), self.assertLogs("scanner.jobs", "ERROR"):
+                await JobEvent.objects.acreate(job=other, event="done", data={})
+                await JobEvent.objects.acreate(job=followed, event="done", data={})
+                events = await asyncio.wait_for(queue.get(), 1)
+        finally:
+            hub.unsubscribe(followed.pk, queue)
+
+        self.assertEqual([(event.job_id, event.event) for event in events], [(followed.pk, "done")])
+        self.assertEqual(queries[-1]["job_id__in"], [followed.pk])
+
+    @override_settings(SERVER_WORKERS=4, SERVER_KEEPALIVE_TIMEOUT=75, SERVER_LIMIT_CONCURRENCY=1000)
+    def test_serve_runs_uvicorn_with_the_server_settings(self):
+        with mock.patch("uvicorn.run") as run:
+            call_command("serve", "--port", "9000")
+
+        (app,), options = run.call_args
+        self.assertEqual(app, "backend.asgi:application")
+        self.assertEqual(options["port"], 9000)
+        self.assertEqual(options["workers"], 4)
+        self.assertEqual(options["lifespan"], "on")
+        self.assertEqual(options["timeout_keep_alive"], 75)
+        self.assertEqual(options["limit_concurrency"], 1000)
@@ -3,4 +3,8 @@ from . import views
 
 urlpatterns = [
     path('upload/', views.upload_scan, name='upload_scan'),
+    path('jobs/<int:job_id>/events/', views.job_events, name='job_events'),
+    path('exams/', views.exams, name='exams'),
+    path('exams/<int:exam_id>/', views.exam, name='exam'),
+    path('students/', views.students, name='students'),
 ]
\ No newline at end of file
@@ -1,92 +1,133 @@
-from django.http import StreamingHttpResponse
-from .services.openai import ReadAnswerKeyService, ReadStudentAnswersService, EvaluateStudentAnswersService, ContuniueChatService
-import json
+import time
+from dataclasses import asdict
 
-import asyncio
 from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from .conversations import fold, record_turn, select_context
+from .jobs import create_job, follow_job_events
+from .metrics import render_metrics
+from .models import Conversation, Exam, Job, Student
+from .results import exam_detail, exam_summary, keyset_page, page_size, student_summary
+from .services.openai import AsyncContuniueChatService, AsyncConversationChatService
+from .services.usage import CallUsage
+from .sse import sse_stream
 
 async def upload_scan(request):
+    conversation_id = request.POST.get('conversation_id')
     response_id = request.POST.get('response_id')
     message = request.POST.get('message')
     
+    if conversation_id and message:
+        conversation = await Conversation.objects.filter(pk=conversation_id).afirst()
+        if conversation is None:
+            return JsonResponse({'error': 'Konuşma bulunamadı'}, status=404)
+        return await handle_conversation(conversation, message)
     if response_id and message:
         return await handle_chat_continue(response_id, message)
     
     student_exams = request.FILES.getlist('student_exams')
     answer_key_file = request.FILES.get('answer_key')
 
+    if not answer_key_file or not student_exams:
+        return JsonResponse({'error': 'answer_key ve student_exams dosyaları gerekli'}, status=400)
+
+    job = await sync_to_async(create_job)(answer_key_file, student_exams)
+
+    return JsonResponse({
+        'job_id': job.pk,
+        'events_url': reverse('job_events', args=[job.pk])
+    }, status=202)
+
+async def exams(request):
+    queryset = Exam.objects.defer('answer_key')
+    if answer_key_hash := request.GET.get('answer_key_hash'):
+        queryset = queryset.filter(answer_key_hash=answer_key_hash)
+    try:
+        rows, next_cursor = await keyset_page(queryset, request.GET.get('cursor'), page_size(request.GET.get('limit')))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'results': [exam_summary(exam) for exam in rows], 'next': next_cursor})
+
+async def exam(request, exam_id: int):
+    exam = await Exam.objects.prefetch_related('students__questions').filter(pk=exam_id).afirst()
+    if exam is None:
+        return JsonResponse({'error': 'Sınav bulunamadı'}, status=404)
+    return JsonResponse(exam_detail(exam))
+
+async def students(request):
+    queryset = Student.objects.all()
+    if name := fold(request.GET.get('name', '').strip()):
+        # A range instead of LIKE, so the name index is used.
+        queryset = queryset.filter(name_folded__gte=name, name_folded__lt=name + '\U0010ffff')
+    try:
+        rows, next_cursor = await keyset_page(queryset, request.GET.get('cursor'), page_size(request.GET.get('limit')))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'results': [student_summary(student) for student in rows], 'next': next_cursor})
+
+async def metrics(request):
+    return HttpResponse(
+        await sync_to_async(render_metrics)(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+async def job_events(request, job_id: int):
+    if not await Job.objects.filter(pk=job_id).aexists():
+        return JsonResponse({'error': 'İş bulunamadı'}, status=404)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id') or 0
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+
+    async def event_generator():
+        async for event in follow_job_events(job_id, last_event_id):
+            yield event.event, event.data, event.pk
+
+    response = StreamingHttpResponse(
+        sse_stream(event_generator()),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+async def handle_conversation(conversation: Conversation, message: str):
     async def event_generator():
         try:
-            yield format_sse_event('status', {'stage': 'answer_key_reading', 'message': 'Cevap anahtarı okunuyor...'})
-            
-            read_answer_key_service = ReadAnswerKeyService()
-            answer_key = await sync_to_async(read_answer_key_service.read_answer_key)(answer_key_file)
-            
-            yield format_sse_event('answer_key_complete', {
-                'message': 'Cevap anahtarı okunması tamamlandı',
-                'data': answer_key
-            })
-            
-            yield format_sse_event('status', {'stage': 'student_reading', 'message': f'{len(student_exams)} öğrenci sınavı okunuyor...'})
-            
-            read_student_answers_service = ReadStudentAnswersService()
-            
-            async def read_one_student(exam):
-                return await sync_to_async(read_student_answers_service.read_student_answers)(exam)
-            
-            student_answers = await asyncio.gather(
-                *[read_one_student(exam) for exam in student_exams]
-            )
-            
-            yield format_sse_event('student_reading_complete', {
-                'message': 'Öğrenci sınavları okunması tamamlandı',
-                'count': len(student_answers),
-                'data': student_answers
-            })
-            
-            yield format_sse_event('status', {'stage': 'evaluation', 'message': 'Değerlendirme başlatılıyor...'})
-            
-            evaluate_student_answers_service = EvaluateStudentAnswersService()
-            response_stream = await sync_to_async(evaluate_student_answers_service.evaluate_student_answers)(student_answers, answer_key)
-            
-            full_text = ""
-            current_response_id = None
-            
-            for event in response_stream:
-                print(event)
-                if hasattr(event, 'type'):
-                    yield format_sse_event('debug', {
-                        'event_type': event.type,
-                        'has_delta': hasattr(event, 'delta')
-                    })
-                    
-                    if event.type == 'response.created' and hasattr(event, 'response'):
-                        current_response_id = event.response.id
-                        yield format_sse_event('response_id', {
-                            'response_id': current_response_id
-                        })
-                    elif event.type == 'response.output_text.delta':
-                        if hasattr(event, 'delta'):
-                            full_text += event.delta
-                            yield format_sse_event('evaluation_chunk', {
-                                'delta': event.delta
-                            })
-                    elif event.type == 'response.completed':
-                        break
-            
-            yield format_sse_event('evaluation_complete', {
-                'message': 'Değerlendirme tamamlandı',
+            yield 'status', {'stage': 'chat', 'message': 'Mesajınız işleniyor...'}, None
+
+            context, focus = select_context(conversation, message)
+            started = time.perf_counter()
+            response_stream = await AsyncConversationChatService().continue_conversation(conversation, message, context)
+
+            text_parts = []
+            usage = None
+            async for event in response_stream:
+                if event.type == 'response.output_text.delta':
+                    text_parts.append(event.delta)
+                    yield 'chat_chunk', {'delta': event.delta}, None
+                elif event.type == 'response.completed':
+                    usage = CallUsage.from_response('conversation', event.response, started)
+
+            full_text = ''.join(text_parts)
+            await record_turn(conversation, message, full_text, focus)
+            yield 'chat_complete', {
+                'message': 'Cevap tamamlandı',
                 'full_text': full_text,
-                'response_id': current_response_id
-            })
-            
-            yield format_sse_event('done', {'message': 'Tüm işlemler tamamlandı'})
-            
+                'conversation_id': conversation.pk,
+                'usage': asdict(usage) if usage else None,
+            }, None
+
+            yield 'done', {'message': 'Chat mesajı tamamlandı'}, None
+
         except Exception as e:
-            yield format_sse_event('error', {'message': f'Hata: {str(e)}'})
-    
+            yield 'error', {'message': f'Hata: {str(e)}'}, None
+
     response = StreamingHttpResponse(
-        event_generator(),
+        sse_stream(event_generator()),
         content_type='text/event-stream'
     )
     response['Cache-Control'] = 'no-cache'
@@ -96,48 +137,45 @@ async def upload_scan(request):
 async def handle_chat_continue(response_id: str, message: str):
     async def event_generator():
         try:
-            yield format_sse_event('status', {'stage': 'chat', 'message': 'Mesajınız işleniyor...'})
+            yield 'status', {'stage': 'chat', 'message': 'Mesajınız işleniyor...'}, None
             
-            continue_chat_service = ContuniueChatService()
-            response_stream = await sync_to_async(continue_chat_service.continue_chat)(response_id, message)
+            continue_chat_service = AsyncContuniueChatService()
+            response_stream = await continue_chat_service.continue_chat(response_id, message)
             
-            full_text = ""
+            text_parts = []
             current_response_id = None
             
-            for event in response_stream:
+            async for event in response_stream:
                 if hasattr(event, 'type'):
                     if event.type == 'response.created' and hasattr(event, 'response'):
                         current_response_id = event.response.id
-                        yield format_sse_event('response_id', {
+                        yield 'response_id', {
                             'response_id': current_response_id
-                        })
+                        }, None
                     elif event.type == 'response.output_text.delta':
                         if hasattr(event, 'delta'):
-                            full_text += event.delta
-                            yield format_sse_event('chat_chunk', {
+                            text_parts.append(event.delta)
+                            yield 'chat_chunk', {
                                 'delta': event.delta
-                            })
+                            }, None
                     elif event.type == 'response.completed':
                         break
             
-            yield format_sse_event('chat_complete', {
+            yield 'chat_complete', {
                 'message': 'Cevap tamamlandı',
-                'full_text': full_text,
+                'full_text': ''.join(text_parts),
                 'response_id': current_response_id
-            })
+            }, None
             
-            yield format_sse_event('done', {'message': 'Chat mesajı tamamlandı'})
+            yield 'done', {'message': 'Chat mesajı tamamlandı'}, None
             
         except Exception as e:
-            yield format_sse_event('error', {'message': f'Hata: {str(e)}'})
+            yield 'error', {'message': f'Hata: {str(e)}'}, None
     
     response = StreamingHttpResponse(
-        event_generator(),
+        sse_stream(event_generator()),
         content_type='text/event-stream'
     )
     response['Cache-Control'] = 'no-cache'
     response['X-Accel-Buffering'] = 'no'
     return response
-
-def format_sse_event(event_type: str, data: dict) -> str:
-    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
\ No newline at end of file
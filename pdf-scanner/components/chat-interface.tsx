@@ -10,7 +10,7 @@ import { Alert, AlertDescription } from "@/components/ui/alert";
 import { useSSE } from "@/hooks/use-sse";
 import { scanApi } from "@/lib/api-client";
 import { AlertCircle, RotateCcw } from "lucide-react";
-import type { ChatMessage, UploadedFiles, SSEEvent } from "@/types";
+import type { ChatMessage, UploadedFiles, SSEEvent, UploadJob } from "@/types";
 
 export function ChatInterface() {
   const [uploadedFiles, setUploadedFiles] = useState<UploadedFiles | null>(null);
@@ -20,6 +20,7 @@ export function ChatInterface() {
   const [error, setError] = useState<string | null>(null);
   const [currentEvaluationId, setCurrentEvaluationId] = useState<string | null>(null);
   const [responseId, setResponseId] = useState<string | null>(null);
+  const [conversationId, setConversationId] = useState<number | null>(null);
   
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const chatContainerRef = useRef<HTMLDivElement>(null);
@@ -38,6 +39,9 @@ export function ChatInterface() {
     if (event.data.response_id) {
       setResponseId(event.data.response_id);
     }
+    if (event.data.conversation_id) {
+      setConversationId(event.data.conversation_id);
+    }
     
     switch (event.event) {
       case "response_id":
@@ -70,13 +74,43 @@ export function ChatInterface() {
         setMessages(prev => [...prev, {
           id: `student-${Date.now()}-${Math.random()}`,
           type: "student_reading_complete",
-          content: `${event.data.count || 0} student exams read successfully`,
+          content: event.data.message || "Student exam read successfully",
           timestamp,
           data: event.data.data,
         }]);
         break;
         
+      case "stage_reset": {
+        // The worker restarted these stages: drop the text the stopped attempt streamed.
+        const reset = (event.data.stages || []).filter(stage => stage.stage === "evaluation");
+        const students = new Set(reset.map(stage => `eval-student-${stage.student}`));
+        const classEvaluation = reset.some(stage => stage.student === null);
+        setMessages(prev => prev.filter(msg =>
+          !students.has(msg.id) &&
+          !(classEvaluation && msg.isAccumulating && msg.id.startsWith("eval-") && !msg.id.startsWith("eval-student-"))
+        ));
+        break;
+      }
+
       case "evaluation_chunk":
+        if (event.data.student !== undefined) {
+          const studentMessageId = `eval-student-${event.data.student}`;
+          setMessages(prev => prev.some(msg => msg.id === studentMessageId)
+            ? prev.map(msg =>
+                msg.id === studentMessageId
+                  ? { ...msg, content: msg.content + (event.data.delta || "") }
+                  : msg
+              )
+            : [...prev, {
+                id: studentMessageId,
+                type: "evaluation_chunk",
+                content: event.data.delta || "",
+                timestamp,
+                isAccumulating: true,
+              }]
+          );
+          break;
+        }
         setMessages(prev => {
           const lastMessage = prev[prev.length - 1];
           
@@ -100,6 +134,14 @@ export function ChatInterface() {
         });
         break;
         
+      case "student_evaluation_complete":
+        setMessages(prev => prev.map(msg =>
+          msg.id === `eval-student-${event.data.student}`
+            ? { ...msg, type: "evaluation_complete", isAccumulating: false }
+            : msg
+        ));
+        break;
+        
       case "evaluation_complete":
         setMessages(prev => {
           const lastMessage = prev[prev.length - 1];
@@ -177,7 +219,7 @@ export function ChatInterface() {
     }
   };
 
-  const { connect, clearEvents } = useSSE({
+  const { connect, connectToJob, clearEvents } = useSSE({
     onEvent: handleSSEEvent,
     onComplete: () => {
       setIsUploading(false);
@@ -197,6 +239,7 @@ export function ChatInterface() {
     setMessages([]);
     setCurrentEvaluationId(null);
     setResponseId(null);
+    setConversationId(null);
     clearEvents();
 
     try {
@@ -206,8 +249,9 @@ export function ChatInterface() {
         throw new Error(`Upload failed: ${response.statusText}`);
       }
 
+      const job: UploadJob = await response.json();
       setUploadedFiles({ answerKey, studentExams });
-      connect(response);
+      connectToJob(scanApi.jobEventsUrl(job.events_url));
     } catch (err) {
       const message = err instanceof Error ? err.message : "Upload failed";
       setError(message);
@@ -217,8 +261,8 @@ export function ChatInterface() {
   };
 
   const handleSendMessage = async (message: string) => {
-    if (!responseId) {
-      setError("No response ID available");
+    if (!conversationId && !responseId) {
+      setError("No conversation available");
       return;
     }
 
@@ -234,7 +278,7 @@ export function ChatInterface() {
     }]);
 
     try {
-      const response = await scanApi.sendMessage(responseId, message);
+      const response = await scanApi.sendMessage({ conversationId, responseId }, message);
       
       if (!response.ok) {
         throw new Error(`Message send failed: ${response.statusText}`);
@@ -256,6 +300,7 @@ export function ChatInterface() {
     setIsStreaming(false);
     setCurrentEvaluationId(null);
     setResponseId(null);
+    setConversationId(null);
     clearEvents();
   };
 
@@ -313,8 +358,8 @@ export function ChatInterface() {
           
           <ChatInput 
             onSend={handleSendMessage} 
-            disabled={isStreaming || !responseId}
-            placeholder={!responseId ? "Upload files to start chatting..." : "Type your message..."}
+            disabled={isStreaming || (!conversationId && !responseId)}
+            placeholder={!conversationId && !responseId ? "Upload files to start chatting..." : "Type your message..."}
           />
         </div>
       </div>
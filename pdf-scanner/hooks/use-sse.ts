@@ -25,6 +25,41 @@ export function useSSE(options: UseSSEOptions = {}) {
   const eventSourceRef = useRef<EventSource | null>(null);
   const reconnectCountRef = useRef(0);
   const reconnectTimeoutRef = useRef<NodeJS.Timeout | undefined>(undefined);
+  const jobUrlRef = useRef<string | null>(null);
+  const lastEventIdRef = useRef<string | null>(null);
+  const abortControllerRef = useRef<AbortController | null>(null);
+
+  const reconnect = useCallback((error: Error) => {
+    const url = jobUrlRef.current;
+    if (!url || reconnectCountRef.current >= reconnectAttempts) {
+      setError(error);
+      setIsConnected(false);
+      onError?.(error);
+      return;
+    }
+
+    reconnectCountRef.current += 1;
+    const delay = reconnectDelay * 2 ** (reconnectCountRef.current - 1);
+    reconnectTimeoutRef.current = setTimeout(async () => {
+      const controller = new AbortController();
+      abortControllerRef.current = controller;
+      try {
+        const response = await fetch(url, {
+          headers: lastEventIdRef.current ? { "Last-Event-ID": lastEventIdRef.current } : {},
+          signal: controller.signal,
+        });
+        if (!response.ok) {
+          throw new Error(`Reconnect failed: ${response.statusText}`);
+        }
+        connectRef.current?.(response);
+      } catch (err) {
+        if (controller.signal.aborted) return;
+        reconnect(err instanceof Error ? err : new Error("Reconnect failed"));
+      }
+    }, delay);
+  }, [reconnectAttempts, reconnectDelay, onError]);
+
+  const connectRef = useRef<((response: Response) => void) | null>(null);
 
   const connect = useCallback((response: Response) => {
     if (!response.body) {
@@ -50,6 +85,10 @@ export function useSSE(options: UseSSEOptions = {}) {
           const { done, value } = await reader.read();
           
           if (done) {
+            if (jobUrlRef.current) {
+              reconnect(new Error("Stream closed before the job finished"));
+              break;
+            }
             setIsConnected(false);
             onComplete?.();
             break;
@@ -60,7 +99,9 @@ export function useSSE(options: UseSSEOptions = {}) {
           buffer = lines.pop() || "";
 
           for (const line of lines) {
-            if (line.startsWith("event: ")) {
+            if (line.startsWith("id: ")) {
+              lastEventIdRef.current = line.slice(4).trim();
+            } else if (line.startsWith("event: ")) {
               currentEvent = line.slice(7).trim();
             } else if (line.startsWith("data: ")) {
               try {
@@ -77,7 +118,8 @@ export function useSSE(options: UseSSEOptions = {}) {
                 setEvents((prev) => [...prev, sseEvent]);
                 onEvent?.(sseEvent);
                 
-                if (currentEvent === "done") {
+                if (currentEvent === "done" || (currentEvent === "error" && jobUrlRef.current)) {
+                  jobUrlRef.current = null;
                   setIsConnected(false);
                   onComplete?.();
                   return;
@@ -92,6 +134,10 @@ export function useSSE(options: UseSSEOptions = {}) {
         }
       } catch (err) {
         const error = err instanceof Error ? err : new Error("Stream processing error");
+        if (jobUrlRef.current) {
+          reconnect(error);
+          return;
+        }
         setError(error);
         setIsConnected(false);
         onError?.(error);
@@ -99,12 +145,37 @@ export function useSSE(options: UseSSEOptions = {}) {
     };
 
     processStream();
-  }, [onEvent, onComplete, onError]);
+  }, [onEvent, onComplete, onError, reconnect]);
+
+  connectRef.current = connect;
+
+  const connectToJob = useCallback(async (url: string) => {
+    jobUrlRef.current = url;
+    lastEventIdRef.current = null;
+    reconnectCountRef.current = 0;
+
+    const controller = new AbortController();
+    abortControllerRef.current = controller;
+    try {
+      const response = await fetch(url, { signal: controller.signal });
+      if (!response.ok) {
+        throw new Error(`Failed to open event stream: ${response.statusText}`);
+      }
+      connect(response);
+    } catch (err) {
+      if (controller.signal.aborted) return;
+      reconnect(err instanceof Error ? err : new Error("Failed to open event stream"));
+    }
+  }, [connect, reconnect]);
 
   const disconnect = useCallback(() => {
     if (reconnectTimeoutRef.current) {
       clearTimeout(reconnectTimeoutRef.current);
     }
+
+    jobUrlRef.current = null;
+    abortControllerRef.current?.abort();
+    abortControllerRef.current = null;
     
     if (eventSourceRef.current) {
       eventSourceRef.current.close();
@@ -130,6 +201,7 @@ export function useSSE(options: UseSSEOptions = {}) {
     isConnected,
     error,
     connect,
+    connectToJob,
     disconnect,
     clearEvents,
   };
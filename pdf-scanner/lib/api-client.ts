@@ -1,5 +1,13 @@
 import axios from "axios";
-import type { Scan, ApiResponse, PaginatedResponse } from "@/types";
+import type {
+  Scan,
+  ApiResponse,
+  PaginatedResponse,
+  CursorPage,
+  ExamSummary,
+  ExamDetail,
+  StudentSummary,
+} from "@/types";
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
@@ -35,9 +43,15 @@ export const scanApi = {
     });
   },
 
-  sendMessage: (responseId: string, message: string) => {
+  jobEventsUrl: (eventsUrl: string) => `${API_BASE_URL}${eventsUrl}`,
+
+  sendMessage: (chat: { conversationId?: number | null; responseId?: string | null }, message: string) => {
     const formData = new FormData();
-    formData.append("response_id", responseId);
+    if (chat.conversationId) {
+      formData.append("conversation_id", String(chat.conversationId));
+    } else if (chat.responseId) {
+      formData.append("response_id", chat.responseId);
+    }
     formData.append("message", message);
     
     return fetch(`${API_BASE_URL}/api/scans/upload/`, {
@@ -55,5 +69,24 @@ export const scanApi = {
     const response = await apiClient.get<ApiResponse<Scan>>(`/api/scans/${id}`);
     return response.data;
   },
+
+  getExams: async (params: { cursor?: string | null; limit?: number; answerKeyHash?: string } = {}) => {
+    const response = await apiClient.get<CursorPage<ExamSummary>>("/api/scans/exams/", {
+      params: { cursor: params.cursor || undefined, limit: params.limit, answer_key_hash: params.answerKeyHash },
+    });
+    return response.data;
+  },
+
+  getExam: async (id: number) => {
+    const response = await apiClient.get<ExamDetail>(`/api/scans/exams/${id}/`);
+    return response.data;
+  },
+
+  searchStudents: async (name: string, cursor?: string | null) => {
+    const response = await apiClient.get<CursorPage<StudentSummary>>("/api/scans/students/", {
+      params: { name, cursor: cursor || undefined },
+    });
+    return response.data;
+  },
 };
 
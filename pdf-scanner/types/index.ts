@@ -1,6 +1,6 @@
 export type ScanStatus = "pending" | "processing" | "completed" | "failed";
 
-export type EventType = "status" | "answer_key_complete" | "student_reading_complete" | "evaluation_chunk" | "evaluation_complete" | "response_id" | "chat_chunk" | "chat_complete" | "done" | "error";
+export type EventType = "status" | "answer_key_complete" | "student_reading_complete" | "question_extracted" | "stage_reset" | "input_report" | "evaluation_chunk" | "student_evaluation_complete" | "evaluation_complete" | "usage_summary" | "conversation" | "response_id" | "chat_chunk" | "chat_complete" | "done" | "error";
 
 export type ChatStage = "answer_key_reading" | "student_reading" | "evaluation" | "complete";
 
@@ -51,6 +51,13 @@ export interface SSEEvent {
     count?: number;
     full_text?: string;
     response_id?: string;
+    conversation_id?: number;
+    student?: number;
+    student_name?: string;
+    evaluation?: any;
+    evaluations?: any[];
+    statistics?: Record<string, any>;
+    stages?: { stage: string; student: number | null; window?: [number, number] | null }[];
   };
 }
 
@@ -64,6 +71,11 @@ export interface ChatMessage {
   isAccumulating?: boolean;
 }
 
+export interface UploadJob {
+  job_id: number;
+  events_url: string;
+}
+
 export interface UploadedFiles {
   answerKey: File;
   studentExams: File[];
@@ -83,3 +95,38 @@ export interface PaginatedResponse<T> {
   previous?: string | null;
 }
 
+export interface CursorPage<T> {
+  results: T[];
+  next: string | null;
+}
+
+export interface ExamSummary {
+  id: number;
+  job_id: number;
+  answer_key_hash: string;
+  student_count: number;
+  question_count: number;
+  average: number | null;
+  created_at: string;
+}
+
+export interface StudentSummary {
+  id: number;
+  exam_id: number;
+  index: number;
+  name: string;
+  average: number | null;
+  created_at: string;
+}
+
+export interface QuestionResult {
+  question_number: number;
+  answer: string;
+  score: number | null;
+  rationale: string;
+}
+
+export interface ExamDetail extends ExamSummary {
+  answer_key: { questions: Question[] };
+  students: (StudentSummary & { report: string; questions: QuestionResult[] })[];
+}